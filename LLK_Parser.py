@@ -1,180 +1,437 @@
+import sys
+from collections import deque
+from itertools import tee
+from operator import itemgetter
+from types import GeneratorType
+
 from parser_nodes import *
-from lexer import Lexer
+from lexer import Lexer, SymbolKind, SYMBOL_KIND_COUNT, SYMBOL_KINDS, SYMBOL_TYPE_KINDS, SYMBOL_TOKENS
+from runtime import parse_colour
+
+EOF_TOKEN = ('EOF', '')
+EOF_ENTRY = (EOF_TOKEN, SymbolKind.EOF)
+
+# Binding powers of the binary operators, loosest first. A cast ('as') binds looser than all of them.
+BINARY_BINDING_POWERS = {
+    'or': 1,
+    'and': 2,
+    '==': 3, '!=': 3,
+    '<': 4, '>': 4, '<=': 4, '>=': 4,
+    '+': 5, '-': 5,
+    '*': 6, '/': 6,
+}
+# The same table indexed by SymbolKind, 0 for tokens that are not binary operators
+BINARY_KIND_BINDING_POWERS = [0] * SYMBOL_KIND_COUNT
+for operator, binding_power in BINARY_BINDING_POWERS.items():
+    BINARY_KIND_BINDING_POWERS[SYMBOL_KINDS[('OPERATOR', operator)]] = binding_power
+UNARY_OPERATORS = ('-', 'not')
+UNARY_KINDS = frozenset({SymbolKind.MINUS, SymbolKind.NOT})
+SPECIAL_FUNCTION_KINDS = frozenset({SymbolKind.PRINT, SymbolKind.DELAY, SymbolKind.WRITE, SymbolKind.WRITE_BOX,
+                                    SymbolKind.RANDOM_INT, SymbolKind.WIDTH, SymbolKind.HEIGHT, SymbolKind.READ,
+                                    SymbolKind.RANDI})
+
+# Kinds of the entries on the explicit stack of Parser.parse_expression
+UNARY_FRAME, BINARY_FRAME, PAREN_FRAME, CALL_FRAME, SPECIAL_FRAME = range(5)
+
+def literal_node(token, start=None, end=None):
+    if token[1] in {"true", "false"}:
+        value = True if token[1] == "true" else False
+        return LiteralNode(value, start=start, end=end)
+    elif token[1].startswith("#"):
+        # Packed into its 0xRRGGBB int here, once, so no later stage has to parse it
+        return LiteralNode(parse_colour(token[1]), 'colour', start=start, end=end)
+    elif token[1].isdigit() or (token[1].replace('.', '', 1).isdigit() and token[1].count('.') < 2):
+        value = int(token[1]) if '.' not in token[1] else float(token[1])
+        return LiteralNode(value, start=start, end=end)
+    else:
+        raise SyntaxError(f"Unexpected literal {token[1]}")
 
 class Parser:
-    def __init__(self, tokens):
-        self.tokens = tokens
-        self.current_token_index = 0
-        self.current_token = self.tokens[self.current_token_index]
+    def __init__(self, tokens, kinds=None, recover=False, first_token_index=0):
+        # tokens may be a list or any iterator, e.g. Lexer.IterTokens. Only the tokens that have been
+        # peeked at are buffered, so a streamed program is never held in memory as a whole.
+        # kinds are the SymbolKinds of the tokens as produced by Lexer.GenerateTokens; without them they are
+        # looked up alongside the tokens. first_token_index is the index of the first token in the stream it
+        # was taken from, which node spans and error positions are counted from.
+        if kinds is None:
+            if isinstance(tokens, list):
+                kind_tokens = type_tokens = tokens
+            else:
+                tokens, kind_tokens, type_tokens = tee(tokens, 3)
+            kinds = map(SYMBOL_KINDS.get, kind_tokens, map(SYMBOL_TYPE_KINDS.__getitem__, map(itemgetter(0), type_tokens)))
+        self.tokens = zip(tokens, kinds)
+        # (token, kind) pairs after the current token that have been peeked at
+        self.lookahead = deque()
+        self.current_token_index = first_token_index
+        # current_kind is the integer SymbolKind of current_token, which is what the parser dispatches and
+        # matches on
+        self.current_token, self.current_kind = next(self.tokens, EOF_ENTRY)
+        # In recovery mode syntax errors are collected in errors instead of raised. Each one has the index of
+        # the offending token in token_index, and parsing carries on after the statement it occurred in.
+        self.recover = recover
+        self.errors = []
+        # Statement parsers keyed by the SymbolKind of the first token of the statement
+        self.statement_parsers = {
+            SymbolKind.FUN: self.parse_function_decl,
+            SymbolKind.LET: self.parse_variable_decl,
+            SymbolKind.RETURN: self.parse_return_statement,
+            SymbolKind.IF: self.parse_if_statement,
+            SymbolKind.FOR: self.parse_for_statement,
+            SymbolKind.WHILE: self.parse_while_statement,
+            SymbolKind.IDENTIFIER: self.parse_assignment,
+            SymbolKind.LEFT_BRACE: self.parse_block,
+            SymbolKind.PRINT: self.parse_print_statement,
+            SymbolKind.DELAY: self.parse_delay_statement,
+            SymbolKind.WRITE: self.parse_write_statement,
+            SymbolKind.WRITE_BOX: self.parse_write_statement,
+        }
+
+    def peek(self, offset=0):
+        if offset == 0:
+            return self.current_token
+        while len(self.lookahead) < offset:
+            self.lookahead.append(next(self.tokens, EOF_ENTRY))
+        return self.lookahead[offset - 1][0]
 
     def advance(self):
         self.current_token_index += 1
-        if self.current_token_index < len(self.tokens):
-            self.current_token = self.tokens[self.current_token_index]
+        if self.lookahead:
+            self.current_token, self.current_kind = self.lookahead.popleft()
         else:
-            self.current_token = ('EOF', '')
+            self.current_token, self.current_kind = next(self.tokens, EOF_ENTRY)
 
     def parse(self):
         return self.parse_program()
 
     def parse_program(self):
         statements = []
-        while self.current_token[0] != 'EOF':
+        while self.current_kind != SymbolKind.EOF:
+            if self.recover and self.current_kind == SymbolKind.RIGHT_BRACE:
+                # A '}' that closes nothing would otherwise stop recovery from making progress
+                self.report(SyntaxError(f"Unexpected token {self.current_token}"))
+                self.advance()
+                continue
             statements.append(self.parse_statement())
         return ProgramNode(statements)
 
     def parse_statement(self):
-        if self.current_token[0] == 'KEYWORD':
-            if self.current_token[1] == 'fun':
-                return self.parse_function_decl()
-            elif self.current_token[1] == 'let':
-                return self.parse_variable_decl()
-            elif self.current_token[1] == 'return':
-                return self.parse_return_statement()
-            elif self.current_token[1] == 'if':
-                return self.parse_if_statement()
-            elif self.current_token[1] == 'for':
-                return self.parse_for_statement()
-            elif self.current_token[1] == 'while':
-                return self.parse_while_statement()
+        # Statements that contain blocks are parsed by generators that yield whenever they need a block. The
+        # blocks are parsed here, with an explicit stack of the statements waiting on them, so that blocks can
+        # nest as deeply as memory allows rather than as deeply as the recursion limit allows.
+        # A frame is [statement generator, first token index, declared, statements of the open block, index of
+        # the block's '{']
+        stack = []
+        node = self.start_statement(stack)
+        while stack:
+            frame = stack[-1]
+            if node is not None:
+                frame[3].append(node)
+            if self.current_kind == SymbolKind.RIGHT_BRACE:
+                self.advance()
+            elif self.recover and self.current_kind == SymbolKind.EOF:
+                self.report(SyntaxError(f"Expected token DELIMITER with value }}, but got {self.current_token}"))
             else:
-                raise SyntaxError(f"Unexpected keyword {self.current_token[1]}")
-        elif self.current_token[0] == 'IDENTIFIER':
-            return self.parse_assignment()
-        elif self.current_token[0] == 'DELIMITER' and self.current_token[1] == '{':
-            return self.parse_block()
-        elif self.current_token[0] == 'SPECIAL_FUNCTION':
-            if self.current_token[1] == '__print':
-                return self.parse_print_statement()
-            elif self.current_token[1] == '__delay':
-                return self.parse_delay_statement()
-            elif self.current_token[1] == '__write' or self.current_token[1] == '__write_box':
-                return self.parse_write_statement()
-        else:
-            raise SyntaxError(f"Unexpected token {self.current_token}")
+                node = self.start_statement(stack)
+                continue
+            stack.pop()
+            block = BlockNode(frame[3], frame[4], self.current_token_index)
+            node = self.resume_statement(stack, frame, block)
+        return node
+
+    def start_statement(self, stack):
+        # The name a failed 'let' would have declared, so the analyzer does not report every later use of it
+        declared = self.peek(1) if self.recover and self.current_kind == SymbolKind.LET else None
+        frame = [None, self.current_token_index, declared, None, None]
+        try:
+            parse = self.statement_parsers.get(self.current_kind)
+            if parse is None:
+                if self.current_token[0] == 'KEYWORD':
+                    raise SyntaxError(f"Unexpected keyword {self.current_token[1]}")
+                raise SyntaxError(f"Unexpected token {self.current_token}")
+            node = parse()
+        except SyntaxError as e:
+            if not self.recover:
+                raise
+            return self.fail_statement(frame, e)
+        if type(node) is not GeneratorType:
+            return self.finish_statement(frame, node)
+        frame[0] = node
+        return self.resume_statement(stack, frame, None)
+
+    def resume_statement(self, stack, frame, block):
+        # Runs a statement's generator on to the next block it needs, which is then opened on the stack, or to
+        # the end of the statement, which is returned
+        try:
+            try:
+                frame[0].send(block)
+            except StopIteration as stop:
+                return self.finish_statement(frame, stop.value)
+            frame[4] = self.current_token_index
+            self.expect(SymbolKind.LEFT_BRACE)
+        except SyntaxError as e:
+            if not self.recover:
+                raise
+            return self.fail_statement(frame, e)
+        frame[3] = []
+        stack.append(frame)
+        return None
+
+    def finish_statement(self, frame, node):
+        node.start = frame[1]
+        node.end = self.current_token_index
+        return node
+
+    def fail_statement(self, frame, error):
+        self.report(error)
+        declared = frame[2]
+        node = ErrorNode(str(error), declared[1] if declared and declared[0] == 'IDENTIFIER' else None)
+        self.synchronise()
+        return self.finish_statement(frame, node)
+
+    def report(self, error):
+        error.token_index = self.current_token_index
+        self.errors.append(error)
+
+    def synchronise(self):
+        # Panic mode: skip to just after the next ';', or up to the '}' that closes the enclosing block.
+        # Braces opened while skipping are skipped along with their contents.
+        depth = 0
+        while self.current_kind != SymbolKind.EOF:
+            if self.current_kind == SymbolKind.LEFT_BRACE:
+                depth += 1
+            elif self.current_kind == SymbolKind.RIGHT_BRACE:
+                if depth == 0:
+                    return
+                depth -= 1
+                if depth == 0:
+                    self.advance()
+                    return
+            elif self.current_kind == SymbolKind.SEMICOLON and depth == 0:
+                self.advance()
+                return
+            self.advance()
 
     def parse_function_decl(self):
         self.advance()  # skip 'fun'
-        identifier = self.current_token[1]
+        identifier = sys.intern(self.current_token[1])
         self.advance()  # skip identifier
-        self.expect('DELIMITER', '(')
+        self.expect(SymbolKind.LEFT_PAREN)
         params = self.parse_formal_params()
-        self.expect('DELIMITER', ')')
-        self.expect('ARROW', '->')
-        return_type = self.current_token[1]
+        self.expect(SymbolKind.RIGHT_PAREN)
+        self.expect(SymbolKind.ARROW)
+        return_type = sys.intern(self.current_token[1])
         self.advance()  # skip return type
-        block = self.parse_block()
+        block = yield
         return FunctionDeclNode(identifier, params, return_type, block)
 
     def parse_formal_params(self):
         params = []
-        if self.current_token[0] != 'DELIMITER' or self.current_token[1] != ')':
+        if self.current_kind != SymbolKind.RIGHT_PAREN:
             params.append(self.parse_param())
-            while self.current_token[0] == 'DELIMITER' and self.current_token[1] == ',':
+            while self.current_kind == SymbolKind.COMMA:
                 self.advance()  # skip ','
                 params.append(self.parse_param())
         return params
 
     def parse_param(self):
-        identifier = self.current_token[1]
+        start = self.current_token_index
+        identifier = sys.intern(self.current_token[1])
         self.advance()  # skip identifier
-        self.expect('DELIMITER', ':')
-        param_type = self.current_token[1]
+        self.expect(SymbolKind.COLON)
+        param_type = sys.intern(self.current_token[1])
         self.advance()  # skip type
-        return ParamNode(identifier, param_type)
+        return ParamNode(identifier, param_type, start=start, end=self.current_token_index)
 
     def parse_block(self):
-        self.expect('DELIMITER', '{')
-        statements = []
-        while self.current_token[0] != 'DELIMITER' or self.current_token[1] != '}':
-            statements.append(self.parse_statement())
-        self.expect('DELIMITER', '}')
-        return BlockNode(statements)
+        # A bare block statement; parse_statement opens the block and sends it back once it is closed
+        block = yield
+        return block
 
     def parse_variable_decl(self, expect_semicolon=True):
+        # Declarations and assignments set their own spans, as the ones in a for loop header are not statements
+        start = self.current_token_index
         self.advance()  # skip 'let'
-        identifier = self.current_token[1]
+        identifier = sys.intern(self.current_token[1])
         self.advance()  # skip identifier
-        self.expect('DELIMITER', ':')
-        var_type = self.current_token[1]
+        self.expect(SymbolKind.COLON)
+        var_type = sys.intern(self.current_token[1])
         self.advance()  # skip type
         expr = None
-        if self.current_token[0] == 'OPERATOR' and self.current_token[1] == '=':
+        if self.current_kind == SymbolKind.ASSIGN:
             self.advance()  # skip '='
             expr = self.parse_expression()
         if expect_semicolon:
-            self.expect('DELIMITER', ';')
-        return VariableDeclNode(identifier, var_type, expr)
+            self.expect(SymbolKind.SEMICOLON)
+        return VariableDeclNode(identifier, var_type, expr, start=start, end=self.current_token_index)
 
     def parse_assignment(self, expect_semicolon=True):
-        identifier = self.current_token[1]
+        start = self.current_token_index
+        identifier = sys.intern(self.current_token[1])
         self.advance()  # skip identifier
-        self.expect('OPERATOR', '=')
+        self.expect(SymbolKind.ASSIGN)
         expr = self.parse_expression()
         if expect_semicolon:
-            self.expect('DELIMITER', ';')
-        return AssignmentNode(identifier, expr)
+            self.expect(SymbolKind.SEMICOLON)
+        return AssignmentNode(identifier, expr, start=start, end=self.current_token_index)
 
     def parse_return_statement(self):
         self.advance()  # skip 'return'
         expr = self.parse_expression()
-        self.expect('DELIMITER', ';')
+        self.expect(SymbolKind.SEMICOLON)
         return ReturnStatementNode(expr)
 
     def parse_if_statement(self):
         self.advance()  # skip 'if'
-        self.expect('DELIMITER', '(')
+        self.expect(SymbolKind.LEFT_PAREN)
         condition = self.parse_expression()
-        self.expect('DELIMITER', ')')
-        if_block = self.parse_block()
-        if self.current_token[0] == 'KEYWORD' and self.current_token[1] == 'else':
+        self.expect(SymbolKind.RIGHT_PAREN)
+        if_block = yield
+        if self.current_kind == SymbolKind.ELSE:
             self.advance()  # skip 'else'
-            else_block = self.parse_block()
+            else_block = yield
             return IfStatementNode(condition, if_block, else_block)
         return IfStatementNode(condition, if_block)
 
     def parse_for_statement(self):
         self.advance()  # skip 'for'
-        self.expect('DELIMITER', '(')
-        init = self.parse_variable_decl(expect_semicolon=False) if self.current_token[0] == 'KEYWORD' and self.current_token[1] == 'let' else self.parse_assignment(expect_semicolon=False)
-        self.expect('DELIMITER', ';')
+        self.expect(SymbolKind.LEFT_PAREN)
+        init = self.parse_variable_decl(expect_semicolon=False) if self.current_kind == SymbolKind.LET else self.parse_assignment(expect_semicolon=False)
+        self.expect(SymbolKind.SEMICOLON)
         condition = self.parse_expression()
-        self.expect('DELIMITER', ';')
+        self.expect(SymbolKind.SEMICOLON)
         post = self.parse_assignment(expect_semicolon=False)
-        self.expect('DELIMITER', ')')
-        block = self.parse_block()
+        self.expect(SymbolKind.RIGHT_PAREN)
+        block = yield
         return ForStatementNode(init, condition, post, block)
 
     def parse_while_statement(self):
         self.advance()  # skip 'while'
-        self.expect('DELIMITER', '(')
+        self.expect(SymbolKind.LEFT_PAREN)
         condition = self.parse_expression()
-        self.expect('DELIMITER', ')')
-        block = self.parse_block()
+        self.expect(SymbolKind.RIGHT_PAREN)
+        block = yield
         return WhileStatementNode(condition, block)
 
     def parse_print_statement(self):
         self.advance()  # skip '__print'
         expr = self.parse_expression()
-        self.expect('DELIMITER', ';')
+        self.expect(SymbolKind.SEMICOLON)
         return PrintStatementNode(expr)
 
     def parse_delay_statement(self):
         self.advance()  # skip '__delay'
         expr = self.parse_expression()
-        self.expect('DELIMITER', ';')
+        self.expect(SymbolKind.SEMICOLON)
         return DelayStatementNode(expr)
 
     def parse_write_statement(self):
         self.advance()  # skip '__write' or '__write_box'
         args = []
-        while self.current_token[0] != 'DELIMITER' or self.current_token[1] != ';':
+        while self.current_kind != SymbolKind.SEMICOLON:
             args.append(self.parse_expression())
-            if self.current_token[0] == 'DELIMITER' and self.current_token[1] == ',':
+            if self.current_kind == SymbolKind.COMMA:
                 self.advance()  # skip ','
-        self.expect('DELIMITER', ';')
+        self.expect(SymbolKind.SEMICOLON)
         return WriteStatementNode(args)
 
+    def parse_expression(self):
+        # Precedence climbing with an explicit stack instead of recursion. The stack holds the prefix operators
+        # and the left operands of binary operators that are still waiting for their right operand, and the
+        # parentheses and argument lists the expression is nested in, so nesting is only limited by memory.
+        # start is the first token of the operand being built, including any parentheses around it.
+        stack = []
+        binding_powers = BINARY_KIND_BINDING_POWERS
+        intern = sys.intern
+        while True:
+            # An operand: any prefix operators and then a primary expression
+            while self.current_kind in UNARY_KINDS:
+                stack.append((UNARY_FRAME, intern(self.current_token[1]), self.current_token_index))
+                self.advance()
+            token = self.current_token
+            kind = self.current_kind
+            start = self.current_token_index
+            if kind == SymbolKind.LITERAL:
+                self.advance()
+                node = literal_node(token, start, self.current_token_index)
+            elif kind == SymbolKind.IDENTIFIER:
+                self.advance()
+                if self.current_kind != SymbolKind.LEFT_PAREN:
+                    node = IdentifierNode(intern(token[1]), start=start, end=self.current_token_index)
+                else:
+                    self.advance()  # skip '('
+                    if self.current_kind != SymbolKind.RIGHT_PAREN:
+                        stack.append((CALL_FRAME, intern(token[1]), [], start))
+                        continue
+                    self.advance()  # skip ')'
+                    node = FunctionCallNode(intern(token[1]), [], start=start, end=self.current_token_index)
+            elif kind == SymbolKind.LEFT_PAREN:
+                self.advance()
+                stack.append((PAREN_FRAME, start))
+                continue
+            elif kind in SPECIAL_FUNCTION_KINDS:
+                self.advance()
+                if self.current_kind != SymbolKind.SEMICOLON:
+                    stack.append((SPECIAL_FRAME, intern(token[1]), [], start))
+                    continue
+                node = FunctionCallNode(intern(token[1]), [], start=start, end=self.current_token_index)
+            else:
+                raise SyntaxError(f"Unexpected token in expression: {token}")
+
+            # Reduce the stack with the finished operand until it is the left operand of the next binary
+            # operator, or the next argument list element is due
+            while True:
+                end = self.current_token_index
+                # Prefix operators bind tighter than any binary operator
+                while stack and stack[-1][0] == UNARY_FRAME:
+                    _, operator, start = stack.pop()
+                    node = UnaryOpNode(operator, node, start=start, end=end)
+                # Every binary operator is left associative
+                binding_power = binding_powers[self.current_kind]
+                while stack and stack[-1][0] == BINARY_FRAME and binding_power <= stack[-1][3]:
+                    _, left, operator, _, start = stack.pop()
+                    node = BinaryOpNode(left, operator, node, start=start, end=end)
+                if binding_power:
+                    stack.append((BINARY_FRAME, node, intern(self.current_token[1]), binding_power, start))
+                    self.advance()
+                    break
+                # 'as' binds loosest of all and only ever applies to a whole expression, so nothing but further
+                # casts may follow it
+                while self.current_kind == SymbolKind.AS:
+                    self.advance()  # skip 'as'
+                    target_type = intern(self.current_token[1])
+                    self.advance()  # skip type
+                    node = CastNode(node, target_type, start=start, end=self.current_token_index)
+                if not stack:
+                    return node
+                frame = stack.pop()
+                if frame[0] == PAREN_FRAME:
+                    self.expect(SymbolKind.RIGHT_PAREN)
+                    start = frame[1]
+                    continue
+                args = frame[2]
+                args.append(node)
+                if self.current_kind == SymbolKind.COMMA:
+                    self.advance()  # skip ','
+                if frame[0] == CALL_FRAME:
+                    if self.current_kind != SymbolKind.RIGHT_PAREN:
+                        stack.append(frame)
+                        break
+                    self.advance()  # skip ')'
+                elif self.current_kind != SymbolKind.SEMICOLON:
+                    stack.append(frame)
+                    break
+                start = frame[3]
+                node = FunctionCallNode(frame[1], args, start=start, end=self.current_token_index)
+
+    def expect(self, kind):
+        if self.current_kind != kind:
+            token_type, value = SYMBOL_TOKENS[kind]
+            raise SyntaxError(f"Expected token {token_type} with value {value}, but got {self.current_token}")
+        self.advance()
+
+class DescentParser(Parser):
+    # The original recursive one-function-per-precedence-level expression grammar. Kept as the reference that
+    # the explicit stack precedence climbing in Parser is checked and benchmarked against.
     def parse_expression(self):
         return self.parse_cast()
 
@@ -242,7 +499,7 @@ class Parser:
         return left
 
     def parse_unary(self):
-        if self.current_token[0] == 'OPERATOR' and self.current_token[1] in ('-', 'not'):
+        if self.current_kind in UNARY_KINDS:
             operator = self.current_token[1]
             self.advance()
             operand = self.parse_unary()
@@ -251,52 +508,44 @@ class Parser:
 
     def parse_primary(self):
         token = self.current_token
-        if token[0] == 'LITERAL':
+        kind = self.current_kind
+        if kind == SymbolKind.LITERAL:
             self.advance()
-            if token[1] in {"true", "false"}:
-                value = True if token[1] == "true" else False
-                return LiteralNode(value)
-            elif token[1].startswith("#"):
-                return LiteralNode(token[1])
-            elif token[1].isdigit() or (token[1].replace('.', '', 1).isdigit() and token[1].count('.') < 2):
-                value = int(token[1]) if '.' not in token[1] else float(token[1])
-                return LiteralNode(value)
-            else:
-                raise SyntaxError(f"Unexpected literal {token[1]}")
-        elif token[0] == 'IDENTIFIER':
+            return literal_node(token)
+        elif kind == SymbolKind.IDENTIFIER:
             identifier = token[1]
             self.advance()
-            if self.current_token[0] == 'DELIMITER' and self.current_token[1] == '(':
+            if self.current_kind == SymbolKind.LEFT_PAREN:
                 self.advance()  # skip '('
                 args = []
-                while self.current_token[0] != 'DELIMITER' or self.current_token[1] != ')':
+                while self.current_kind != SymbolKind.RIGHT_PAREN:
                     args.append(self.parse_expression())
-                    if self.current_token[0] == 'DELIMITER' and self.current_token[1] == ',':
+                    if self.current_kind == SymbolKind.COMMA:
                         self.advance()  # skip ','
-                self.expect('DELIMITER', ')')
+                self.expect(SymbolKind.RIGHT_PAREN)
                 return FunctionCallNode(identifier, args)
             return IdentifierNode(identifier)
-        elif token[0] == 'DELIMITER' and token[1] == '(':
+        elif kind == SymbolKind.LEFT_PAREN:
             self.advance()
             expr = self.parse_expression()
-            self.expect('DELIMITER', ')')
+            self.expect(SymbolKind.RIGHT_PAREN)
             return expr
-        elif token[0] == 'SPECIAL_FUNCTION':
+        elif kind in SPECIAL_FUNCTION_KINDS:
             func_name = token[1]
             self.advance()
             args = []
-            while self.current_token[0] != 'DELIMITER' or self.current_token[1] != ';':
+            while self.current_kind != SymbolKind.SEMICOLON:
                 args.append(self.parse_expression())
-                if self.current_token[0] == 'DELIMITER' and self.current_token[1] == ',':
+                if self.current_kind == SymbolKind.COMMA:
                     self.advance()  # skip ','
             return FunctionCallNode(func_name, args)
         raise SyntaxError(f"Unexpected token in expression: {token}")
 
-
-    def expect(self, token_type, value=None):
-        if self.current_token[0] != token_type or (value and self.current_token[1] != value):
-            raise SyntaxError(f"Expected token {token_type} with value {value}, but got {self.current_token}")
-        self.advance()
+def parse_file(path, lexer=None):
+    # Lex and parse a source file as a stream, without reading it into one string first
+    lexer = lexer or Lexer(engine="compiled")
+    with open(path, "rb") as src_file:
+        return Parser(lexer.IterTokens(src_file)).parse()
 
 if __name__ == '__main__':
     # Example usage
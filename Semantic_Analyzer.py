@@ -1,162 +1,353 @@
 from lexer import Lexer
 from LLK_Parser import Parser
+
 from parser_nodes import traverse
+from visitor import NodeVisitor
 
 class SymbolTable:
+    # Every name maps to a stack of its bindings, innermost last, so that looking a name up is a single dict
+    # access. A binding is (type, (depth, slot)): the nesting depth of the scope that declared the name, 0 for
+    # the global scope, and its index among the names declared in that scope, so later stages can keep the
+    # variables of each scope in an array. declared lists the names in declaration order and scope_starts the
+    # position in it where each open scope begins, so scopes are entered and exited without a dict each.
     def __init__(self):
-        self.scopes = [{}]
+        self.bindings = {}
+        self.declared = []
+        self.scope_starts = [0]
 
     def enter_scope(self):
-        self.scopes.append({})
+        self.scope_starts.append(len(self.declared))
 
     def exit_scope(self):
-        self.scopes.pop()
+        start = self.scope_starts.pop()
+        bindings = self.bindings
+        for name in self.declared[start:]:
+            stack = bindings[name]
+            stack.pop()
+            if not stack:
+                del bindings[name]
+        del self.declared[start:]
 
     def declare(self, name, type):
-        if name in self.scopes[-1]:
+        # Returns the (depth, slot) of the new binding
+        depth = len(self.scope_starts) - 1
+        stack = self.bindings.get(name)
+        if stack is None:
+            stack = self.bindings[name] = []
+        elif stack[-1][1][0] == depth:
             raise Exception(f"Variable '{name}' already declared in the same scope")
-        self.scopes[-1][name] = type
+        location = (depth, len(self.declared) - self.scope_starts[-1])
+        stack.append((type, location))
+        self.declared.append(name)
+        return location
+
+    def resolve(self, name):
+        # The (type, (depth, slot)) binding that name refers to in the current scope
+        stack = self.bindings.get(name)
+        if stack is None:
+            raise Exception(f"Variable '{name}' not declared")
+        return stack[-1]
 
     def lookup(self, name):
-        for scope in reversed(self.scopes):
-            if name in scope:
-                return scope[name]
-        raise Exception(f"Variable '{name}' not declared")
+        return self.resolve(name)[0]
 
     def is_declared(self, name):
-        for scope in self.scopes:
-            if name in scope:
-                return True
-        return False
+        return name in self.bindings
+
+    def is_declared_in_scope(self, name):
+        stack = self.bindings.get(name)
+        return stack is not None and stack[-1][1][0] == len(self.scope_starts) - 1
+
+# Poison type given to expressions that already produced an error in recovery mode. Checks involving it are
+# skipped, so one mistake is reported once rather than again by every expression built on top of it.
+ERROR_TYPE = 'error'
+
+# (parameter types, return type) of the built-in functions that can be used in expressions
+BUILTIN_SIGNATURES = {
+    '__random_int': (('int',), 'int'),
+    '__randi': (('int',), 'int'),
+    '__width': ((), 'int'),
+    '__height': ((), 'int'),
+    '__read': (('int', 'int'), 'colour'),
+}
 
-class SemanticAnalyzer:
-    def __init__(self):
+class SignatureCollector(NodeVisitor):
+    # Gathers the (parameter types, return type) of every function declared anywhere in a program, so that calls
+    # can be checked before the function they call has been visited. Only statements are walked.
+    def __init__(self, analyzer):
+        self.analyzer = analyzer
+        self.signatures = dict(BUILTIN_SIGNATURES)
+
+    def generic_visit(self, node):
+        pass
+
+    def visit_ProgramNode(self, node):
+        for stmt in node.statements:
+            yield stmt
+
+    def visit_BlockNode(self, node):
+        for stmt in node.statements:
+            yield stmt
+
+    def visit_FunctionDeclNode(self, node):
+        if node.identifier in self.signatures:
+            self.analyzer.report(f"Function '{node.identifier}' already declared", node)
+        else:
+            self.signatures[node.identifier] = (tuple(param.param_type for param in node.params), node.return_type)
+        yield node.block
+
+    def visit_IfStatementNode(self, node):
+        yield node.if_block
+        if node.else_block:
+            yield node.else_block
+
+    def visit_ForStatementNode(self, node):
+        yield node.block
+
+    def visit_WhileStatementNode(self, node):
+        yield node.block
+
+class SemanticAnalyzer(NodeVisitor):
+    # Checks scopes and types. Visitors of nodes with children are generators driven by NodeVisitor.visit.
+    # Expression visitors return the type of the expression and also store it in its expr_type, so later stages
+    # never have to infer it again.
+    def __init__(self, recover=False):
         self.symbol_table = SymbolTable()
+        # Function name -> (parameter types, return type), collected before the program is visited
+        self.signatures = dict(BUILTIN_SIGNATURES)
         self.current_function_return_type = None
+        # In recovery mode errors are collected in errors instead of raised. Each one is an Exception with the
+        # token_index of the start of the statement it was found in, when the node has a span.
+        self.recover = recover
+        self.errors = []
+        self.current_token_index = None
+
+    def report(self, message, node=None):
+        # Errors are placed at the start of node's span when there is one, or of the current statement
+        if not self.recover:
+            raise Exception(message)
+        error = Exception(message)
+        error.token_index = node.start if node is not None and node.start is not None else self.current_token_index
+        self.errors.append(error)
 
-    def visit(self, node):
-        method_name = 'visit_' + node.__class__.__name__
-        visitor = getattr(self, method_name, self.generic_visit)
-        return visitor(node)
+    def declare(self, name, type):
+        # The (depth, slot) of the name, or of its earlier declaration in recovery mode if it was already declared
+        try:
+            return self.symbol_table.declare(name, type)
+        except Exception as e:
+            if not self.recover:
+                raise
+            self.report(str(e))
+            return self.symbol_table.resolve(name)[1]
+
+    def lookup(self, name, node=None):
+        # The (type, (depth, slot)) binding of the name
+        try:
+            return self.symbol_table.resolve(name)
+        except Exception as e:
+            if not self.recover:
+                raise
+            self.report(str(e), node)
+            # Declared from here on, so each undeclared name is reported once per scope
+            return ERROR_TYPE, self.symbol_table.declare(name, ERROR_TYPE)
+
+    def visit_statements(self, statements):
+        for stmt in statements:
+            if stmt.start is not None:
+                self.current_token_index = stmt.start
+            yield stmt
 
     def generic_visit(self, node):
-        raise Exception(f'No visit_{node.__class__.__name__} method')
+        self.report(f'No visit_{node.__class__.__name__} method')
+        return ERROR_TYPE
+
+    def visit_ErrorNode(self, node):
+        # Already reported by the parser. A declaration that failed to parse still declares its name.
+        if node.identifier is not None and not self.symbol_table.is_declared_in_scope(node.identifier):
+            self.symbol_table.declare(node.identifier, ERROR_TYPE)
+        return ERROR_TYPE
 
     def visit_ProgramNode(self, node):
-        for stmt in node.statements:
-            self.visit(stmt)
+        collector = SignatureCollector(self)
+        collector.visit(node)
+        self.signatures = collector.signatures
+        yield from self.visit_statements(node.statements)
 
     def visit_FunctionDeclNode(self, node):
         self.symbol_table.enter_scope()
         for param in node.params:
-            self.visit(param)
+            yield param
+        # Restored afterwards, so that a return after the declaration is checked against the enclosing
+        # function, or found to be outside of any
+        enclosing_return_type = self.current_function_return_type
         self.current_function_return_type = node.return_type
-        self.visit(node.block)
+        yield node.block
+        self.current_function_return_type = enclosing_return_type
         self.symbol_table.exit_scope()
 
     def visit_ParamNode(self, node):
-        self.symbol_table.declare(node.identifier, node.param_type)
+        node.binding = self.declare(node.identifier, node.param_type)
 
     def visit_BlockNode(self, node):
         self.symbol_table.enter_scope()
-        for stmt in node.statements:
-            self.visit(stmt)
+        yield from self.visit_statements(node.statements)
         self.symbol_table.exit_scope()
 
     def visit_VariableDeclNode(self, node):
-        expr_type = self.visit(node.expr)
-        self.symbol_table.declare(node.identifier, node.var_type)
-        if node.var_type != expr_type:
-            raise Exception(f"Type mismatch: cannot assign {expr_type} to {node.var_type} in variable declaration of '{node.identifier}'")
+        expr_type = yield node.expr
+        node.binding = self.declare(node.identifier, node.var_type)
+        if node.var_type != expr_type and expr_type != ERROR_TYPE:
+            self.report(f"Type mismatch: cannot assign {expr_type} to {node.var_type} in variable declaration of '{node.identifier}'")
 
     def visit_AssignmentNode(self, node):
-        var_type = self.symbol_table.lookup(node.identifier)
-        expr_type = self.visit(node.expr)
-        if var_type != expr_type:
-            raise Exception(f"Type mismatch: cannot assign {expr_type} to {var_type} in assignment to '{node.identifier}'")
+        var_type, node.binding = self.lookup(node.identifier)
+        expr_type = yield node.expr
+        if var_type != expr_type and ERROR_TYPE not in (var_type, expr_type):
+            self.report(f"Type mismatch: cannot assign {expr_type} to {var_type} in assignment to '{node.identifier}'")
 
     def visit_ReturnStatementNode(self, node):
-        expr_type = self.visit(node.expr)
-        if expr_type != self.current_function_return_type:
-            raise Exception(f"Return type mismatch in function with return type {self.current_function_return_type}: got {expr_type}")
+        expr_type = yield node.expr
+        if self.current_function_return_type is None:
+            self.report("Return outside a function", node)
+        elif expr_type != self.current_function_return_type and expr_type != ERROR_TYPE:
+            self.report(f"Return type mismatch in function with return type {self.current_function_return_type}: got {expr_type}")
 
     def visit_IfStatementNode(self, node):
-        self.visit(node.condition)
-        self.visit(node.if_block)
+        yield node.condition
+        yield node.if_block
         if node.else_block:
-            self.visit(node.else_block)
+            yield node.else_block
 
     def visit_WhileStatementNode(self, node):
-        self.visit(node.condition)
-        self.visit(node.block)
+        yield node.condition
+        yield node.block
 
     def visit_ForStatementNode(self, node):
         self.symbol_table.enter_scope()
-        self.visit(node.init)
-        self.visit(node.condition)
-        self.visit(node.post)
-        self.visit(node.block)
+        yield node.init
+        yield node.condition
+        yield node.post
+        yield node.block
         self.symbol_table.exit_scope()
 
     def visit_PrintStatementNode(self, node):
-        self.visit(node.expr)
+        yield node.expr
 
     def visit_DelayStatementNode(self, node):
-        self.visit(node.expr)
+        yield node.expr
 
     def visit_WriteStatementNode(self, node):
         for arg in node.args:
-            self.visit(arg)
+            yield arg
 
     def visit_BinaryOpNode(self, node):
-        left_type = self.visit(node.left)
-        right_type = self.visit(node.right)
+        left_type = yield node.left
+        right_type = yield node.right
+        node.expr_type = self.binary_op_type(node, left_type, right_type)
+        return node.expr_type
+
+    def binary_op_type(self, node, left_type, right_type):
+        if ERROR_TYPE in (left_type, right_type):
+            return ERROR_TYPE
         if node.operator in {'>', '<', '>=', '<=', '==', '!='}:
             if left_type != right_type:
-                raise Exception(f"Type mismatch in binary operation: {left_type} {node.operator} {right_type}")
+                self.report(f"Type mismatch in binary operation: {left_type} {node.operator} {right_type}", node)
+                return ERROR_TYPE
             return 'bool'
         elif node.operator in {'+', '-', '*', '/'}:
             if left_type != right_type:
-                raise Exception(f"Type mismatch in binary operation: {left_type} {node.operator} {right_type}")
+                self.report(f"Type mismatch in binary operation: {left_type} {node.operator} {right_type}", node)
+                return ERROR_TYPE
             return left_type
         elif node.operator in {'and', 'or'}:
             if left_type != 'bool' or right_type != 'bool':
-                raise Exception(f"Logical operation requires boolean operands: {left_type} {node.operator} {right_type}")
+                self.report(f"Logical operation requires boolean operands: {left_type} {node.operator} {right_type}", node)
+                return ERROR_TYPE
             return 'bool'
         else:
-            raise Exception(f"Unsupported binary operator: {node.operator}")
-
+            self.report(f"Unsupported binary operator: {node.operator}", node)
+            return ERROR_TYPE
 
     def visit_UnaryOpNode(self, node):
-        operand_type = self.visit(node.operand)
-        return operand_type
+        node.expr_type = yield node.operand
+        return node.expr_type
 
     def visit_LiteralNode(self, node):
-        if isinstance(node.value, bool):
+        node.expr_type = self.literal_type(node)
+        return node.expr_type
+
+    def literal_type(self, node):
+        # Colour literals are ints, so the parser types them itself
+        if node.expr_type == 'colour':
+            return 'colour'
+        elif isinstance(node.value, bool):
             return 'bool'
         elif isinstance(node.value, int):
             return 'int'
         elif isinstance(node.value, float):
             return 'float'
-        elif isinstance(node.value, str) and node.value.startswith("#"):
-            return 'colour'
         else:
-            raise Exception(f"Unknown literal type: {node.value}")
+            self.report(f"Unknown literal type: {node.value}", node)
+            return ERROR_TYPE
 
     def visit_IdentifierNode(self, node):
-        return self.symbol_table.lookup(node.name)
+        node.expr_type, node.binding = self.lookup(node.name, node)
+        return node.expr_type
 
     def visit_FunctionCallNode(self, node):
-        # For simplicity, let's assume all function calls return int.
-        # This would be expanded to check the function signature.
+        arg_types = []
         for arg in node.args:
-            self.visit(arg)
-        return 'int'
+            arg_types.append((yield arg))
+        node.expr_type = self.call_type(node, arg_types)
+        return node.expr_type
+
+    def call_type(self, node, arg_types):
+        if node.name not in self.signatures:
+            self.report(f"Function '{node.name}' not declared", node)
+            return ERROR_TYPE
+        param_types, return_type = self.signatures[node.name]
+        if len(arg_types) != len(param_types):
+            self.report(f"Function '{node.name}' takes {len(param_types)} arguments but {len(arg_types)} were given", node)
+            return return_type
+        for position, (arg_type, param_type) in enumerate(zip(arg_types, param_types), 1):
+            if arg_type != param_type and arg_type != ERROR_TYPE:
+                self.report(f"Type mismatch in argument {position} of '{node.name}': expected {param_type}, got {arg_type}", node)
+        return return_type
 
     def visit_CastNode(self, node):
-        return node.target_type
+        yield node.expr
+        node.expr_type = node.target_type
+        return node.expr_type
+
 
 
+def check_source(src_program_str, lexer=None):
+    # Lex, parse and analyse a program in recovery mode. Returns the AST and every error found, as
+    # (phase, line, column, message) tuples in source order.
+    lexer = lexer or Lexer(engine="compiled")
+    tokens = lexer.GenerateTokenStream(src_program_str)
+    errors = []
+    lexical_error_indices = set()
+    for idx in range(len(tokens)):
+        if tokens.Type(idx) == 'LEXICAL_ERROR':
+            lexical_error_indices.add(idx)
+            errors.append(('lexical', *tokens.Position(idx), f"Invalid lexeme '{tokens.Lexeme(idx)}'"))
+
+    parser = Parser(tokens, recover=True)
+    ast = parser.parse()
+    for error in parser.errors:
+        # Syntax errors on a bad lexeme only repeat the lexical error
+        if error.token_index not in lexical_error_indices:
+            errors.append(('syntax', *tokens.Position(error.token_index), str(error)))
+
+    analyzer = SemanticAnalyzer(recover=True)
+    analyzer.visit(ast)
+    for error in analyzer.errors:
+        line, column = tokens.Position(error.token_index) if error.token_index is not None else (0, 0)
+        errors.append(('semantic', line, column, str(error)))
+
+    errors.sort(key=lambda error: (error[1], error[2]))
+    return ast, errors
 
 if __name__ == '__main__':
     input_code = '''
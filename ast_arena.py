@@ -0,0 +1,128 @@
+from array import array
+from itertools import islice
+
+from parser_nodes import *
+
+# Node classes by the kind code stored for them. The fields of every class are its __slots__, which are also
+# the leading positional parameters of its constructor.
+NODE_CLASSES = [ProgramNode, FunctionDeclNode, ParamNode, BlockNode, VariableDeclNode, AssignmentNode,
+                ReturnStatementNode, IfStatementNode, ForStatementNode, WhileStatementNode, PrintStatementNode,
+                DelayStatementNode, WriteStatementNode, BinaryOpNode, UnaryOpNode, LiteralNode, IdentifierNode,
+                FunctionCallNode, CastNode, ErrorNode]
+NODE_KINDS = {node_class: kind for kind, node_class in enumerate(NODE_CLASSES)}
+# Kind code of the entries for lists of nodes, such as a block's statements
+LIST_KIND = len(NODE_CLASSES)
+
+class AstArena:
+    # An AST packed into typed columns instead of one object per node. Entries are numbered in post-order,
+    # children before their parents, and include one for every list of nodes; the root is the last one.
+    # Entry n has the kind kinds[n], the token span starts[n]..ends[n] (-1 for none), and its field values,
+    # in __slots__ order, or its list items, at fields[first_fields[n]:first_fields[n + 1]].
+    # A field value is an index into the object table: first the constants (names, literal values and None,
+    # each stored once) and then the entries. Several times smaller than the node objects, for keeping many
+    # trees around, and to_tree() rebuilds them in one forward pass.
+    def __init__(self):
+        self.kinds = array("B")
+        self.starts = array("i")
+        self.ends = array("i")
+        self.first_fields = array("I")
+        self.fields = array("i")
+        self.constants = []
+
+    @classmethod
+    def from_tree(cls, root):
+        arena = cls()
+        kinds, starts, ends, first_fields = arena.kinds, arena.starts, arena.ends, arena.first_fields
+        constants = arena.constants
+        constant_index = {}
+        # Entry numbers are written as they are and constants as ~index until the number of constants is known
+        fields = []
+        # Entry numbers of the finished children that their parents have not taken yet
+        done = []
+        stack = [(root, False)]
+        while stack:
+            value, children_done = stack.pop()
+            if isinstance(value, list):
+                children = value
+            else:
+                children = [field for field in map(value.__getattribute__, type(value).__slots__)
+                            if isinstance(field, (Node, list))]
+            if not children_done:
+                stack.append((value, True))
+                stack.extend((child, False) for child in reversed(children))
+                continue
+
+            child_entries = iter(done[len(done) - len(children):])
+            del done[len(done) - len(children):]
+            first_fields.append(len(fields))
+            if isinstance(value, list):
+                kinds.append(LIST_KIND)
+                starts.append(-1)
+                ends.append(-1)
+                fields.extend(child_entries)
+            else:
+                kinds.append(NODE_KINDS[type(value)])
+                starts.append(-1 if value.start is None else value.start)
+                ends.append(-1 if value.end is None else value.end)
+                for field in map(value.__getattribute__, type(value).__slots__):
+                    if isinstance(field, (Node, list)):
+                        fields.append(next(child_entries))
+                        continue
+                    # Keyed by type as well, since True, 1 and 1.0 are equal
+                    key = (type(field), field)
+                    if key not in constant_index:
+                        constant_index[key] = len(constants)
+                        constants.append(field)
+                    fields.append(~constant_index[key])
+            done.append(len(kinds) - 1)
+        first_fields.append(len(fields))
+
+        constant_count = len(constants)
+        arena.fields = array("i", [constant_count + value if value >= 0 else ~value for value in fields])
+        return arena
+
+    def __len__(self):
+        return len(self.kinds)
+
+    @property
+    def root(self):
+        return len(self.kinds) - 1
+
+    def node_class(self, index):
+        # None for a list entry
+        kind = self.kinds[index]
+        return NODE_CLASSES[kind] if kind != LIST_KIND else None
+
+    def span(self, index):
+        start = self.starts[index]
+        return (None, None) if start < 0 else (start, self.ends[index])
+
+    def field(self, index, name):
+        # A field of a node entry, with child nodes and lists given as entry numbers
+        position = self.first_fields[index] + NODE_CLASSES[self.kinds[index]].__slots__.index(name)
+        value = self.fields[position]
+        if value < len(self.constants):
+            return self.constants[value]
+        return value - len(self.constants)
+
+    def items(self, index):
+        # Entry numbers of the items of a list entry
+        constant_count = len(self.constants)
+        items = self.fields[self.first_fields[index]:self.first_fields[index + 1]]
+        return [value - constant_count for value in items]
+
+    def to_tree(self):
+        objects = list(self.constants)
+        append = objects.append
+        # Children come before their parents, so every value is in objects by the time it is taken from here
+        values = map(objects.__getitem__, self.fields)
+        first_fields = self.first_fields
+        counts = map(int.__sub__, islice(first_fields, 1, None), first_fields)
+        for kind, start, end, count in zip(self.kinds, self.starts, self.ends, counts):
+            if kind == LIST_KIND:
+                append(list(islice(values, count)))
+            elif start < 0:
+                append(NODE_CLASSES[kind](*islice(values, count)))
+            else:
+                append(NODE_CLASSES[kind](*islice(values, count), start, end))
+        return objects[-1]
@@ -0,0 +1,91 @@
+import argparse
+import asyncio
+import io
+import sys
+import time
+
+from bytecode import compile_source
+from runtime import Runtime, RealClock, VirtualClock
+from vm import VM
+
+# Backward jumps and calls a program runs between turns it gives the other programs on the event loop
+SLICE_JUMPS = 10000
+
+class BudgetExceeded(Exception):
+    pass
+
+async def run_program(compiled, runtime, cpu_budget=None, time_budget=None, slice_jumps=SLICE_JUMPS):
+    # Runs a CompiledProgram on the VM as a coroutine, so that one event loop can run many programs at once:
+    # every __delay awaits the runtime's clock rather than blocking, and a program gives the others a turn
+    # every slice_jumps backward jumps and calls. cpu_budget is the seconds of computing and time_budget the
+    # milliseconds on its clock the program may take before BudgetExceeded is raised in it. Cancelling the task
+    # stops the program at its next turn. Either way its runtime is closed and returned or left with what it
+    # had done so far.
+    clock = runtime.clock
+    steps = VM(runtime).execute(compiled, slice_jumps)
+    start = clock.now()
+    used = 0.0
+    try:
+        while True:
+            step_start = time.perf_counter()
+            try:
+                milliseconds = next(steps)
+            except StopIteration:
+                return runtime
+            used += time.perf_counter() - step_start
+            if cpu_budget is not None and used > cpu_budget:
+                raise BudgetExceeded(f"Program ran for more than {cpu_budget}s of CPU time")
+            if milliseconds is None:
+                await asyncio.sleep(0)
+                continue
+            runtime.end_frame()
+            if time_budget is not None and clock.now() - start + max(milliseconds, 0) > time_budget:
+                raise BudgetExceeded(f"Program delayed for more than {time_budget} ms")
+            await clock.wait(max(milliseconds, 0))
+    finally:
+        steps.close()
+        runtime.close()
+
+async def compile_and_run(src_program_str, runtime, **budgets):
+    return await run_program(compile_source(src_program_str), runtime, **budgets)
+
+async def run_programs(sources, make_runtime=None, **budgets):
+    # Compiles and runs many programs concurrently on the running event loop, each on its own runtime, by
+    # default with its own output and a virtual clock. Returns (name, runtime, error) for each source, with the
+    # exception that stopped it, or None, as error. Cancelling it cancels every program still running.
+    make_runtime = make_runtime or (lambda: Runtime(out=io.StringIO(), clock=VirtualClock()))
+    names, runtimes = [], []
+    for name, _ in sources:
+        names.append(name)
+        runtimes.append(make_runtime())
+    errors = await asyncio.gather(*(compile_and_run(src, runtime, **budgets)
+                                    for (_, src), runtime in zip(sources, runtimes)), return_exceptions=True)
+    return [(name, runtime, error if isinstance(error, BaseException) else None)
+            for name, runtime, error in zip(names, runtimes, errors)]
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Run PArL programs concurrently on one event loop")
+    arg_parser.add_argument("paths", nargs="+", help="source files")
+    arg_parser.add_argument("--real-time", action="store_true", help="make __delay sleep instead of advancing "
+                                                                     "a virtual clock")
+    arg_parser.add_argument("--cpu-budget", type=float, default=None, help="seconds of CPU time per program")
+    arg_parser.add_argument("--time-budget", type=float, default=None, help="milliseconds of delays per program")
+    args = arg_parser.parse_args(argv)
+
+    sources = []
+    for path in args.paths:
+        with open(path) as src_file:
+            sources.append((path, src_file.read()))
+    clock_class = RealClock if args.real_time else VirtualClock
+    results = asyncio.run(run_programs(sources, lambda: Runtime(out=io.StringIO(), clock=clock_class()),
+                                       cpu_budget=args.cpu_budget, time_budget=args.time_budget))
+    failed = False
+    for name, runtime, error in results:
+        status = "ok" if error is None else f"{type(error).__name__}: {error}"
+        print(f"== {name}: {len(runtime.frame_times)} frames, {status}")
+        print(runtime.out.getvalue(), end="")
+        failed = failed or error is not None
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
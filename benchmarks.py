@@ -0,0 +1,731 @@
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from lexer import Lexer
+from LLK_Parser import Parser, DescentParser
+from parser_nodes import Node, traverse
+from Semantic_Analyzer import SemanticAnalyzer
+from incremental import IncrementalFrontEnd
+from driver import compile_batch
+from differential import ast_signature, generated_execution_programs
+from ast_arena import AstArena, LIST_KIND
+from compile_cache import CompileCache
+from bytecode import compile_source
+from vm import VM
+import closure_engine
+import transpiler
+import ir
+import vectorize
+from optimizer import Optimizer
+from runtime import Runtime, RealClock, VirtualClock
+from async_runtime import run_programs
+from framebuffer import FramebufferRuntime
+from frames import RecordingRuntime, encode_pixels
+
+FUNCTION_TEMPLATE = '''
+fun Compute{n}(x:int, y:int) -> int {{
+    let acc{n}:int = x * {n} + y;
+    let scale{n}:float = 2.5;
+    let c{n}:colour = #a0b1c2;
+    for (let i:int = 0; i < {n}; i = i + 1) {{
+        if ((acc{n} >= y) and (x != {n})) {{
+            acc{n} = acc{n} + i * 2;
+        }} else {{
+            acc{n} = acc{n} / 2;
+        }}
+        __write i, y, c{n};
+    }}
+    while (acc{n} > 100) {{
+        acc{n} = acc{n} / 3;
+    }}
+    __print acc{n};
+    return acc{n};
+}}
+'''
+
+
+def generate_program(functions):
+    parts = [FUNCTION_TEMPLATE.format(n=n) for n in range(functions)]
+    parts.append(f"__print Compute0({functions}, 7);\n")
+    return "".join(parts)
+
+
+def best_of(repeats, func, *args):
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def bench_lexer(functions=2000, repeats=3):
+    src = generate_program(functions)
+    size_mb = len(src) / 1e6
+    print(f"Lexer benchmark: {len(src)} characters")
+
+    dfa_time, dfa_tokens = best_of(repeats, Lexer().GenerateTokens, src)
+    compiled_time, compiled_tokens = best_of(repeats, Lexer(engine="compiled").GenerateTokens, src)
+    if dfa_tokens != compiled_tokens:
+        raise AssertionError("compiled lexer produced a different token stream")
+
+    print(f"  dfa       {dfa_time:8.3f}s  {size_mb / dfa_time:6.2f} MB/s  {len(dfa_tokens)} tokens")
+    print(f"  compiled  {compiled_time:8.3f}s  {size_mb / compiled_time:6.2f} MB/s  "
+          f"speedup x{dfa_time / compiled_time:.1f}")
+
+    regex_time, regex_tokens = best_of(repeats, Lexer(engine="regex").GenerateTokens, src)
+    if dfa_tokens != regex_tokens:
+        raise AssertionError("regex lexer produced a different token stream")
+    print(f"  regex     {regex_time:8.3f}s  {size_mb / regex_time:6.2f} MB/s  "
+          f"speedup x{dfa_time / regex_time:.1f}")
+
+
+EXPRESSION_TEMPLATE = '''
+let e{n}:bool = (a{n} * 3 + b / 2) < (d + {n}) and not (x{n} != y) or z >= 2.5;
+let f{n}:float = ((((p + q) * r) / s) + t * (u + v * (w + {n}))) as float;
+'''
+
+
+def bench_expressions(statements=4000, repeats=7):
+    src = "".join(EXPRESSION_TEMPLATE.format(n=n) for n in range(statements))
+    tokens = Lexer(engine="regex").GenerateTokens(src)
+    print(f"Expression parsing benchmark: {len(tokens)} tokens")
+
+    # The trees are dropped straight away, so the garbage collector sees the same heap for both parsers
+    descent_time, _ = best_of(repeats, lambda: DescentParser(tokens).parse() and None)
+    pratt_time, _ = best_of(repeats, lambda: Parser(tokens).parse() and None)
+    print(f"  recursive descent    {descent_time:8.3f}s")
+    print(f"  precedence climbing  {pratt_time:8.3f}s  speedup x{descent_time / pratt_time:.2f}")
+
+
+def bench_statements(functions=2000, repeats=7):
+    kinds = []
+    tokens = Lexer(engine="regex").GenerateTokens(generate_program(functions), kinds=kinds)
+    print(f"Statement parsing benchmark: {len(tokens)} tokens")
+    lookup_time, _ = best_of(repeats, lambda: Parser(tokens).parse() and None)
+    print(f"  kinds looked up by the parser   {lookup_time:8.3f}s  {len(tokens) / lookup_time / 1e6:6.2f} M tokens/s")
+    lexer_time, _ = best_of(repeats, lambda: Parser(tokens, kinds).parse() and None)
+    print(f"  kinds produced by the lexer     {lexer_time:8.3f}s  {len(tokens) / lexer_time / 1e6:6.2f} M tokens/s")
+
+
+# Deeply nested programs of the kind code generators emit, keyed by the shape of the nesting
+NESTING_TEMPLATES = {
+    "blocks": lambda depth: "let a:int = 1;\n" + "if (true) {" * depth + "a = a + 1;" + "}" * depth + "\n",
+    "parentheses": lambda depth: "let a:int = 1;\nlet x:int = " + "(a + " * depth + "1" + ")" * depth + ";\n",
+    "operator chain": lambda depth: "let a:int = 1;\nlet x:int = " + " + ".join(["a"] * depth) + ";\n",
+    "prefix operators": lambda depth: "let x:bool = " + "not " * depth + "true;\n",
+}
+
+
+class NullOutput:
+    def write(self, text):
+        pass
+
+    def flush(self):
+        pass
+
+
+def bench_nesting(depth=100000):
+    lexer = Lexer(engine="regex")
+    print(f"Nesting benchmark: depth {depth}, recursion limit {sys.getrecursionlimit()}")
+    for shape, template in NESTING_TEMPLATES.items():
+        tokens = lexer.GenerateTokens(template(depth))
+        parse_time, ast = best_of(1, lambda: Parser(tokens).parse())
+        analyse_time, _ = best_of(1, lambda: SemanticAnalyzer().visit(ast))
+        with contextlib.redirect_stdout(NullOutput()):
+            # Output is quadratic in the depth, as every line is indented by it
+            traverse_time, _ = best_of(1, traverse, ast)
+        print(f"  {shape:16}  parse {parse_time:6.3f}s  analyse {analyse_time:6.3f}s  traverse {traverse_time:6.3f}s")
+
+
+def peak_memory(func, *args):
+    tracemalloc.start()
+    try:
+        func(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def retained_memory(func, *args):
+    # Bytes still allocated by func once it has returned, i.e. the size of what it built
+    tracemalloc.start()
+    try:
+        result = func(*args)
+        return tracemalloc.get_traced_memory()[0], result
+    finally:
+        tracemalloc.stop()
+
+
+PLAIN_NODE_CLASSES = {}
+
+
+def plain_copy(node):
+    # The same tree, spans included, made of classes with an instance __dict__ and holding a separate string
+    # for every name as the lexer produced them: how the parser represented ASTs before nodes were slotted
+    if isinstance(node, list):
+        return [plain_copy(item) for item in node]
+    if isinstance(node, Node):
+        node_class = type(node)
+        if node_class not in PLAIN_NODE_CLASSES:
+            PLAIN_NODE_CLASSES[node_class] = type(node_class.__name__, (), {})
+        copy = PLAIN_NODE_CLASSES[node_class]()
+        for name in node_class.__slots__:
+            setattr(copy, name, plain_copy(getattr(node, name)))
+        copy.start = node.start
+        copy.end = node.end
+        return copy
+    if isinstance(node, str):
+        return "".join(node)
+    return node
+
+
+def bench_ast_memory(functions=2000):
+    tokens = Lexer(engine="regex").GenerateTokens(generate_program(functions))
+    slotted_size, ast = retained_memory(lambda: Parser(tokens).parse())
+    plain_size, _ = retained_memory(plain_copy, ast)
+    arena_size, arena = retained_memory(AstArena.from_tree, ast)
+    if ast_signature(arena.to_tree()) != ast_signature(ast):
+        raise AssertionError("AstArena did not round trip the tree")
+    nodes = sum(1 for kind in arena.kinds if kind != LIST_KIND)
+    print(f"AST memory benchmark: {len(tokens)} tokens, {nodes} nodes")
+    print(f"  __dict__ nodes     {plain_size / 1e6:8.2f} MB  {plain_size / nodes:6.1f} bytes/node")
+    print(f"  slotted, interned  {slotted_size / 1e6:8.2f} MB  {slotted_size / nodes:6.1f} bytes/node  "
+          f"({plain_size / slotted_size:.1f}x less)")
+    print(f"  AstArena           {arena_size / 1e6:8.2f} MB  {arena_size / nodes:6.1f} bytes/node  "
+          f"({plain_size / arena_size:.1f}x less)")
+
+
+def bench_streaming(functions=500):
+    data = generate_program(functions).encode()
+    lexer = Lexer(engine="compiled")
+    print(f"Streaming benchmark: {len(data)} bytes")
+
+    def materialised():
+        src = io.BytesIO(data).read().decode()
+        return Parser(lexer.GenerateTokens(src)).parse()
+
+    def streamed():
+        return Parser(lexer.IterTokens(io.BytesIO(data))).parse()
+
+    list_peak = peak_memory(materialised)
+    stream_peak = peak_memory(streamed)
+    print(f"  token list  peak {list_peak / 1e6:8.2f} MB")
+    print(f"  streamed    peak {stream_peak / 1e6:8.2f} MB  ({list_peak / stream_peak:.1f}x less)")
+
+
+def bench_token_memory(functions=2000):
+    src = generate_program(functions)
+    lexer = Lexer(engine="compiled")
+    print(f"Token memory benchmark: {len(src)} characters")
+
+    list_peak = peak_memory(lexer.GenerateTokens, src)
+    stream_peak = peak_memory(lexer.GenerateTokenStream, src)
+    print(f"  tuple list   peak {list_peak / 1e6:8.2f} MB")
+    print(f"  TokenStream  peak {stream_peak / 1e6:8.2f} MB  ({list_peak / stream_peak:.1f}x less)")
+
+
+def bench_incremental(functions=2000, edits=20):
+    src = generate_program(functions)
+    lexer = Lexer(engine="compiled")
+    print(f"Incremental benchmark: {len(src)} characters, {edits} edits")
+
+    def full_rebuild():
+        return Parser(lexer.GenerateTokenStream(src)).parse()
+
+    full_time, _ = best_of(3, full_rebuild)
+    front_end = IncrementalFrontEnd(src, lexer)
+    # Change the loop bound of one function in the middle of the file, back and forth
+    offset = src.index(f"i < {functions // 2};") + len("i < ")
+    start = time.perf_counter()
+    for n in range(edits):
+        old, new = (str(functions // 2), "99") if n % 2 == 0 else ("99", str(functions // 2))
+        front_end.apply_edit(offset, len(old), new)
+    edit_time = (time.perf_counter() - start) / edits
+
+    print(f"  full re-lex and re-parse  {full_time * 1e3:9.2f} ms")
+    print(f"  incremental edit          {edit_time * 1e3:9.2f} ms  speedup x{full_time / edit_time:.0f}")
+
+
+def bench_batch(files=64, functions=40):
+    cpus = os.cpu_count() or 1
+    print(f"Batch benchmark: {files} files of {functions} functions, {cpus} CPUs")
+    with tempfile.TemporaryDirectory() as src_dir:
+        src = generate_program(functions)
+        for n in range(files):
+            with open(os.path.join(src_dir, f"program{n}.txt"), "w") as src_file:
+                src_file.write(src)
+
+        serial_time, _ = best_of(1, lambda: list(compile_batch([src_dir], workers=1)))
+        print(f"  1 worker    {serial_time:8.3f}s")
+        parallel_time, results = best_of(1, lambda: list(compile_batch([src_dir], workers=cpus)))
+        print(f"  {cpus} workers  {parallel_time:8.3f}s  speedup x{serial_time / parallel_time:.1f}")
+        if not all(result["success"] for result in results):
+            raise AssertionError("batch compile failed on a generated program")
+
+
+def bench_cache(functions=2000, repeats=3):
+    src = generate_program(functions)
+    lexer = Lexer(engine="compiled")
+    print(f"Compile cache benchmark: {len(src)} characters")
+
+    def compile_source():
+        return Parser(lexer.GenerateTokenStream(src)).parse()
+
+    compile_time, ast = best_of(repeats, compile_source)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = CompileCache(cache_dir, lexer=lexer)
+        cache.compile(src)
+        load_time, (_, cached_ast) = best_of(repeats, cache.compile, src)
+        if ast_signature(cached_ast) != ast_signature(ast):
+            raise AssertionError("CompileCache did not give back the parsed tree")
+        print(f"  lex and parse  {compile_time * 1e3:9.2f} ms")
+        print(f"  cache hit      {load_time * 1e3:9.2f} ms  speedup x{compile_time / load_time:.1f}")
+        print(f"  {cache.format_stats()}")
+
+
+def factorial_loop(n):
+    fact = 1
+    for k in range(1, n + 1):
+        fact = fact * k
+    return fact
+
+
+# Loop-heavy programs, each with the same computation written directly in Python for reference
+EXECUTION_PROGRAMS = {
+    "factorial": ('''
+fun Factorial(n:int) -> int {
+    let fact:int = 1;
+    for (let k:int = 1; k <= n; k = k + 1) {
+        fact = fact * k;
+    }
+    return fact;
+}
+let total:int = 0;
+for (let i:int = 0; i < 20000; i = i + 1) {
+    total = total + Factorial(12) / 1000;
+}
+__print total;
+''', lambda: sum(factorial_loop(12) // 1000 for _ in range(20000))),
+    "nested loops": ('''
+let total:int = 0;
+for (let i:int = 0; i < 400; i = i + 1) {
+    for (let j:int = 0; j < 400; j = j + 1) {
+        if ((i + j) / 2 * 2 >= i + j) {
+            total = total + i * j;
+        }
+    }
+}
+__print total;
+''', lambda: sum(i * j for i in range(400) for j in range(400) if (i + j) % 2 == 0)),
+    "pixels": ('''
+let w:int = __width;
+let h:int = __height;
+for (let frame:int = 0; frame < 40; frame = frame + 1) {
+    for (let y:int = 0; y < h; y = y + 1) {
+        for (let x:int = 0; x < w; x = x + 1) {
+            let c:colour = ((x * 7 + y * 3 + frame) * 4099) as colour;
+            __write x, y, c;
+        }
+    }
+}
+__print __read 5, 5;
+''', None),
+}
+
+
+def run_quietly(compiled):
+    vm = VM(Runtime(out=io.StringIO(), seed=0, clock=VirtualClock()))
+    vm.run(compiled)
+    return vm.runtime.out.getvalue()
+
+
+def bench_vm(repeats=3):
+    print("Bytecode VM benchmark")
+    for name, (src, reference) in EXECUTION_PROGRAMS.items():
+        compile_time, compiled = best_of(repeats, compile_source, src)
+        run_time, output = best_of(repeats, run_quietly, compiled)
+        line = f"  {name:13}  compile {compile_time * 1e3:7.2f} ms  run {run_time * 1e3:8.2f} ms"
+        if reference is not None:
+            reference_time, expected = best_of(repeats, reference)
+            if output != f"{expected}\n":
+                raise AssertionError(f"VM printed {output!r} for {name}, expected {expected}")
+            line += f"  ({run_time / reference_time:.0f}x the Python equivalent)"
+        print(line)
+
+
+class TreeWalker:
+    # The baseline the closure engine is measured against: re-walks the AST every time a statement runs,
+    # dispatching on the node's class name with getattr and keeping variables in a dict. Only covers the
+    # statements LOOP_PROGRAM uses.
+    def __init__(self, out):
+        self.out = out
+        self.variables = {}
+
+    def run(self, node):
+        return getattr(self, "run_" + type(node).__name__)(node)
+
+    def run_ProgramNode(self, node):
+        for stmt in node.statements:
+            self.run(stmt)
+
+    def run_BlockNode(self, node):
+        for stmt in node.statements:
+            self.run(stmt)
+
+    def run_VariableDeclNode(self, node):
+        self.variables[node.identifier] = self.run(node.expr)
+
+    def run_AssignmentNode(self, node):
+        self.variables[node.identifier] = self.run(node.expr)
+
+    def run_ForStatementNode(self, node):
+        self.run(node.init)
+        while self.run(node.condition):
+            self.run(node.block)
+            self.run(node.post)
+
+    def run_PrintStatementNode(self, node):
+        self.out.write(f"{self.run(node.expr)}\n")
+
+    def run_BinaryOpNode(self, node):
+        left, right = self.run(node.left), self.run(node.right)
+        if node.operator == '+':
+            return left + right
+        if node.operator == '*':
+            return left * right
+        if node.operator == '<':
+            return left < right
+        raise NotImplementedError(node.operator)
+
+    def run_LiteralNode(self, node):
+        return node.value
+
+    def run_IdentifierNode(self, node):
+        return self.variables[node.name]
+
+
+LOOP_PROGRAM = '''
+let total:int = 0;
+for (let i:int = 0; i < 1000000; i = i + 1) {
+    total = total + i * 3;
+}
+__print total;
+'''
+
+
+def bench_closures(repeats=3):
+    print("Closure engine benchmark (a for loop of a million iterations)")
+    program = Parser(Lexer(engine="compiled").GenerateTokenStream(LOOP_PROGRAM)).parse()
+    SemanticAnalyzer().visit(program)
+    walker_out = io.StringIO()
+    walk_time, _ = best_of(repeats, TreeWalker(walker_out).run, program)
+    closure_out = io.StringIO()
+    compiled = closure_engine.ClosureCompiler(Runtime(out=closure_out)).compile(program)
+    closure_time, _ = best_of(repeats, compiled.run)
+    vm_time, vm_out = best_of(repeats, run_quietly, compile_source(LOOP_PROGRAM))
+    expected = f"{sum(i * 3 for i in range(1000000))}\n"
+    for engine, output in (("tree walker", walker_out.getvalue()), ("closures", closure_out.getvalue()), ("VM", vm_out)):
+        if not output.endswith(expected):
+            raise AssertionError(f"{engine} printed {output!r}, expected {expected!r}")
+    print(f"  tree walker  {walk_time * 1e3:9.2f} ms")
+    print(f"  closures     {closure_time * 1e3:9.2f} ms  speedup x{walk_time / closure_time:.1f}")
+    print(f"  VM           {vm_time * 1e3:9.2f} ms  speedup x{walk_time / vm_time:.1f}")
+
+
+def bench_transpiler(repeats=3):
+    print("Python transpiler benchmark")
+    programs = dict(EXECUTION_PROGRAMS, loop=(LOOP_PROGRAM, None))
+    for name, (src, _) in programs.items():
+        vm_time, expected = best_of(repeats, run_quietly, compile_source(src))
+        program = Parser(Lexer(engine="compiled").GenerateTokenStream(src)).parse()
+        compile_time, compiled = best_of(repeats, transpiler.compile_program, program)
+        out = io.StringIO()
+        run_time, _ = best_of(repeats, compiled.run, Runtime(out=out, seed=0, clock=VirtualClock()))
+        if not out.getvalue().endswith(expected):
+            raise AssertionError(f"Transpiled {name} printed {out.getvalue()!r}, expected {expected!r}")
+        print(f"  {name:13}  transpile {compile_time * 1e3:7.2f} ms  run {run_time * 1e3:8.2f} ms"
+              f"  speedup x{vm_time / run_time:.1f} over the VM")
+    with tempfile.TemporaryDirectory() as directory:
+        cache = transpiler.PythonCodeCache(directory)
+        src = EXECUTION_PROGRAMS["factorial"][0]
+        miss_time, _ = best_of(1, cache.compile, src)
+        hit_time, _ = best_of(repeats, cache.compile, src)
+        print(f"  cache miss     {miss_time * 1e3:9.2f} ms")
+        print(f"  cache hit      {hit_time * 1e3:9.2f} ms  speedup x{miss_time / hit_time:.1f}")
+
+
+def bench_optimizer(count=300):
+    print("Optimizer benchmark (generated programs)")
+    lexer = Lexer(engine="compiled")
+    programs = [Parser(lexer.GenerateTokenStream(src)).parse() for _, src in generated_execution_programs(count)]
+    for program in programs:
+        SemanticAnalyzer().visit(program)
+    totals = Optimizer()
+    start = time.perf_counter()
+    for program in programs:
+        optimizer = Optimizer()
+        optimizer.optimize(program)
+        for name in ("fold", "dce"):
+            for what, number in optimizer.stats[name].items():
+                totals.stats[name][what] += number
+        for what in ("rounds", "nodes before", "nodes after"):
+            totals.stats[what] += optimizer.stats[what]
+    elapsed = time.perf_counter() - start
+    print(f"  {count} programs optimised in {elapsed * 1e3:.2f} ms")
+    for line in totals.format_stats().splitlines():
+        print(f"  {line}")
+
+
+INVARIANT_PROGRAM = '''
+fun Scaled(n:int, scale:int) -> int {
+    let total:int = 0;
+    let i:int = 0;
+    while (i < n) {
+        total = total + i * 8 + (scale * scale + scale) / 3 + (scale * scale + scale) / 5;
+        i = i + 1;
+    }
+    return total;
+}
+__print Scaled(200000, 7);
+'''
+
+
+def bench_ir(repeats=3):
+    print("Optimising IR benchmark (AST compiler against IR, both on the VM)")
+    programs = dict(EXECUTION_PROGRAMS, loop=(LOOP_PROGRAM, None), invariants=(INVARIANT_PROGRAM, None))
+    for name, (src, _) in programs.items():
+        ast_time, expected = best_of(repeats, run_quietly, compile_source(src))
+        compile_time, compiled = best_of(repeats, ir.compile_source, src)
+        ir_time, output = best_of(repeats, run_quietly, compiled)
+        if output != expected:
+            raise AssertionError(f"IR build of {name} printed {output!r}, expected {expected!r}")
+        print(f"  {name:13}  compile {compile_time * 1e3:7.2f} ms  run {ir_time * 1e3:8.2f} ms"
+              f"  speedup x{ast_time / ir_time:.2f} over the AST compiler")
+
+
+BOX_PROGRAM = '''
+let w:int = __width;
+let h:int = __height;
+for (let frame:int = 0; frame < 50; frame = frame + 1) {
+    __write_box 0, 0, w, h, ((frame * 40503) as colour);
+    __write_box frame, frame, w / 2, h / 2, #ff0000;
+    __write frame, h / 2 + frame, #00ff00;
+}
+__print __read 100, 100;
+'''
+
+
+def bench_framebuffer(repeats=3, size=(1920, 1080)):
+    width, height = size
+    print(f"Framebuffer benchmark (50 full-screen and half-screen boxes on a {width}x{height} display)")
+    compiled = compile_source(BOX_PROGRAM)
+    results = {}
+    for name, runtime_class in (("list display", Runtime), ("framebuffer", FramebufferRuntime)):
+        def run():
+            runtime = runtime_class(width, height, out=io.StringIO(), clock=VirtualClock())
+            VM(runtime).run(compiled)
+            return runtime
+        results[name] = best_of(repeats, run)
+    list_time, list_runtime = results["list display"]
+    framebuffer_time, framebuffer_runtime = results["framebuffer"]
+    if framebuffer_runtime.out.getvalue() != list_runtime.out.getvalue() \
+            or framebuffer_runtime.rows() != list_runtime.pixels:
+        raise AssertionError("the framebuffer drew a different display")
+    print(f"  list display  {list_time * 1e3:9.2f} ms")
+    print(f"  framebuffer   {framebuffer_time * 1e3:9.2f} ms  speedup x{list_time / framebuffer_time:.1f}")
+
+
+DELAY_PROGRAM = '''
+for (let j:int = 0; j < 10000; j = j + 1) {
+    __write_box 0, 0, 4, 4, ((j * 4099) as colour);
+    __delay 500;
+}
+'''
+
+
+def bench_clock(repeats=3):
+    print("Virtual clock benchmark (10000 frames of __delay 500)")
+    compiled = compile_source(DELAY_PROGRAM)
+
+    def run():
+        runtime = Runtime(out=io.StringIO(), clock=VirtualClock())
+        VM(runtime).run(compiled)
+        return runtime
+    run_time, runtime = best_of(repeats, run)
+    if runtime.frame_times != [j * 500 for j in range(10000)]:
+        raise AssertionError("the virtual clock stamped frames off the 500 ms timeline")
+    print(f"  virtual  {run_time * 1e3:9.2f} ms for {runtime.clock.now() / 1000:.0f} s of program time")
+
+
+SPRITE_PROGRAM = '''
+let w:int = __width;
+let h:int = __height;
+__write_box 0, 0, w, h, #202020;
+for (let frame:int = 0; frame < 500; frame = frame + 1) {
+    __write_box frame, 100, 16, 16, #ffcc00;
+    __write frame, 300, #ffffff;
+    __print frame;
+    __delay 16;
+}
+'''
+
+
+class FullFrameRuntime(FramebufferRuntime):
+    # The baseline RecordingRuntime is measured against: writes the whole display, and every line of output, as
+    # it goes
+    def __init__(self, frame_file, **kwargs):
+        super().__init__(**kwargs)
+        self.frame_file = frame_file
+
+    def end_frame(self):
+        super().end_frame()
+        self.frame_file.write(encode_pixels(self.pixels))
+
+    def print_value(self, value, value_type):
+        super().print_value(value, value_type)
+        self.out.flush()
+
+
+def bench_frames(repeats=3, size=(640, 480)):
+    width, height = size
+    print(f"Frame recording benchmark (500 frames of a moving sprite on a {width}x{height} display)")
+    compiled = compile_source(SPRITE_PROGRAM)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "frames")
+        results = {}
+        for name, runtime_class in (("full frames", FullFrameRuntime), ("delta frames", RecordingRuntime)):
+            def run():
+                with open(path, "wb") as frame_file, open(os.devnull, "w") as out:
+                    runtime = runtime_class(frame_file, width=width, height=height, out=out, clock=VirtualClock())
+                    VM(runtime).run(compiled)
+                    runtime.close()
+            run_time, _ = best_of(repeats, run)
+            results[name] = run_time, os.path.getsize(path)
+    full_time, full_size = results["full frames"]
+    delta_time, delta_size = results["delta frames"]
+    print(f"  full frames   {full_time * 1e3:9.2f} ms  {full_size / 1e6:9.3f} MB")
+    print(f"  delta frames  {delta_time * 1e3:9.2f} ms  {delta_size / 1e6:9.3f} MB  "
+          f"speedup x{full_time / delta_time:.1f}, x{full_size / delta_size:.0f} smaller")
+
+
+ANIMATION_PROGRAM = '''
+for (let j:int = 0; j < 10; j = j + 1) {
+    for (let x:int = 0; x < 36; x = x + 1) {
+        __write x, j, ((x * j * 4099) as colour);
+    }
+    __print j;
+    __delay 50;
+}
+'''
+
+
+def bench_async(programs=500):
+    print(f"Asyncio runtime benchmark ({programs} programs of 10 frames 50 ms apart, on real clocks)")
+    sources = [(f"program {n}", ANIMATION_PROGRAM) for n in range(programs)]
+    start = time.perf_counter()
+    results = asyncio.run(run_programs(sources, lambda: Runtime(out=io.StringIO(), clock=RealClock())))
+    elapsed = time.perf_counter() - start
+    for name, runtime, error in results:
+        if error is not None or runtime.out.getvalue() != "".join(f"{j}\n" for j in range(10)):
+            raise AssertionError(f"{name} did not run to the end: {error}")
+    delayed = programs * 10 * 50 / 1000
+    print(f"  {delayed:.0f} s of delays run in {elapsed:.2f} s  x{delayed / elapsed:.0f} over running them in turn")
+
+
+# Full-screen programs of the kind vectorize lowers
+PIXEL_LOOP_PROGRAMS = {
+    "gradient": '''
+let w:int = __width;
+let h:int = __height;
+for (let y:int = 0; y < h; y = y + 1) {
+    for (let x:int = 0; x < w; x = x + 1) {
+        let c:colour = ((x * 255 / w) * 65536 + (y * 255 / h) * 256 + 128) as colour;
+        __write x, y, c;
+    }
+}
+__print __read 320, 240;
+''',
+    "fill": '''
+let w:int = __width;
+let h:int = __height;
+let c:colour = #3366cc;
+for (let x:int = 0; x < w; x = x + 1) {
+    for (let y:int = 0; y < h; y = y + 1) {
+        __write x, y, c;
+    }
+}
+__print __read 320, 240;
+''',
+    "animation": '''
+let w:int = __width;
+let h:int = __height;
+for (let frame:int = 0; frame < 10; frame = frame + 1) {
+    for (let y:int = 0; y < h; y = y + 2) {
+        for (let x:int = 0; x < w; x = x + 1) {
+            __write x, y, ((x * 7 + y * 3 + frame) * 4099) as colour;
+        }
+    }
+}
+__print __read 320, 240;
+''',
+}
+
+
+def bench_vectorize(repeats=3, size=(640, 480)):
+    width, height = size
+    print(f"Pixel loop vectorisation benchmark (closures on a {width}x{height} framebuffer)")
+    for name, src in PIXEL_LOOP_PROGRAMS.items():
+        program = Parser(Lexer(engine="compiled").GenerateTokenStream(src)).parse()
+        SemanticAnalyzer().visit(program)
+        results = {}
+        for compiler_class in (closure_engine.ClosureCompiler, vectorize.VectorizingCompiler):
+            runtime = FramebufferRuntime(width, height, out=io.StringIO(), clock=VirtualClock())
+            compiler = compiler_class(runtime)
+            compiled = compiler.compile(program)
+            run_time, _ = best_of(repeats, compiled.run)
+            results[compiler_class] = run_time, runtime, compiler
+        scalar_time, scalar_runtime, _ = results[closure_engine.ClosureCompiler]
+        vector_time, vector_runtime, compiler = results[vectorize.VectorizingCompiler]
+        if vector_runtime.out.getvalue() != scalar_runtime.out.getvalue() \
+                or not (vector_runtime.pixels == scalar_runtime.pixels).all():
+            raise AssertionError(f"Vectorised {name} drew a different display")
+        print(f"  {name:10}  scalar {scalar_time * 1e3:9.2f} ms  vectorised {vector_time * 1e3:8.2f} ms"
+              f"  speedup x{scalar_time / vector_time:.0f}  ({compiler.lowered} loops lowered)")
+
+
+BENCHMARKS = {
+    "lexer": bench_lexer,
+    "streaming": bench_streaming,
+    "token_memory": bench_token_memory,
+    "incremental": bench_incremental,
+    "batch": bench_batch,
+    "expressions": bench_expressions,
+    "statements": bench_statements,
+    "nesting": bench_nesting,
+    "ast_memory": bench_ast_memory,
+    "cache": bench_cache,
+    "vm": bench_vm,
+    "closures": bench_closures,
+    "transpiler": bench_transpiler,
+    "optimizer": bench_optimizer,
+    "ir": bench_ir,
+    "framebuffer": bench_framebuffer,
+    "clock": bench_clock,
+    "frames": bench_frames,
+    "async": bench_async,
+    "vectorize": bench_vectorize,
+}
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        BENCHMARKS[name]()
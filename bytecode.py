@@ -0,0 +1,382 @@
+from array import array
+
+from lexer import Lexer
+from LLK_Parser import Parser
+from Semantic_Analyzer import SemanticAnalyzer, BUILTIN_SIGNATURES
+from optimizer import Optimizer
+from runtime import default_value
+from parser_nodes import BinaryOpNode, IdentifierNode, LiteralNode
+from visitor import NodeVisitor
+
+# Every instruction is two ints, an opcode and its argument (0 when it takes none)
+OPCODE_NAMES = [
+    'LOAD_LOCAL', 'STORE_LOCAL', 'LOAD_GLOBAL', 'STORE_GLOBAL', 'CONST', 'POP',
+    'ADD', 'SUB', 'MUL', 'DIV', 'DIV_INT', 'NEG', 'NOT', 'AND', 'OR',
+    'LT', 'LE', 'GT', 'GE', 'EQ', 'NE',
+    'JUMP', 'JUMP_IF_FALSE', 'CALL', 'RETURN', 'HALT',
+    'TO_INT', 'TO_FLOAT', 'TO_BOOL',
+    'PRINT', 'DELAY', 'WRITE', 'WRITE_BOX', 'READ', 'RANDOM_INT', 'WIDTH', 'HEIGHT',
+    # Superinstructions for the commonest sequences in loops: two locals loaded at once, a comparison fused with
+    # the jump taken when it is false, and a local incremented by a constant. Their argument packs two numbers
+    # as first | second << 16.
+    'LOAD_LOCAL_PAIR', 'INCREMENT_LOCAL',
+    'JUMP_IF_NOT_LT', 'JUMP_IF_NOT_LE', 'JUMP_IF_NOT_GT', 'JUMP_IF_NOT_GE', 'JUMP_IF_NOT_EQ', 'JUMP_IF_NOT_NE',
+]
+for _opcode, _name in enumerate(OPCODE_NAMES):
+    globals()[_name] = _opcode
+
+BINARY_OPCODES = {'+': ADD, '-': SUB, '*': MUL, '/': DIV, '<': LT, '<=': LE, '>': GT, '>=': GE,
+                  '==': EQ, '!=': NE, 'and': AND, 'or': OR}
+UNARY_OPCODES = {'-': NEG, 'not': NOT}
+CAST_OPCODES = {'int': TO_INT, 'colour': TO_INT, 'float': TO_FLOAT, 'bool': TO_BOOL}
+BUILTIN_OPCODES = {'__random_int': RANDOM_INT, '__randi': RANDOM_INT, '__width': WIDTH, '__height': HEIGHT,
+                   '__read': READ}
+WRITE_OPCODES = {3: WRITE, 5: WRITE_BOX}
+COMPARE_JUMP_OPCODES = {'<': JUMP_IF_NOT_LT, '<=': JUMP_IF_NOT_LE, '>': JUMP_IF_NOT_GT, '>=': JUMP_IF_NOT_GE,
+                        '==': JUMP_IF_NOT_EQ, '!=': JUMP_IF_NOT_NE}
+# Largest number that fits in either half of a packed argument
+PACKED_LIMIT = 0xFFFF
+# Argument of PRINT, the PArL type of the value printed
+VALUE_TYPES = ['int', 'float', 'bool', 'colour']
+
+class CodeObject:
+    # The instructions of one function, or of the main program, with the size of its frame of locals.
+    # local_names names every frame slot, for the disassembler.
+    def __init__(self, name, param_count=0):
+        self.name = name
+        self.param_count = param_count
+        self.code = array('i')
+        self.frame_size = param_count
+        self.local_names = {}
+
+class CompiledProgram:
+    def __init__(self, main, functions, constants, global_names):
+        self.main = main
+        self.functions = functions
+        self.constants = constants
+        self.global_names = global_names
+
+class CompileError(Exception):
+    pass
+
+class FrameLayout:
+    # Assigns frame slots to the names declared in one function, or in the main program, from the (depth, slot)
+    # bindings the SemanticAnalyzer gave them. A name's frame slot is the one its scope starts at plus its slot in
+    # the scope, and a scope starts after the names its parent had declared when it was entered, so sibling
+    # scopes share frame slots, as only one of them is live at a time. Names at depth 0 are globals and have no
+    # frame slot. frame_depth is the depth of the outermost scope of the frame.
+    def __init__(self, frame_depth=1):
+        self.frame_depth = frame_depth
+        # Frame slot of each open scope and the number of names declared in it so far, from the outermost in
+        self.scope_bases = []
+        self.scope_counts = []
+        self.size = 0
+        self.names = {}
+
+    def enter_scope(self):
+        if self.scope_bases:
+            self.scope_bases.append(self.scope_bases[-1] + self.scope_counts[-1])
+        else:
+            self.scope_bases.append(0)
+        self.scope_counts.append(0)
+
+    def exit_scope(self):
+        self.scope_bases.pop()
+        self.scope_counts.pop()
+
+    def nested(self):
+        # The layout of a function declared in the innermost open scope
+        return FrameLayout(self.frame_depth + len(self.scope_bases))
+
+    def slot(self, name, binding, declaring=False):
+        # The frame slot of a name, or None for a global
+        if binding is None:
+            raise CompileError(f"Variable '{name}' was not resolved; run the SemanticAnalyzer first")
+        depth, slot = binding
+        if depth == 0:
+            return None
+        if depth < self.frame_depth:
+            raise CompileError(f"Variable '{name}' belongs to an enclosing function")
+        scope = depth - self.frame_depth
+        if declaring:
+            self.scope_counts[scope] = max(self.scope_counts[scope], slot + 1)
+        index = self.scope_bases[scope] + slot
+        self.size = max(self.size, index + 1)
+        self.names.setdefault(index, name)
+        return index
+
+class Compiler(NodeVisitor):
+    # Lowers an analysed AST, whose names carry their (depth, slot) bindings and whose expressions carry their
+    # types, to bytecode. Globals, the names declared at depth 0, live in one array and every other name in the
+    # frame of its function or of the main program, laid out by a FrameLayout.
+    def __init__(self):
+        self.constants = []
+        self.constant_index = {}
+        self.functions = []
+        self.function_indices = {}
+        self.global_names = {}
+        self.code_object = None
+        self.layout = FrameLayout()
+
+    def compile(self, program):
+        main = CodeObject('<main>')
+        self.code_object = main
+        self.visit(program)
+        self.emit(HALT)
+        self.finish_frame(main, self.layout)
+        for name, index in self.function_indices.items():
+            if self.functions[index] is None:
+                raise CompileError(f"Function '{name}' is called but never declared")
+        # Slots of globals that an optimiser removed are left as gaps
+        global_names = [None] * (max(self.global_names, default=-1) + 1)
+        for slot, name in self.global_names.items():
+            global_names[slot] = name
+        return CompiledProgram(main, self.functions, self.constants, global_names)
+
+    def emit(self, opcode, arg=0):
+        code = self.code_object.code
+        code.append(opcode)
+        code.append(arg)
+        return len(code) - 1
+
+    def patch(self, position, target):
+        self.code_object.code[position] = target
+
+    def here(self):
+        return len(self.code_object.code)
+
+    def constant(self, value):
+        # Keyed by type as well, since True, 1 and 1.0 are equal
+        key = (type(value), value)
+        if key not in self.constant_index:
+            self.constant_index[key] = len(self.constants)
+            self.constants.append(value)
+        return self.constant_index[key]
+
+    def finish_frame(self, code_object, layout):
+        code_object.frame_size = max(layout.size, code_object.param_count)
+        code_object.local_names = layout.names
+
+    def function_index(self, name):
+        if name not in self.function_indices:
+            self.function_indices[name] = len(self.functions)
+            self.functions.append(None)
+        return self.function_indices[name]
+
+    def variable(self, name, binding, declaring=False):
+        # (load opcode, store opcode, slot) of a variable
+        index = self.layout.slot(name, binding, declaring)
+        if index is None:
+            self.global_names.setdefault(binding[1], name)
+            return LOAD_GLOBAL, STORE_GLOBAL, binding[1]
+        return LOAD_LOCAL, STORE_LOCAL, index
+
+    def generic_visit(self, node):
+        raise CompileError(f"Cannot compile {type(node).__name__}")
+
+    def visit_ErrorNode(self, node):
+        raise CompileError(f"Cannot compile a program with errors: {node.message}")
+
+    def visit_ProgramNode(self, node):
+        for stmt in node.statements:
+            yield stmt
+
+    def visit_FunctionDeclNode(self, node):
+        code_object = CodeObject(node.identifier, len(node.params))
+        self.functions[self.function_index(node.identifier)] = code_object
+        saved = self.code_object, self.layout
+        self.code_object = code_object
+        self.layout = self.layout.nested()
+        self.layout.enter_scope()
+        for param in node.params:
+            self.variable(param.identifier, param.binding, declaring=True)
+        yield node.block
+        # Falling off the end of a function returns its type's default value
+        self.emit(CONST, self.constant(default_value(node.return_type)))
+        self.emit(RETURN)
+        self.finish_frame(code_object, self.layout)
+        self.code_object, self.layout = saved
+
+    def visit_BlockNode(self, node):
+        self.layout.enter_scope()
+        for stmt in node.statements:
+            yield stmt
+        self.layout.exit_scope()
+
+    def visit_VariableDeclNode(self, node):
+        if node.expr is not None:
+            yield node.expr
+        else:
+            self.emit(CONST, self.constant(default_value(node.var_type)))
+        _, store, slot = self.variable(node.identifier, node.binding, declaring=True)
+        self.emit(store, slot)
+
+    def visit_AssignmentNode(self, node):
+        _, store, slot = self.variable(node.identifier, node.binding)
+        expr = node.expr
+        if (store == STORE_LOCAL and isinstance(expr, BinaryOpNode) and expr.operator == '+'
+                and isinstance(expr.left, IdentifierNode) and expr.left.binding == node.binding
+                and isinstance(expr.right, LiteralNode) and expr.right.expr_type in ('int', 'float')):
+            constant = self.constant(expr.right.value)
+            if slot <= PACKED_LIMIT and constant <= PACKED_LIMIT:
+                self.emit(INCREMENT_LOCAL, slot | constant << 16)
+                return
+        yield expr
+        self.emit(store, slot)
+
+    def condition_jump(self, condition):
+        # Compiles a condition followed by a jump taken when it is false, and returns the jump's argument position
+        if isinstance(condition, BinaryOpNode) and condition.operator in COMPARE_JUMP_OPCODES:
+            yield from self.operands(condition)
+            return self.emit(COMPARE_JUMP_OPCODES[condition.operator])
+        yield condition
+        return self.emit(JUMP_IF_FALSE)
+
+    def visit_ReturnStatementNode(self, node):
+        yield node.expr
+        self.emit(RETURN)
+
+    def visit_IfStatementNode(self, node):
+        skip_if = yield from self.condition_jump(node.condition)
+        yield node.if_block
+        if node.else_block:
+            skip_else = self.emit(JUMP)
+            self.patch(skip_if, self.here())
+            yield node.else_block
+            self.patch(skip_else, self.here())
+        else:
+            self.patch(skip_if, self.here())
+
+    def visit_WhileStatementNode(self, node):
+        top = self.here()
+        exit_jump = yield from self.condition_jump(node.condition)
+        yield node.block
+        self.emit(JUMP, top)
+        self.patch(exit_jump, self.here())
+
+    def visit_ForStatementNode(self, node):
+        self.layout.enter_scope()
+        if node.init:
+            yield node.init
+        top = self.here()
+        exit_jump = yield from self.condition_jump(node.condition)
+        yield node.block
+        if node.post:
+            yield node.post
+        self.emit(JUMP, top)
+        self.patch(exit_jump, self.here())
+        self.layout.exit_scope()
+
+    def visit_PrintStatementNode(self, node):
+        yield node.expr
+        self.emit(PRINT, VALUE_TYPES.index(node.expr.expr_type))
+
+    def visit_DelayStatementNode(self, node):
+        yield node.expr
+        self.emit(DELAY)
+
+    def visit_WriteStatementNode(self, node):
+        if len(node.args) not in WRITE_OPCODES:
+            raise CompileError(f"__write takes 3 arguments and __write_box 5, not {len(node.args)}")
+        for arg in node.args:
+            yield arg
+        self.emit(WRITE_OPCODES[len(node.args)])
+
+    def operands(self, node):
+        # Compiles the operands of a binary operation, loading two locals with a single instruction
+        left, right = node.left, node.right
+        if isinstance(left, IdentifierNode) and isinstance(right, IdentifierNode):
+            left_load, _, left_slot = self.variable(left.name, left.binding)
+            right_load, _, right_slot = self.variable(right.name, right.binding)
+            if left_load == right_load == LOAD_LOCAL and max(left_slot, right_slot) <= PACKED_LIMIT:
+                self.emit(LOAD_LOCAL_PAIR, left_slot | right_slot << 16)
+            else:
+                self.emit(left_load, left_slot)
+                self.emit(right_load, right_slot)
+        else:
+            yield left
+            yield right
+
+    def visit_BinaryOpNode(self, node):
+        yield from self.operands(node)
+        opcode = BINARY_OPCODES[node.operator]
+        if opcode == DIV and node.expr_type in ('int', 'colour'):
+            opcode = DIV_INT
+        self.emit(opcode)
+
+    def visit_UnaryOpNode(self, node):
+        yield node.operand
+        self.emit(UNARY_OPCODES[node.operator])
+
+    def visit_LiteralNode(self, node):
+        self.emit(CONST, self.constant(node.value))
+
+    def visit_IdentifierNode(self, node):
+        load, _, slot = self.variable(node.name, node.binding)
+        self.emit(load, slot)
+
+    def visit_FunctionCallNode(self, node):
+        for arg in node.args:
+            yield arg
+        if node.name in BUILTIN_SIGNATURES:
+            self.emit(BUILTIN_OPCODES[node.name])
+        else:
+            self.emit(CALL, self.function_index(node.name))
+
+    def visit_CastNode(self, node):
+        yield node.expr
+        source_type, target_type = node.expr.expr_type, node.target_type
+        # Colours are ints at run time
+        if source_type != target_type and {source_type, target_type} != {'int', 'colour'}:
+            self.emit(CAST_OPCODES[target_type])
+
+def compile_program(program, optimize=False):
+    # Analyses the AST, which raises on the first error, optionally optimises it in place, and compiles it
+    SemanticAnalyzer().visit(program)
+    if optimize:
+        Optimizer().optimize(program)
+    return Compiler().compile(program)
+
+def compile_source(src_program_str, lexer=None, optimize=False):
+    lexer = lexer or Lexer(engine="compiled")
+    return compile_program(Parser(lexer.GenerateTokenStream(src_program_str)).parse(), optimize)
+
+JUMP_OPCODES = frozenset({JUMP, JUMP_IF_FALSE}) | frozenset(COMPARE_JUMP_OPCODES.values())
+# Opcodes whose argument means something, and so is shown by the disassembler
+ARG_OPCODES = frozenset({LOAD_LOCAL, STORE_LOCAL, LOAD_GLOBAL, STORE_GLOBAL, CONST, CALL, PRINT,
+                         LOAD_LOCAL_PAIR, INCREMENT_LOCAL}) | JUMP_OPCODES
+
+def disassemble(compiled):
+    # The program as text, one instruction per line, each code object under a heading
+    lines = []
+    for code_object in [compiled.main] + compiled.functions:
+        lines.append(f"{code_object.name}: {code_object.param_count} params, {code_object.frame_size} locals")
+        code = code_object.code
+        targets = {code[position + 1] for position in range(0, len(code), 2) if code[position] in JUMP_OPCODES}
+        for position in range(0, len(code), 2):
+            opcode, arg = code[position], code[position + 1]
+            marker = ">>" if position in targets else "  "
+            text = f"  {marker} {position:5}  {OPCODE_NAMES[opcode]:16}"
+            if opcode in ARG_OPCODES:
+                text += f"{arg:8}  {describe_arg(compiled, code_object, opcode, arg)}".rstrip()
+            lines.append(text.rstrip())
+        lines.append("")
+    return "\n".join(lines)
+
+def describe_arg(compiled, code_object, opcode, arg):
+    if opcode in (LOAD_LOCAL, STORE_LOCAL):
+        return f"({code_object.local_names.get(arg, '?')})"
+    if opcode in (LOAD_GLOBAL, STORE_GLOBAL):
+        return f"({compiled.global_names[arg]})"
+    if opcode == CONST:
+        return f"({compiled.constants[arg]!r})"
+    if opcode == CALL:
+        return f"({compiled.functions[arg].name})"
+    if opcode == PRINT:
+        return f"({VALUE_TYPES[arg]})"
+    if opcode == LOAD_LOCAL_PAIR:
+        names = code_object.local_names
+        return f"({names.get(arg & PACKED_LIMIT, '?')}, {names.get(arg >> 16, '?')})"
+    if opcode == INCREMENT_LOCAL:
+        return f"({code_object.local_names.get(arg & PACKED_LIMIT, '?')} += {compiled.constants[arg >> 16]!r})"
+    return ""
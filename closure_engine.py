@@ -0,0 +1,332 @@
+import operator
+
+from lexer import Lexer
+from LLK_Parser import Parser
+from Semantic_Analyzer import SemanticAnalyzer
+from bytecode import CompileError, FrameLayout
+from parser_nodes import BinaryOpNode, IdentifierNode, LiteralNode
+from runtime import Runtime, BINARY_OPERATORS, default_value
+from visitor import NodeVisitor
+from vm import VMError
+
+CASTS = {'int': int, 'colour': int, 'float': float, 'bool': bool}
+
+class Function:
+    # A compiled PArL function. Filled in when its declaration is compiled, which may be after calls to it.
+    __slots__ = ('name', 'body', 'padding', 'default')
+
+    def __init__(self, name):
+        self.name = name
+        self.body = None
+        self.padding = []
+        self.default = None
+
+class ClosureProgram:
+    # The main program as a closure over a frame list, ready to run any number of times. global_values holds the
+    # values of the global variables once it has run.
+    def __init__(self, main, frame_size, global_values):
+        self.main = main
+        self.frame_size = frame_size
+        self.global_values = global_values
+
+    def run(self):
+        self.global_values[:] = [None] * len(self.global_values)
+        try:
+            self.main([None] * self.frame_size)
+        except ZeroDivisionError:
+            raise VMError("Division by zero") from None
+        except RecursionError:
+            # PArL calls are Python calls here, so they only nest as deep as Python's recursion limit
+            raise VMError("Recursion too deep") from None
+
+def run_block(statements):
+    if not statements:
+        return lambda frame: None
+    if len(statements) == 1:
+        return statements[0]
+
+    def block(frame):
+        for statement in statements:
+            result = statement(frame)
+            if result is not None:
+                return result
+    return block
+
+class ClosureCompiler(NodeVisitor):
+    # Turns an analysed AST into nested closures, once, so that running it never dispatches on node types: every
+    # node becomes a callable taking the current frame, a list of locals laid out by a FrameLayout, with its
+    # children, operator and slots bound in. Statements return None, or the value of a return statement to
+    # unwind to the enclosing call, which no PArL value is confused with. Operands that are locals or literals
+    # are read inline rather than through closures of their own. Closures call each other, so programs nested or
+    # recursing deeper than the Python recursion limit need the VM.
+    def __init__(self, runtime=None):
+        self.runtime = runtime or Runtime()
+        self.global_values = []
+        self.functions = {}
+        self.layout = FrameLayout()
+
+    def compile(self, program):
+        main = self.visit(program)
+        for function in self.functions.values():
+            if function.body is None:
+                raise CompileError(f"Function '{function.name}' is called but never declared")
+        return ClosureProgram(main, self.layout.size, self.global_values)
+
+    def function(self, name):
+        if name not in self.functions:
+            self.functions[name] = Function(name)
+        return self.functions[name]
+
+    def slot(self, name, binding, declaring=False):
+        # The frame slot of a local, or None for a global, whose list is grown to fit it
+        index = self.layout.slot(name, binding, declaring)
+        if index is None and binding[1] >= len(self.global_values):
+            self.global_values.extend([None] * (binding[1] + 1 - len(self.global_values)))
+        return index
+
+    def load(self, node):
+        # A closure reading a variable
+        index = self.slot(node.name, node.binding)
+        if index is None:
+            global_values, index = self.global_values, node.binding[1]
+            return lambda frame: global_values[index]
+        return lambda frame: frame[index]
+
+    def store(self, name, binding, expr, declaring=False):
+        index = self.slot(name, binding, declaring)
+        if index is None:
+            global_values, index = self.global_values, binding[1]
+
+            def store_global(frame):
+                global_values[index] = expr(frame)
+            return store_global
+
+        def store_local(frame):
+            frame[index] = expr(frame)
+        return store_local
+
+    def local_index(self, node):
+        # The frame slot of an expression that is a local variable, or None
+        if isinstance(node, IdentifierNode):
+            return self.slot(node.name, node.binding)
+        return None
+
+    def constant_value(self, node):
+        # (True, value) for a literal expression, or (False, None)
+        if isinstance(node, LiteralNode):
+            return True, node.value
+        return False, None
+
+    def generic_visit(self, node):
+        raise CompileError(f"Cannot compile {type(node).__name__}")
+
+    def visit_ErrorNode(self, node):
+        raise CompileError(f"Cannot compile a program with errors: {node.message}")
+
+    def visit_ProgramNode(self, node):
+        statements = []
+        for stmt in node.statements:
+            statement = yield stmt
+            if statement is not None:
+                statements.append(statement)
+        return run_block(statements)
+
+    def visit_FunctionDeclNode(self, node):
+        # Compiled into its Function; the declaration itself does nothing when run
+        function = self.function(node.identifier)
+        saved = self.layout
+        self.layout = layout = saved.nested()
+        layout.enter_scope()
+        for param in node.params:
+            self.slot(param.identifier, param.binding, declaring=True)
+        function.body = yield node.block
+        function.padding = [None] * (layout.size - len(node.params))
+        function.default = default_value(node.return_type)
+        self.layout = saved
+        return None
+
+    def visit_BlockNode(self, node):
+        self.layout.enter_scope()
+        statements = []
+        for stmt in node.statements:
+            statement = yield stmt
+            if statement is not None:
+                statements.append(statement)
+        self.layout.exit_scope()
+        return run_block(statements)
+
+    def visit_VariableDeclNode(self, node):
+        if node.expr is not None:
+            expr = yield node.expr
+        else:
+            value = default_value(node.var_type)
+            expr = lambda frame: value
+        return self.store(node.identifier, node.binding, expr, declaring=True)
+
+    def visit_AssignmentNode(self, node):
+        expr = node.expr
+        index = self.slot(node.identifier, node.binding)
+        if (index is not None and isinstance(expr, BinaryOpNode) and expr.operator == '+'
+                and self.local_index(expr.left) == index
+                and isinstance(expr.right, LiteralNode) and expr.right.expr_type in ('int', 'float')):
+            step = expr.right.value
+
+            def increment(frame):
+                frame[index] = frame[index] + step
+            return increment
+        expr = yield expr
+        return self.store(node.identifier, node.binding, expr)
+
+    def visit_ReturnStatementNode(self, node):
+        return (yield node.expr)
+
+    def visit_IfStatementNode(self, node):
+        condition = yield node.condition
+        if_block = yield node.if_block
+        if not node.else_block:
+            def run_if(frame):
+                if condition(frame):
+                    return if_block(frame)
+            return run_if
+        else_block = yield node.else_block
+
+        def run_if_else(frame):
+            if condition(frame):
+                return if_block(frame)
+            return else_block(frame)
+        return run_if_else
+
+    def visit_WhileStatementNode(self, node):
+        condition = yield node.condition
+        block = yield node.block
+
+        def run_while(frame):
+            while condition(frame):
+                result = block(frame)
+                if result is not None:
+                    return result
+        return run_while
+
+    def visit_ForStatementNode(self, node):
+        self.layout.enter_scope()
+        init = (yield node.init) if node.init else (lambda frame: None)
+        condition = yield node.condition
+        block = yield node.block
+        post = (yield node.post) if node.post else (lambda frame: None)
+        self.layout.exit_scope()
+
+        def run_for(frame):
+            init(frame)
+            while condition(frame):
+                result = block(frame)
+                if result is not None:
+                    return result
+                post(frame)
+        return run_for
+
+    def visit_PrintStatementNode(self, node):
+        expr = yield node.expr
+        print_value, value_type = self.runtime.print_value, node.expr.expr_type
+
+        def run_print(frame):
+            print_value(expr(frame), value_type)
+        return run_print
+
+    def visit_DelayStatementNode(self, node):
+        expr = yield node.expr
+        delay = self.runtime.delay
+
+        def run_delay(frame):
+            delay(expr(frame))
+        return run_delay
+
+    def visit_WriteStatementNode(self, node):
+        args = []
+        for arg in node.args:
+            args.append((yield arg))
+        if len(args) == 3:
+            write, (x, y, colour) = self.runtime.write, args
+
+            def run_write(frame):
+                write(x(frame), y(frame), colour(frame))
+            return run_write
+        if len(args) == 5:
+            write_box, (x, y, width, height, colour) = self.runtime.write_box, args
+
+            def run_write_box(frame):
+                write_box(x(frame), y(frame), width(frame), height(frame), colour(frame))
+            return run_write_box
+        raise CompileError(f"__write takes 3 arguments and __write_box 5, not {len(args)}")
+
+    def visit_BinaryOpNode(self, node):
+        op = BINARY_OPERATORS[node.operator]
+        if node.operator == '/' and node.expr_type in ('int', 'colour'):
+            op = operator.floordiv
+        left_index, right_index = self.local_index(node.left), self.local_index(node.right)
+        right_is_constant, right_value = self.constant_value(node.right)
+        if left_index is not None and right_index is not None:
+            return lambda frame: op(frame[left_index], frame[right_index])
+        if left_index is not None and right_is_constant:
+            return lambda frame: op(frame[left_index], right_value)
+        left = yield node.left
+        if right_is_constant:
+            return lambda frame: op(left(frame), right_value)
+        right = yield node.right
+        return lambda frame: op(left(frame), right(frame))
+
+    def visit_UnaryOpNode(self, node):
+        operand = yield node.operand
+        if node.operator == 'not':
+            return lambda frame: not operand(frame)
+        return lambda frame: -operand(frame)
+
+    def visit_LiteralNode(self, node):
+        _, value = self.constant_value(node)
+        return lambda frame: value
+
+    def visit_IdentifierNode(self, node):
+        return self.load(node)
+
+    def visit_FunctionCallNode(self, node):
+        args = []
+        for arg in node.args:
+            args.append((yield arg))
+        runtime = self.runtime
+        if node.name in ('__random_int', '__randi'):
+            random_int, (upper,) = runtime.random_int, args
+            return lambda frame: random_int(upper(frame))
+        if node.name == '__width':
+            return lambda frame: runtime.width
+        if node.name == '__height':
+            return lambda frame: runtime.height
+        if node.name == '__read':
+            read, (x, y) = runtime.read, args
+            return lambda frame: read(x(frame), y(frame))
+
+        function = self.function(node.name)
+
+        def call(frame):
+            result = function.body([arg(frame) for arg in args] + function.padding)
+            return function.default if result is None else result
+        return call
+
+    def visit_CastNode(self, node):
+        expr = yield node.expr
+        source_type, target_type = node.expr.expr_type, node.target_type
+        # Colours are ints at run time
+        if source_type == target_type or {source_type, target_type} == {'int', 'colour'}:
+            return expr
+        cast = CASTS[target_type]
+        return lambda frame: cast(expr(frame))
+
+def compile_program(program, runtime=None):
+    # Analyses the AST, which raises on the first error, and compiles it
+    SemanticAnalyzer().visit(program)
+    return ClosureCompiler(runtime).compile(program)
+
+def run_source(src_program_str, runtime=None, lexer=None):
+    # Compiles and runs a program, and returns the ClosureProgram that ran
+    lexer = lexer or Lexer(engine="compiled")
+    compiled = compile_program(Parser(lexer.GenerateTokenStream(src_program_str)).parse(), runtime)
+    compiled.run()
+    return compiled
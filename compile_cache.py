@@ -0,0 +1,199 @@
+import hashlib
+import marshal
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from collections import OrderedDict
+
+import ast_arena
+import lexer
+import LLK_Parser
+import parser_nodes
+from ast_arena import AstArena, NODE_CLASSES
+from lexer import Lexer, TokenStream, TOKEN_KINDS, SYMBOL_KINDS
+from LLK_Parser import Parser
+
+CACHE_FORMAT_VERSION = 1
+ENTRY_SUFFIX = ".parlc"
+ENTRY_MAGIC = b"PARLC\x00\x00\x01"
+# Magic, SHA-256 of the source, seconds the lex and parse took, then the byte length of each stored column
+ENTRY_HEADER = struct.Struct("<8s32sd9Q")
+
+def compiler_fingerprint(lexer_tables):
+    # Changes whenever anything that shapes the cached tokens and trees does: the lexer's transition table and
+    # token kinds, the node definitions, or the code of the lexer, the parser and the packed format
+    digest = hashlib.sha256()
+    digest.update(repr((CACHE_FORMAT_VERSION, sys.byteorder,
+                        [array(code).itemsize for code in "BlLiI"],
+                        lexer_tables.Tx, lexer_tables.states_accp, lexer_tables.lexeme_list,
+                        TOKEN_KINDS, sorted(SYMBOL_KINDS.items()),
+                        [(node_class.__name__, node_class.__slots__) for node_class in NODE_CLASSES])).encode())
+    for module in (lexer, LLK_Parser, parser_nodes, ast_arena):
+        with open(module.__file__, "rb") as src_file:
+            digest.update(src_file.read())
+    return digest.hexdigest()
+
+class CompileCache:
+    # Lexer output and parse trees of source files, kept on disk and keyed by the hash of the source and of
+    # the compiler. An entry holds the TokenStream columns and the AstArena of the tree as raw arrays, which
+    # are read back through mmap. Entries made by a different compiler are removed when the cache is opened,
+    # and the least recently used ones are evicted to keep the directory under max_bytes.
+    def __init__(self, directory, max_bytes=256 << 20, lexer=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lexer = lexer or Lexer(engine="compiled")
+        self.fingerprint = compiler_fingerprint(self.lexer)
+        # Entry file name -> size, least recently used first
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "invalidated": 0,
+                      "load_seconds": 0.0, "compile_seconds": 0.0, "saved_seconds": 0.0}
+        os.makedirs(directory, exist_ok=True)
+        self.scan()
+
+    def scan(self):
+        prefix = self.fingerprint[:16] + "-"
+        found = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(ENTRY_SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            if not name.startswith(prefix):
+                self.remove(path)
+                self.stats["invalidated"] += 1
+                continue
+            try:
+                status = os.stat(path)
+            except FileNotFoundError:
+                continue
+            found.append((status.st_mtime, name, status.st_size))
+        for _, name, size in sorted(found):
+            self.entries[name] = size
+            self.total_bytes += size
+
+    def entry_name(self, source_digest):
+        return f"{self.fingerprint[:16]}-{source_digest.hex()}{ENTRY_SUFFIX}"
+
+    def compile(self, src_program_str):
+        # (TokenStream, ProgramNode) of a program, from the cache when possible. Programs with syntax errors
+        # raise SyntaxError as usual and are not cached.
+        source_digest = hashlib.sha256(src_program_str.encode()).digest()
+        cached = self.load(src_program_str, source_digest)
+        if cached is not None:
+            return cached
+
+        self.stats["misses"] += 1
+        start = time.perf_counter()
+        tokens = self.lexer.GenerateTokenStream(src_program_str)
+        program = Parser(tokens).parse()
+        compile_seconds = time.perf_counter() - start
+        self.stats["compile_seconds"] += compile_seconds
+        self.store(source_digest, tokens, program, compile_seconds)
+        return tokens, program
+
+    def load(self, src_program_str, source_digest):
+        name = self.entry_name(source_digest)
+        path = os.path.join(self.directory, name)
+        start = time.perf_counter()
+        try:
+            with open(path, "rb") as entry_file, \
+                    mmap.mmap(entry_file.fileno(), 0, access=mmap.ACCESS_READ) as entry:
+                tokens, program, compile_seconds = self.decode(entry, src_program_str, source_digest)
+        except FileNotFoundError:
+            # Missing, or evicted by another process
+            return None
+        except (ValueError, EOFError, struct.error, IndexError, KeyError, TypeError):
+            # Damaged: cut short, overwritten or not a cache entry at all, which the header, the columns or the
+            # tree they decode to gives away. It is removed and compiled again like a miss.
+            self.discard(name, path)
+            return None
+        load_seconds = time.perf_counter() - start
+        self.stats["hits"] += 1
+        self.stats["load_seconds"] += load_seconds
+        self.stats["saved_seconds"] += compile_seconds - load_seconds
+        self.touch(name, path)
+        return tokens, program
+
+    def decode(self, entry, src_program_str, source_digest):
+        magic, stored_digest, compile_seconds, *lengths = ENTRY_HEADER.unpack_from(entry)
+        if magic != ENTRY_MAGIC or stored_digest != source_digest:
+            raise ValueError("Not a cache entry for this source")
+        tokens = TokenStream(src_program_str)
+        arena = AstArena()
+        columns = [tokens.kinds, tokens.starts, tokens.lengths,
+                   arena.kinds, arena.starts, arena.ends, arena.first_fields, arena.fields]
+        with memoryview(entry) as view:
+            offset = ENTRY_HEADER.size
+            for column, length in zip(columns, lengths):
+                column.frombytes(view[offset:offset + length])
+                offset += length
+            arena.constants = marshal.loads(view[offset:offset + lengths[-1]])
+        return tokens, arena.to_tree(), compile_seconds
+
+    def store(self, source_digest, tokens, program, compile_seconds):
+        arena = AstArena.from_tree(program)
+        columns = [tokens.kinds, tokens.starts, tokens.lengths,
+                   arena.kinds, arena.starts, arena.ends, arena.first_fields, arena.fields]
+        blobs = [column.tobytes() for column in columns]
+        blobs.append(marshal.dumps(arena.constants))
+        header = ENTRY_HEADER.pack(ENTRY_MAGIC, source_digest, compile_seconds, *map(len, blobs))
+
+        name = self.entry_name(source_digest)
+        path = os.path.join(self.directory, name)
+        # Written to a private file first, so other processes never see a partial entry
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as entry_file:
+            entry_file.write(header)
+            for blob in blobs:
+                entry_file.write(blob)
+        os.replace(temp_path, path)
+
+        size = len(header) + sum(map(len, blobs))
+        self.total_bytes += size - self.entries.pop(name, 0)
+        self.entries[name] = size
+        self.stats["stores"] += 1
+        self.evict()
+
+    def touch(self, name, path):
+        # The modification time orders entries for eviction across processes and runs
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        if name in self.entries:
+            self.entries.move_to_end(name)
+
+    def evict(self):
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            name, size = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            self.remove(os.path.join(self.directory, name))
+            self.stats["evictions"] += 1
+
+    def discard(self, name, path):
+        self.total_bytes -= self.entries.pop(name, 0)
+        self.remove(path)
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        for name in list(self.entries):
+            self.remove(os.path.join(self.directory, name))
+        self.entries.clear()
+        self.total_bytes = 0
+
+    def format_stats(self):
+        stats = self.stats
+        lookups = stats["hits"] + stats["misses"]
+        hit_rate = stats["hits"] / lookups if lookups else 0.0
+        return (f"{stats['hits']} hits, {stats['misses']} misses ({hit_rate:.0%} hit rate), "
+                f"{stats['evictions']} evicted, {stats['invalidated']} invalidated, "
+                f"{len(self.entries)} entries in {self.total_bytes / 1e6:.1f} MB, "
+                f"{stats['saved_seconds']:.3f}s saved")
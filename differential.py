@@ -0,0 +1,588 @@
+import asyncio
+import glob
+import io
+import os
+import random
+import sys
+
+from lexer import Lexer, GetSymbolKind, SymbolKind
+from LLK_Parser import Parser, DescentParser
+from ast_arena import AstArena
+from runtime import Runtime, VirtualClock
+from framebuffer import FramebufferRuntime
+from frames import record, read_frames
+from async_runtime import run_programs
+import vm
+import closure_engine
+import transpiler
+import ir
+import vectorize
+from parser_nodes import Node, ParamNode, VariableDeclNode, AssignmentNode, FunctionDeclNode, BlockNode, \
+    ReturnStatementNode, IfStatementNode, ForStatementNode, WhileStatementNode, PrintStatementNode, \
+    DelayStatementNode, WriteStatementNode
+
+STATEMENT_NODES = (FunctionDeclNode, BlockNode, VariableDeclNode, AssignmentNode, ReturnStatementNode, IfStatementNode,
+                   ForStatementNode, WhileStatementNode, PrintStatementNode, DelayStatementNode, WriteStatementNode)
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "programs_and_tests")
+
+# Fragments that exercise every DFA path, including the error recovery and the end of input cases
+LEXER_FRAGMENTS = ["fun", "let", "x", "_tmp1", "__write_box", "true", "and", " ", "\n", "\t", "0", "42", "3.14", "7.",
+                   "#ff00a0", "#", "-", "->", "=", "==", "<=", ">", "!=", "+", "*", "/", ";", ":", ",", "(", ")", "{",
+                   "}", "[", "]", ".", "@", "$", "é", "\xa0", "²"]
+
+# Programs that an engine or optimiser once got wrong, each checked on every engine
+REGRESSION_PROGRAMS = [
+    ("not of int literals", "let a:int = 5;\n__print not a;\n__print not 5;\n__print not 0;\n"
+                            "let b:int = not 5;\n__print b + 1;\n"),
+    ("read of an enclosing function's local", "fun F(x:int) -> int {\n    fun G() -> int { return x; }\n"
+                                              "    return G();\n}\n__print F(3);\n"),
+    ("assignment to an enclosing function's local", "fun F(x:int) -> int {\n    fun G() -> int { x = 1; return 2; }\n"
+                                                    "    return G();\n}\n__print F(3);\n"),
+    ("function declared after a return", "fun F() -> int { return G(); fun G() -> int { return 7; } }\n__print F();\n"),
+    ("function declared in a dead branch", "fun F() -> int { if (false) { fun G() -> int { return 7; } } return G(); }\n"
+                                           "__print F();\n"),
+    ("function declared in a dead loop", "fun F() -> int {\n    while (false) { fun G() -> int { return 7; } }\n"
+                                         "    for (let i:int = 0; false; i = i + 1) { fun H() -> int { return G(); } }\n"
+                                         "    return H();\n}\n__print F();\n"),
+]
+
+
+def corpus_sources():
+    for path in sorted(glob.glob(os.path.join(CORPUS_DIR, "*.txt"))):
+        with open(path) as src_file:
+            yield path, src_file.read()
+
+
+def generated_sources(count=5000, seed=0):
+    rng = random.Random(seed)
+    for n in range(count):
+        yield f"generated #{n}", "".join(rng.choice(LEXER_FRAGMENTS) for _ in range(rng.randint(0, 12)))
+
+
+def check_lexer_engines(engines=("dfa", "compiled", "regex"), sources=None):
+    # Every engine has to give exactly the token list of the reference DFA
+    # and SymbolKinds that agree with GetSymbolKind
+    lexers = [Lexer(engine=engine) for engine in engines]
+    sources = sources if sources is not None else list(corpus_sources()) + list(generated_sources())
+    mismatches = []
+    for name, src in sources:
+        expected = lexers[0].GenerateTokens(src)
+        for lexer in lexers:
+            kinds = []
+            actual = lexer.GenerateTokens(src, kinds=kinds)
+            if actual != expected:
+                mismatches.append((name, lexer.engine, src, expected, actual))
+            elif kinds != [GetSymbolKind(token) for token in actual]:
+                mismatches.append((name, lexer.engine, src, "kinds", kinds))
+    return len(sources), mismatches
+
+
+def ast_signature(node):
+    # Structural form of an AST that can be compared with ==. Spans are left out.
+    if isinstance(node, list):
+        return [ast_signature(item) for item in node]
+    if isinstance(node, Node):
+        return (type(node).__name__, {name: ast_signature(getattr(node, name)) for name in type(node).__slots__})
+    return node
+
+
+def generate_expression(rng, depth=0):
+    if depth > 4 or rng.random() < 0.3:
+        return rng.choice(["x", "y", "1", "2.5", "true", "#ff0000", "F(x, 2)", "(x)"])
+    form = rng.random()
+    if form < 0.15:
+        return f"not {generate_expression(rng, depth + 1)}"
+    if form < 0.25:
+        return f"({generate_expression(rng, depth + 1)})"
+    if form < 0.32:
+        return f"{generate_expression(rng, depth + 1)} as {rng.choice(['int', 'float'])}"
+    operator = rng.choice(["or", "and", "==", "!=", "<", ">", "<=", ">=", "+", "*", "/"])
+    return f"{generate_expression(rng, depth + 1)} {operator} {generate_expression(rng, depth + 1)}"
+
+
+def generated_expression_programs(count=2000, seed=0):
+    rng = random.Random(seed)
+    for n in range(count):
+        statements = "".join(f"let v{i}:int = {generate_expression(rng)};\n" for i in range(rng.randint(1, 4)))
+        yield f"generated #{n}", statements + "__print v0;\n"
+
+
+def parse_signature(parser_class, tokens):
+    try:
+        return ast_signature(parser_class(tokens).parse())
+    except SyntaxError as e:
+        return f"SyntaxError: {e}"
+
+
+def check_parsers(sources=None):
+    # The precedence climbing Parser has to build the same trees as the recursive descent reference
+    lexer = Lexer(engine="compiled")
+    sources = sources if sources is not None else list(corpus_sources()) + list(generated_expression_programs())
+    mismatches = []
+    for name, src in sources:
+        tokens = lexer.GenerateTokens(src)
+        expected = parse_signature(DescentParser, tokens)
+        actual = parse_signature(Parser, tokens)
+        if actual != expected:
+            mismatches.append((name, src, expected, actual))
+    return len(sources), mismatches
+
+
+def iter_nodes(node):
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(node)
+        elif isinstance(node, Node):
+            yield node
+            stack.extend(getattr(node, name) for name in type(node).__slots__)
+
+
+def parse_span(tokens, node):
+    # Parses just the tokens of a node's span, with the grammar rule the node comes from
+    span = tokens[node.start:node.end]
+    if isinstance(node, ParamNode):
+        parser = Parser(span)
+        result = parser.parse_param()
+    elif isinstance(node, (VariableDeclNode, AssignmentNode)) and span[-1] != ("DELIMITER", ";"):
+        # The declaration and assignment in a for loop header, which have no ';'
+        parser = Parser(span)
+        if isinstance(node, VariableDeclNode):
+            result = parser.parse_variable_decl(expect_semicolon=False)
+        else:
+            result = parser.parse_assignment(expect_semicolon=False)
+    elif isinstance(node, STATEMENT_NODES):
+        parser = Parser(span)
+        result = parser.parse_statement()
+    else:
+        # Built-in calls such as __width take arguments up to the ';', so an expression is followed by one
+        parser = Parser(span + [("DELIMITER", ";")])
+        result = parser.parse_expression()
+        parser.expect(SymbolKind.SEMICOLON)
+    if parser.current_kind != SymbolKind.EOF:
+        raise SyntaxError(f"Span ends before {parser.current_token}")
+    return result
+
+
+def check_spans(sources=None):
+    # Every node's span has to cover exactly the tokens it was parsed from
+    lexer = Lexer(engine="compiled")
+    sources = sources if sources is not None else list(corpus_sources()) + list(generated_expression_programs())
+    mismatches = []
+    for name, src in sources:
+        tokens = lexer.GenerateTokens(src)
+        try:
+            program = Parser(tokens).parse()
+        except SyntaxError:
+            continue
+        for node in iter_nodes(program.statements):
+            try:
+                actual = ast_signature(parse_span(tokens, node))
+            except SyntaxError as e:
+                actual = f"SyntaxError: {e}"
+            if actual != ast_signature(node):
+                mismatches.append((name, type(node).__name__, node.start, node.end, actual))
+    return len(sources), mismatches
+
+
+def check_arena(sources=None):
+    # Packing a tree into an AstArena and rebuilding it has to give back the same tree and spans
+    lexer = Lexer(engine="compiled")
+    sources = sources if sources is not None else list(corpus_sources()) + list(generated_expression_programs())
+    mismatches = []
+    for name, src in sources:
+        expected = Parser(lexer.GenerateTokens(src), recover=True).parse()
+        actual = AstArena.from_tree(expected).to_tree()
+        expected_spans = [(node.start, node.end) for node in iter_nodes(expected)]
+        actual_spans = [(node.start, node.end) for node in iter_nodes(actual)]
+        if ast_signature(actual) != ast_signature(expected) or actual_spans != expected_spans:
+            mismatches.append((name, src))
+    return len(sources), mismatches
+
+
+class ProgramGenerator:
+    # Random well-typed programs that terminate, for running on every execution engine, with variables and
+    # expressions of all four types. names and assignable hold (name, type) pairs, and only names in assignable
+    # can be assigned, so loop counters keep counting and loop bounds held in variables stay put. Those bounds,
+    # and the loop counters used in the body, give the IR's loop-invariant code motion and strength reduction
+    # something to do.
+    def __init__(self, rng):
+        self.rng = rng
+        self.counter = 0
+        self.functions = []
+
+    def fresh(self, prefix):
+        self.counter += 1
+        return f"{prefix}{self.counter}"
+
+    def expression(self, value_type, names, depth=0):
+        return {"int": self.int_expression, "float": self.float_expression, "bool": self.condition,
+                "colour": self.colour_expression}[value_type](names, depth)
+
+    def leaf(self, value_type, names, literal):
+        return self.rng.choice([name for name, name_type in names if name_type == value_type] + [literal])
+
+    def int_expression(self, names, depth=0):
+        rng = self.rng
+        if depth > 3 or rng.random() < 0.35:
+            return self.leaf("int", names, str(rng.randint(0, 9)))
+        form = rng.random()
+        if form < 0.15:
+            return f"({self.int_expression(names, depth + 1)})"
+        if form < 0.27:
+            return f"{self.int_expression(names, depth + 1)} / {rng.randint(1, 9)}"
+        if form < 0.3:
+            # Can divide by zero, which every engine has to stop at with the same kind of error
+            return f"{self.int_expression(names, depth + 1)} / ({self.int_expression(names, depth + 1)})"
+        if form < 0.38 and self.functions:
+            name, arity = rng.choice(self.functions)
+            return f"{name}({', '.join(self.int_expression(names, depth + 1) for _ in range(arity))})"
+        if form < 0.46:
+            source_type = rng.choice(["float", "bool", "colour"])
+            # A cast ends the expression it is in, so it is bracketed to be an operand
+            return f"(({self.expression(source_type, names, depth + 1)}) as int)"
+        operator = rng.choice(["+", "*"])
+        return f"{self.int_expression(names, depth + 1)} {operator} {self.int_expression(names, depth + 1)}"
+
+    def float_expression(self, names, depth=0):
+        rng = self.rng
+        if depth > 3 or rng.random() < 0.35:
+            return self.leaf("float", names, f"{rng.randint(0, 9)}.{rng.randint(0, 99)}")
+        form = rng.random()
+        if form < 0.15:
+            return f"({self.float_expression(names, depth + 1)})"
+        if form < 0.3:
+            return f"{self.float_expression(names, depth + 1)} / {rng.randint(1, 9)}.5"
+        if form < 0.45:
+            return f"(({self.int_expression(names, depth + 1)}) as float)"
+        operator = rng.choice(["+", "*"])
+        return f"{self.float_expression(names, depth + 1)} {operator} {self.float_expression(names, depth + 1)}"
+
+    def colour_expression(self, names, depth=0):
+        rng = self.rng
+        if depth > 3 or rng.random() < 0.35:
+            return self.leaf("colour", names, f"#{rng.randrange(1 << 24):06x}")
+        form = rng.random()
+        if form < 0.15:
+            return f"({self.colour_expression(names, depth + 1)})"
+        if form < 0.3:
+            return f"{self.colour_expression(names, depth + 1)} / #{rng.randint(1, 0xFFFF):06x}"
+        if form < 0.45:
+            return f"(({self.int_expression(names, depth + 1)}) as colour)"
+        operator = rng.choice(["+", "*"])
+        return f"{self.colour_expression(names, depth + 1)} {operator} {self.colour_expression(names, depth + 1)}"
+
+    def condition(self, names, depth=0):
+        rng = self.rng
+        form = rng.random()
+        if depth < 2 and form < 0.15:
+            return f"not ({self.condition(names, depth + 1)})"
+        if depth < 2 and form < 0.3:
+            operator = rng.choice(["and", "or"])
+            return f"({self.condition(names, depth + 1)}) {operator} ({self.condition(names, depth + 1)})"
+        if form < 0.4:
+            return self.leaf("bool", names, rng.choice(["true", "false"]))
+        operand_type = rng.choice(["int", "int", "float", "colour"])
+        # The lexer has no '==', so '!=' is the only comparison of bools
+        operator = rng.choice(["<", ">", "<=", ">=", "!="])
+        if depth < 2 and form < 0.45:
+            return f"({self.condition(names, depth + 1)}) != ({self.condition(names, depth + 1)})"
+        return f"{self.expression(operand_type, names, 2)} {operator} {self.expression(operand_type, names, 2)}"
+
+    def loop_bound(self, names, pad, lines):
+        # A literal, or a variable the loop cannot assign, which the loop's condition may compute with
+        rng = self.rng
+        if rng.random() < 0.4:
+            return str(rng.randint(0, 4))
+        bound = self.fresh("n")
+        value = f"__random_int {rng.randint(1, 5)}" if rng.random() < 0.5 else str(rng.randint(0, 4))
+        lines.append(f"{pad}let {bound}:int = {value};")
+        names.append((bound, "int"))
+        return rng.choice([bound, f"{bound} + 1", f"{bound} * 2 / 3", f"({bound} + 3) / 2"])
+
+    def block(self, names, assignable, depth, indent):
+        names, assignable = list(names), list(assignable)
+        lines = []
+        for _ in range(self.rng.randint(1, 4)):
+            lines.extend(self.statement(names, assignable, depth, indent))
+        return lines
+
+    def statement(self, names, assignable, depth, indent):
+        rng = self.rng
+        pad = "    " * indent
+        form = rng.random()
+        if form < 0.2 or not assignable:
+            name = self.fresh("t")
+            value_type = rng.choice(["int", "int", "float", "bool", "colour"])
+            # Built-ins with arguments take everything up to the ';', so they can only end a statement
+            if value_type == "int" and rng.random() < 0.2:
+                value = f"__random_int {rng.randint(1, 9)}"
+            else:
+                value = self.expression(value_type, names)
+            line = f"{pad}let {name}:{value_type} = {value};"
+            names.append((name, value_type))
+            assignable.append((name, value_type))
+            return [line]
+        if form < 0.4:
+            name, value_type = rng.choice(assignable)
+            return [f"{pad}{name} = {self.expression(value_type, names)};"]
+        if form < 0.5:
+            return [f"{pad}__print {self.expression(rng.choice(['int', 'float', 'bool', 'colour']), names)};"]
+        if form < 0.55:
+            return [f"{pad}__print ({self.int_expression(names)}) as float;"]
+        if form < 0.6:
+            return [f"{pad}__print {self.condition(names)};"]
+        if form < 0.62:
+            return [f"{pad}__delay {self.int_expression(names, 2)};"]
+        if form < 0.65:
+            x, y = self.int_expression(names, 2), self.int_expression(names, 2)
+            return [f"{pad}__write {x}, {y}, {self.colour_expression(names)};",
+                    f"{pad}__print __read {x}, {y};"]
+        if depth >= 2:
+            return [f"{pad}__print {self.int_expression(names)};"]
+        if form < 0.75:
+            lines = [f"{pad}if ({self.condition(names)}) {{"]
+            lines.extend(self.block(names, assignable, depth + 1, indent + 1))
+            if rng.random() < 0.5:
+                lines.append(f"{pad}}} else {{")
+                lines.extend(self.block(names, assignable, depth + 1, indent + 1))
+            return lines + [f"{pad}}}"]
+        lines = []
+        names = list(names)
+        bound = self.loop_bound(names, pad, lines)
+        if form < 0.88:
+            counter = self.fresh("i")
+            operator = rng.choice(["<", "<="])
+            lines.append(f"{pad}for (let {counter}:int = 0; {counter} {operator} {bound}; "
+                         f"{counter} = {counter} + {rng.randint(1, 2)}) {{")
+            body_names = names + [(counter, "int")]
+            # An induction expression, which strength reduction turns into an addition per iteration
+            lines.append(f"{pad}    __print {counter} * {rng.randint(2, 9)} + {self.int_expression(names, 3)};")
+            lines.extend(self.block(body_names, assignable, depth + 1, indent + 1))
+            return lines + [f"{pad}}}"]
+        counter = self.fresh("w")
+        lines += [f"{pad}let {counter}:int = 0;", f"{pad}while ({counter} < {bound}) {{"]
+        lines.extend(self.block(names + [(counter, "int")], assignable, depth + 1, indent + 1))
+        return lines + [f"{pad}    {counter} = {counter} + 1;", f"{pad}}}"]
+
+    def function(self):
+        name = self.fresh("F")
+        params = [(self.fresh("p"), "int") for _ in range(self.rng.randint(0, 3))]
+        lines = [f"fun {name}({', '.join(f'{param}:int' for param, _ in params)}) -> int {{"]
+        lines.extend(self.block(params, params, 1, 1))
+        lines.append(f"    return {self.int_expression(params)};")
+        self.functions.append((name, len(params)))
+        return lines + ["}"]
+
+    def program(self):
+        lines = []
+        for _ in range(self.rng.randint(0, 2)):
+            lines.extend(self.function())
+        lines.extend(self.block([], [], 0, 0))
+        return "\n".join(lines) + "\n"
+
+
+def generated_execution_programs(count=300, seed=0):
+    rng = random.Random(seed)
+    for n in range(count):
+        yield f"generated #{n}", ProgramGenerator(rng).program()
+
+
+def run_on_engine(engine, src, runtime_class=Runtime):
+    # What a program did on an engine: its output, final display and frame timeline, or the error it stopped with
+    runtime = runtime_class(out=io.StringIO(), seed=0, clock=VirtualClock())
+    try:
+        ENGINES[engine](src, runtime)
+    except Exception as e:
+        return f"{type(e).__name__}: {e}"
+    pixels = runtime.rows() if isinstance(runtime, FramebufferRuntime) else runtime.pixels
+    return runtime.out.getvalue(), pixels, runtime.frame_times
+
+
+ENGINES = {
+    "vm": vm.run_source,
+    "closures": closure_engine.run_source,
+    "python": transpiler.run_source,
+    "ir": ir.run_source,
+    "optimized vm": lambda src_program_str, runtime: vm.run_source(src_program_str, runtime, optimize=True),
+    "vectorized": vectorize.run_source,
+}
+
+
+def check_engines(sources=None):
+    # Every execution engine has to print the same output and leave the same display as the bytecode VM
+    sources = sources if sources is not None else (list(corpus_sources()) + REGRESSION_PROGRAMS
+                                                   + list(generated_execution_programs()))
+    mismatches = []
+    for name, src in sources:
+        expected = run_on_engine("vm", src)
+        for engine in ENGINES:
+            actual = run_on_engine(engine, src)
+            if not same_outcome(actual, expected):
+                mismatches.append((name, engine, src, expected, actual))
+    return len(sources), mismatches
+
+
+def same_outcome(actual, expected):
+    # Errors only have to be of the same class, since only the VM says where in its bytecode it stopped
+    if isinstance(actual, str) and isinstance(expected, str):
+        return actual.split(":")[0] == expected.split(":")[0]
+    return actual == expected
+
+
+def box_programs(count=300, seed=0):
+    # Boxes and pixels drawn partly or wholly off the display, with colours out of the 24-bit range
+    rng = random.Random(seed)
+    for n in range(count):
+        lines = []
+        for _ in range(rng.randint(1, 6)):
+            x, y = rng.randint(-40, 40), rng.randint(-40, 40)
+            if rng.random() < 0.3:
+                colour = f"({rng.randint(-2 ** 26, 2 ** 26)}) as colour"
+            else:
+                colour = f"#{rng.randrange(1 << 24):06x}"
+            if rng.random() < 0.5:
+                lines.append(f"__write_box {x}, {y}, {rng.randint(-5, 50)}, {rng.randint(-5, 50)}, {colour};")
+            else:
+                lines.append(f"__write {x}, {y}, {colour};")
+            lines.append(f"__print __read {rng.randint(-2, 37)}, {rng.randint(-2, 37)};")
+        yield f"boxes #{n}", "\n".join(lines) + "\n"
+
+
+def pixel_int_expression(rng, names, depth=0):
+    # An int expression over loop counters and invariants, now and then with a divisor that can be 0 or values
+    # too large for int64
+    if depth > 2 or rng.random() < 0.4:
+        return rng.choice(names + [str(rng.randint(0, 9)), "4611686018427387904"])
+    operator = rng.choice(["+", "*", "/"])
+    return f"({pixel_int_expression(rng, names, depth + 1)} {operator} {pixel_int_expression(rng, names, depth + 1)})"
+
+
+def pixel_loop_programs(count=300, seed=0):
+    # Nests of for loops that write pixels, mostly in the shapes vectorize lowers and some just outside them
+    rng = random.Random(seed)
+    for n in range(count):
+        lines = ["let a:int = __random_int 9;", "let w:int = __width;", "let c:colour = #12ab34;"]
+        counters = []
+        indent = ""
+        for level in range(rng.randint(1, 3)):
+            counter = f"i{level}"
+            start = rng.choice(["0", "1", "a", str(rng.randint(0, 40))])
+            bound = rng.choice(["w", "__height", "a * 4", str(rng.randint(0, 40)),
+                                "i0" if counters and rng.random() < 0.1 else "w"])
+            comparison = rng.choice(["<", "<="])
+            step = rng.choice([1, 1, 2, 3])
+            lines.append(f"{indent}for (let {counter}:int = {start}; {counter} {comparison} {bound}; "
+                         f"{counter} = {counter} + {step}) {{")
+            counters.append(counter)
+            indent += "    "
+        names = counters + ["a", "w"]
+        if rng.random() < 0.5:
+            lines.append(f"{indent}let t:int = {pixel_int_expression(rng, names)};")
+            names.append("t")
+        coordinates = [rng.choice(counters + [f"{rng.choice(counters)} + a", f"{rng.choice(counters)} / 2",
+                                              str(rng.randint(0, 40)), pixel_int_expression(rng, names)])
+                       for _ in range(2)]
+        colour = rng.choice(["c", "#ff0000", f"({pixel_int_expression(rng, names)}) as colour"])
+        if rng.random() < 0.1:
+            lines.append(f"{indent}__print {counters[-1]};")
+        lines.append(f"{indent}__write {coordinates[0]}, {coordinates[1]}, {colour};")
+        for _ in counters:
+            indent = indent[4:]
+            lines.append(f"{indent}}}")
+        lines.append("__print __read 3, 4;")
+        yield f"pixel loops #{n}", "\n".join(lines) + "\n"
+
+
+def check_framebuffer(sources=None):
+    # Every engine has to print the same output and leave the same display on a FramebufferRuntime as on the
+    # list display of a Runtime
+    sources = sources if sources is not None else (list(corpus_sources()) + list(generated_execution_programs())
+                                                   + list(box_programs()) + list(pixel_loop_programs()))
+    mismatches = []
+    for name, src in sources:
+        for engine in ENGINES:
+            expected = run_on_engine(engine, src)
+            actual = run_on_engine(engine, src, FramebufferRuntime)
+            if actual != expected:
+                mismatches.append((name, engine, src, expected, actual))
+    return len(sources), mismatches
+
+
+class SnapshotRuntime(FramebufferRuntime):
+    # Keeps a copy of the whole display at the end of every frame, like a RecordingRuntime without the encoding
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.snapshots = []
+
+    def end_frame(self):
+        super().end_frame()
+        self.snapshots.append(self.rows())
+
+    def close(self):
+        self.end_frame()
+
+
+def check_frames(sources=None):
+    # Replaying a delta-encoded recording has to give back every frame's time and display, and the recording
+    # runtime's batched output has to be everything the program printed
+    sources = sources if sources is not None else (list(corpus_sources()) + list(generated_execution_programs())
+                                                   + list(box_programs()) + list(pixel_loop_programs()))
+    mismatches = []
+    for name, src in sources:
+        expected = SnapshotRuntime(out=io.StringIO(), seed=0, clock=VirtualClock())
+        try:
+            vm.run_source(src, expected)
+        except Exception:
+            continue
+        expected.close()
+        # Times are recorded as doubles
+        expected_frames = [(float(time), display) for time, display in zip(expected.frame_times, expected.snapshots)]
+        for engine in ("vm", "vectorized"):
+            frame_file = io.BytesIO()
+            runtime = record(src, frame_file, engine, out=io.StringIO(), seed=0, clock=VirtualClock())
+            frame_file.seek(0)
+            frames = [(time, display.tolist()) for time, display in read_frames(frame_file)]
+            if frames != expected_frames or runtime.out.getvalue() != expected.out.getvalue():
+                mismatches.append((name, engine, src))
+    return len(sources), mismatches
+
+
+def check_async(sources=None):
+    # Programs run all at once on one event loop, giving way after every jump, have to print, draw and delay
+    # exactly as they do on their own
+    sources = sources if sources is not None else list(corpus_sources()) + list(generated_execution_programs())
+    results = asyncio.run(run_programs(sources, lambda: Runtime(out=io.StringIO(), seed=0, clock=VirtualClock()),
+                                       slice_jumps=1))
+    mismatches = []
+    for (name, src), (_, runtime, error) in zip(sources, results):
+        expected = run_on_engine("vm", src)
+        actual = f"{type(error).__name__}: {error}" if error is not None else \
+            (runtime.out.getvalue(), runtime.pixels, runtime.frame_times)
+        if actual != expected:
+            mismatches.append((name, src, expected, actual))
+    return len(sources), mismatches
+
+
+CHECKS = {
+    "lexer": check_lexer_engines,
+    "parser": check_parsers,
+    "spans": check_spans,
+    "arena": check_arena,
+    "engines": check_engines,
+    "framebuffer": check_framebuffer,
+    "frames": check_frames,
+    "async": check_async,
+}
+
+if __name__ == "__main__":
+    failed = False
+    for name in sys.argv[1:] or list(CHECKS):
+        checked, mismatches = CHECKS[name]()
+        print(f"{name}: {checked} inputs, {len(mismatches)} mismatches")
+        for mismatch in mismatches[:10]:
+            print(f"  {mismatch}")
+        failed = failed or bool(mismatches)
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,143 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from lexer import Lexer
+from LLK_Parser import Parser
+from Semantic_Analyzer import SemanticAnalyzer, check_source
+from compile_cache import CompileCache
+
+SOURCE_EXTENSIONS = (".txt", ".parl")
+
+# One lexer and compile cache per worker process, built on first use
+_lexer = None
+_cache = None
+
+
+def collect_files(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                dirs.sort()
+                files.extend(os.path.join(root, name) for name in sorted(names) if name.endswith(SOURCE_EXTENSIONS))
+        else:
+            files.append(path)
+    return files
+
+
+def compile_file(path, engine="regex", recover=False, cache_dir=None):
+    # Lex, parse and check one file. Never raises, so one bad program cannot stop a batch.
+    global _lexer, _cache
+    if _lexer is None or _lexer.engine != engine:
+        _lexer = Lexer(engine=engine)
+    if cache_dir is not None and (_cache is None or _cache.directory != cache_dir or _cache.lexer is not _lexer):
+        try:
+            _cache = CompileCache(cache_dir, lexer=_lexer)
+        except OSError:
+            # A cache directory that cannot be used only costs the cache
+            _cache = None
+    if recover:
+        return check_file(path)
+
+    result = {"file": path, "success": False, "phase": None, "error": None, "timings": {}}
+    timings = result["timings"]
+    phase = "read"
+    start = time.perf_counter()
+    try:
+        with open(path) as src_file:
+            src = src_file.read()
+        timings[phase] = time.perf_counter() - start
+
+        ast = None
+        if cache_dir is not None and _cache is not None:
+            # Lexed and parsed together, or loaded from the cache
+            phase = "parse"
+            start = time.perf_counter()
+            hits = _cache.stats["hits"]
+            try:
+                _, ast = _cache.compile(src)
+                timings["cached" if _cache.stats["hits"] > hits else phase] = time.perf_counter() - start
+            except OSError:
+                # The cache could not be read or written, so the program is compiled without it
+                pass
+        if ast is None:
+            phase = "lex"
+            start = time.perf_counter()
+            kinds = []
+            tokens = _lexer.GenerateTokens(src, kinds=kinds)
+            timings[phase] = time.perf_counter() - start
+
+            phase = "parse"
+            start = time.perf_counter()
+            ast = Parser(tokens, kinds).parse()
+            timings[phase] = time.perf_counter() - start
+
+        phase = "semantic"
+        start = time.perf_counter()
+        SemanticAnalyzer().visit(ast)
+        timings[phase] = time.perf_counter() - start
+    except Exception as e:
+        timings[phase] = time.perf_counter() - start
+        result["phase"] = phase
+        result["error"] = f"{type(e).__name__}: {e}"
+        return result
+
+    result["success"] = True
+    return result
+
+
+def check_file(path):
+    # Recovery mode: every lexical, syntax and semantic error of the file from a single pass
+    result = {"file": path, "success": False, "errors": [], "timings": {}}
+    start = time.perf_counter()
+    try:
+        with open(path) as src_file:
+            src = src_file.read()
+        ast, errors = check_source(src, _lexer)
+    except Exception as e:
+        result["errors"].append({"phase": "internal", "line": 0, "column": 0, "message": f"{type(e).__name__}: {e}"})
+        return result
+    finally:
+        result["timings"]["check"] = time.perf_counter() - start
+    result["errors"] = [{"phase": phase, "line": line, "column": column, "message": message}
+                        for phase, line, column, message in errors]
+    result["success"] = not errors
+    return result
+
+
+def compile_batch(paths, workers=None, engine="regex", chunksize=8, recover=False, cache_dir=None):
+    # Yields one result per file in input order, as soon as each one is ready
+    files = collect_files(paths)
+    if workers == 1:
+        for path in files:
+            yield compile_file(path, engine, recover, cache_dir)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(compile_file, files, [engine] * len(files), [recover] * len(files),
+                                [cache_dir] * len(files), chunksize=chunksize)
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Lex, parse and semantically check PArL programs in parallel")
+    arg_parser.add_argument("paths", nargs="+", help="source files or directories to search for them")
+    arg_parser.add_argument("-j", "--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    arg_parser.add_argument("--engine", choices=("dfa", "compiled", "regex"), default="regex", help="lexer engine")
+    arg_parser.add_argument("--chunksize", type=int, default=8, help="files handed to a worker at a time")
+    arg_parser.add_argument("--recover", action="store_true", help="report every error of a file, not just the first")
+    arg_parser.add_argument("--cache-dir", default=None, help="reuse tokens and trees of unchanged files from here")
+    args = arg_parser.parse_args(argv)
+
+    failures = 0
+    for result in compile_batch(args.paths, args.workers, args.engine, args.chunksize, args.recover, args.cache_dir):
+        failures += not result["success"]
+        sys.stdout.write(json.dumps(result) + "\n")
+        sys.stdout.flush()
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,42 @@
+import numpy as np
+
+from runtime import Runtime, BLACK, COLOUR_MASK, DEFAULT_WIDTH, DEFAULT_HEIGHT
+
+class FramebufferRuntime(Runtime):
+    # A Runtime whose display is a fixed height x width NumPy uint32 array, addressed pixels[y, x], so that
+    # __write_box fills its whole box with one slice assignment and __read is a single index, however large the
+    # box or the display. Colours go in as the same 24-bit ints as the list display holds and come out of
+    # __read as Python ints, so programs see no difference; any engine can run against one.
+    def __init__(self, width=DEFAULT_WIDTH, height=DEFAULT_HEIGHT, out=None, seed=None, clock=None):
+        super().__init__(width, height, out, seed, clock)
+        self.pixels = np.full((height, width), BLACK, dtype=np.uint32)
+
+    def write(self, x, y, colour):
+        if 0 <= x < self.width and 0 <= y < self.height:
+            self.pixels[y, x] = colour & COLOUR_MASK
+
+    def write_box(self, x, y, width, height, colour):
+        # Slicing clips the far edges to the display; the near ones are clipped here
+        self.pixels[max(y, 0):max(y + height, 0), max(x, 0):max(x + width, 0)] = colour & COLOUR_MASK
+
+    def write_many(self, xs, ys, colours, distinct=False):
+        # What __write of each of the int64 arrays' elements in turn does, in a few array operations. Unless the
+        # pixels are known to be distinct, only the last write to each one is kept, as it is the one that shows.
+        on_display = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+        xs, ys, colours = xs[on_display], ys[on_display], colours[on_display]
+        if not distinct:
+            indices = (ys * self.width + xs)[::-1]
+            _, firsts = np.unique(indices, return_index=True)
+            last = len(indices) - 1 - firsts
+            xs, ys, colours = xs[last], ys[last], colours[last]
+        self.pixels[ys, xs] = colours & COLOUR_MASK
+        return xs, ys
+
+    def read(self, x, y):
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return self.pixels.item(y, x)
+        return BLACK
+
+    def rows(self):
+        # The display as lists of ints, the way Runtime holds it
+        return self.pixels.tolist()
@@ -0,0 +1,214 @@
+import argparse
+import struct
+import sys
+
+import numpy as np
+
+import closure_engine
+import transpiler
+import vectorize
+import vm
+from framebuffer import FramebufferRuntime
+from runtime import BLACK, COLOUR_MASK, DEFAULT_WIDTH, DEFAULT_HEIGHT, RealClock, VirtualClock, format_value
+
+# A recording is a header, then one record per frame:
+#   header  MAGIC, display width and height                 <HH
+#   frame   time in milliseconds, number of rectangles      <dH
+#   rect    x, y, width, height                             <HHHH
+#           followed by width * height pixels, row by row, as 3 bytes each: red, green, blue
+# Each frame holds only the rectangles that changed since the frame before it, starting from a black display.
+MAGIC = b"PARLFRM1"
+HEADER = struct.Struct("<HH")
+FRAME = struct.Struct("<dH")
+RECT = struct.Struct("<HHHH")
+# Dirty rectangles kept apart before they are all merged into their bounding box
+MAX_DIRTY_RECTS = 8
+# Bytes of frames, and lines of __print output, held back before they are written out together
+FRAME_BUFFER_SIZE = 1 << 20
+PRINT_BATCH = 256
+# What `frames.py record` can run a program on
+ENGINES = {"vm": vm.run_source, "closures": closure_engine.run_source, "python": transpiler.run_source,
+           "vectorized": vectorize.run_source}
+
+def encode_pixels(region):
+    # A uint32 array of 0xRRGGBB colours as RGB bytes; big-endian puts the unused byte first
+    return region.astype(">u4").view(np.uint8).reshape(region.shape + (4,))[:, :, 1:].tobytes()
+
+def decode_pixels(data, width, height):
+    rgb = np.frombuffer(data, dtype=np.uint8).reshape(height, width, 3).astype(np.uint32)
+    return rgb[:, :, 0] << 16 | rgb[:, :, 1] << 8 | rgb[:, :, 2]
+
+class FrameWriter:
+    # Appends delta-encoded frames to a binary file. Records are collected in memory and written in chunks of
+    # about buffer_size bytes, so a long recording costs a few large writes rather than one per frame.
+    def __init__(self, frame_file, width, height, buffer_size=FRAME_BUFFER_SIZE):
+        self.file = frame_file
+        self.buffer_size = buffer_size
+        self.chunks = [MAGIC + HEADER.pack(width, height)]
+        self.buffered = len(self.chunks[0])
+        self.frames = 0
+
+    def write_frame(self, time, rects):
+        # rects are (x, y, region) with region the pixels of the rectangle
+        chunks = self.chunks
+        chunks.append(FRAME.pack(time, len(rects)))
+        for x, y, region in rects:
+            height, width = region.shape
+            data = encode_pixels(region)
+            chunks.append(RECT.pack(x, y, width, height))
+            chunks.append(data)
+            self.buffered += RECT.size + len(data)
+        self.buffered += FRAME.size
+        self.frames += 1
+        if self.buffered >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        self.file.write(b"".join(self.chunks))
+        self.chunks = []
+        self.buffered = 0
+
+def read_frames(frame_file):
+    # Replays a recording, yielding each frame's time and a copy of the whole display as it stood then
+    data = frame_file.read()
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError("Not a PArL frame recording")
+    offset = len(MAGIC)
+    width, height = HEADER.unpack_from(data, offset)
+    offset += HEADER.size
+    display = np.full((height, width), BLACK, dtype=np.uint32)
+    while offset < len(data):
+        time, rect_count = FRAME.unpack_from(data, offset)
+        offset += FRAME.size
+        for _ in range(rect_count):
+            x, y, rect_width, rect_height = RECT.unpack_from(data, offset)
+            offset += RECT.size
+            size = rect_width * rect_height * 3
+            display[y:y + rect_height, x:x + rect_width] = decode_pixels(data[offset:offset + size], rect_width,
+                                                                          rect_height)
+            offset += size
+        yield time, display.copy()
+
+class RecordingRuntime(FramebufferRuntime):
+    # A FramebufferRuntime for headless runs that records every frame to frame_file, a binary file, through a
+    # FrameWriter. Writes mark the rectangles they touch as dirty, and a frame only encodes the parts of those
+    # rectangles that differ from the frame before, so a frame that changed nothing costs a few bytes. __print
+    # output is held back and written PRINT_BATCH lines at a time. close() records the display the program
+    # ended with as a last frame and writes out everything still held back.
+    def __init__(self, frame_file, width=DEFAULT_WIDTH, height=DEFAULT_HEIGHT, out=None, seed=None, clock=None):
+        super().__init__(width, height, out, seed, clock)
+        self.writer = FrameWriter(frame_file, width, height)
+        self.shown = self.pixels.copy()
+        # [x0, y0, x1, y1) of each dirty rectangle
+        self.dirty = []
+        self.lines = []
+
+    def print_value(self, value, value_type):
+        lines = self.lines
+        lines.append(format_value(value, value_type) + "\n")
+        if len(lines) >= PRINT_BATCH:
+            self.flush_output()
+
+    def flush_output(self):
+        self.out.write("".join(self.lines))
+        self.lines = []
+
+    def write(self, x, y, colour):
+        if 0 <= x < self.width and 0 <= y < self.height:
+            self.pixels[y, x] = colour & COLOUR_MASK
+            self.mark_dirty(x, y, x + 1, y + 1)
+
+    def write_box(self, x, y, width, height, colour):
+        x0, y0, x1, y1 = max(x, 0), max(y, 0), min(x + width, self.width), min(y + height, self.height)
+        if x0 < x1 and y0 < y1:
+            self.pixels[y0:y1, x0:x1] = colour & COLOUR_MASK
+            self.mark_dirty(x0, y0, x1, y1)
+
+    def write_many(self, xs, ys, colours, distinct=False):
+        xs, ys = super().write_many(xs, ys, colours, distinct)
+        if len(xs):
+            self.mark_dirty(int(xs.min()), int(ys.min()), int(xs.max()) + 1, int(ys.max()) + 1)
+        return xs, ys
+
+    def mark_dirty(self, x0, y0, x1, y1):
+        # Grows the first dirty rectangle the new one overlaps or touches, so runs of pixel writes become one
+        # rectangle; past MAX_DIRTY_RECTS they are all merged into one
+        dirty = self.dirty
+        for rect in dirty:
+            if x0 <= rect[2] and rect[0] <= x1 and y0 <= rect[3] and rect[1] <= y1:
+                if x0 < rect[0]:
+                    rect[0] = x0
+                if y0 < rect[1]:
+                    rect[1] = y0
+                if x1 > rect[2]:
+                    rect[2] = x1
+                if y1 > rect[3]:
+                    rect[3] = y1
+                return
+        dirty.append([x0, y0, x1, y1])
+        if len(dirty) > MAX_DIRTY_RECTS:
+            self.dirty = [[min(rect[0] for rect in dirty), min(rect[1] for rect in dirty),
+                           max(rect[2] for rect in dirty), max(rect[3] for rect in dirty)]]
+
+    def end_frame(self):
+        super().end_frame()
+        pixels, shown = self.pixels, self.shown
+        rects = []
+        for x0, y0, x1, y1 in self.dirty:
+            changed = pixels[y0:y1, x0:x1] != shown[y0:y1, x0:x1]
+            rows = np.flatnonzero(changed.any(axis=1))
+            if not len(rows):
+                continue
+            columns = np.flatnonzero(changed.any(axis=0))
+            top, bottom = y0 + int(rows[0]), y0 + int(rows[-1]) + 1
+            left, right = x0 + int(columns[0]), x0 + int(columns[-1]) + 1
+            region = pixels[top:bottom, left:right].copy()
+            shown[top:bottom, left:right] = region
+            rects.append((left, top, region))
+        self.dirty = []
+        self.writer.write_frame(self.frame_times[-1], rects)
+
+    def close(self):
+        self.end_frame()
+        self.writer.flush()
+        self.flush_output()
+
+def record(src_program_str, frame_file, engine="vm", **runtime_args):
+    # Runs a program on a RecordingRuntime and returns the runtime. Whatever the program printed or drew before
+    # an error is still written out.
+    runtime = RecordingRuntime(frame_file, **runtime_args)
+    try:
+        ENGINES[engine](src_program_str, runtime)
+    finally:
+        runtime.close()
+    return runtime
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Record the frames of a PArL program, or summarise a recording")
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+    record_parser = commands.add_parser("record", help="run a program headless and record its frames")
+    record_parser.add_argument("path", help="source file")
+    record_parser.add_argument("output", help="recording to write")
+    record_parser.add_argument("--engine", choices=list(ENGINES), default="vm", help="execution engine to run on")
+    record_parser.add_argument("--real-time", action="store_true", help="make __delay sleep instead of advancing "
+                                                                        "a virtual clock")
+    record_parser.add_argument("--seed", type=int, default=None, help="seed of __random_int and __randi")
+    show_parser = commands.add_parser("show", help="list the frames of a recording")
+    show_parser.add_argument("path", help="recording to read")
+    args = arg_parser.parse_args(argv)
+
+    if args.command == "record":
+        with open(args.path) as src_file:
+            src = src_file.read()
+        clock = RealClock() if args.real_time else VirtualClock()
+        with open(args.output, "wb") as frame_file:
+            runtime = record(src, frame_file, args.engine, seed=args.seed, clock=clock)
+        print(f"{runtime.writer.frames} frames written to {args.output}", file=sys.stderr)
+        return 0
+    with open(args.path, "rb") as frame_file:
+        for number, (time, display) in enumerate(read_frames(frame_file)):
+            print(f"frame {number:5}  {time:10.1f} ms  {len(np.unique(display))} colours")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
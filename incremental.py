@@ -0,0 +1,206 @@
+import sys
+from array import array
+from bisect import bisect_left
+
+from lexer import Lexer, TokenStream, TOKEN_KIND_INDEX, TokenType, SliceLexeme
+from LLK_Parser import Parser
+from parser_nodes import ProgramNode
+
+def shift(values, start, end, offset):
+    for idx in range(start, end):
+        values[idx] += offset
+
+def find(values, split, value, end_offset):
+    # Index of the first entry of values that is at least value, where the entries from split onwards are kept
+    # end_offset less than they stand for. Both parts are sorted on their own.
+    idx = bisect_left(values, value, 0, split)
+    if idx < split:
+        return idx
+    return bisect_left(values, value - end_offset, split)
+
+class EditableTokenStream(TokenStream):
+    # A TokenStream that is edited in place, at a cost that depends on the size of the edit and on how far it is
+    # from the previous one rather than on the size of the source. Like the text after the gap of a gap buffer,
+    # the starts of the tokens from split onwards are kept relative to the end of the source, so that an edit
+    # before them leaves them as they are; Start gives the offset of any token.
+    def __init__(self, tokens):
+        super().__init__(tokens.src_program_str)
+        self.kinds, self.starts, self.lengths = tokens.kinds, tokens.starts, tokens.lengths
+        self.split = len(self.kinds)
+
+    def Start(self, idx):
+        if idx >= self.split:
+            return self.starts[idx] + len(self.src_program_str)
+        return self.starts[idx]
+
+    def Lexeme(self, idx):
+        start = self.Start(idx)
+        lexeme = SliceLexeme(self.src_program_str, start, start + self.lengths[idx])
+        if self.kinds[idx] in self.INTERNED_KINDS:
+            return sys.intern(lexeme)
+        return lexeme
+
+    def Position(self, idx):
+        start = max(self.Start(idx) if idx < len(self.starts) else len(self.src_program_str), 0)
+        line = self.src_program_str.count("\n", 0, start) + 1
+        return line, start - (self.src_program_str.rfind("\n", 0, start) + 1) + 1
+
+    def Find(self, offset):
+        # Index of the first token that starts at or after offset
+        return find(self.starts, self.split, offset, len(self.src_program_str))
+
+    def Replace(self, first, end, tokens, src_program_str):
+        # Replaces the tokens [first, end) with tokens, lexed from src_program_str, in which the text after them
+        # is the text after the old ones
+        if end < self.split:
+            shift(self.starts, end, self.split, -len(self.src_program_str))
+        else:
+            shift(self.starts, self.split, end, len(self.src_program_str))
+        self.kinds[first:end] = tokens.kinds
+        self.starts[first:end] = tokens.starts
+        self.lengths[first:end] = tokens.lengths
+        self.split = first + len(tokens.kinds)
+        self.src_program_str = src_program_str
+
+class IncrementalFrontEnd:
+    # Keeps the token stream and AST of one source file up to date across text edits. An edit is re-lexed
+    # from the last token boundary before it until the new tokens line up with the old ones again, and only
+    # the top-level statements whose tokens changed are parsed again; the other statement subtrees are reused.
+    # The tokens and the statements' token ranges are both edited in place and keep what follows the last
+    # edit relative to the end, so an edit costs about the tokens and statements it changes.
+    def __init__(self, src_program_str, lexer=None):
+        self.lexer = lexer or Lexer(engine="compiled")
+        self.whitespace_kind = TOKEN_KIND_INDEX[TokenType.WHITESPACE.value]
+        self.tokens = EditableTokenStream(self.lexer.GenerateTokenStream(src_program_str))
+        self.program = None
+        # The first and end token index of every top-level statement in self.program.statements, from
+        # range_split onwards less the number of tokens
+        self.firsts = array("l")
+        self.ends = array("l")
+        self.range_split = 0
+        self.parse_all()
+
+    @property
+    def src_program_str(self):
+        return self.tokens.src_program_str
+
+    def statement_range(self, idx):
+        # (first token index, end token index) of a top-level statement. Reused statements keep the node spans
+        # they were parsed with, which this gives the current first token to rebase against.
+        if idx >= self.range_split:
+            return self.firsts[idx] + len(self.tokens), self.ends[idx] + len(self.tokens)
+        return self.firsts[idx], self.ends[idx]
+
+    def apply_edit(self, offset, removed_length, inserted_text):
+        tokens = self.tokens
+        old_src = tokens.src_program_str
+        if offset < 0 or offset + removed_length > len(old_src):
+            raise ValueError(f"Edit ({offset}, {removed_length}) is outside the source of length {len(old_src)}")
+        new_src = old_src[:offset] + inserted_text + old_src[offset + removed_length:]
+        delta = len(inserted_text) - removed_length
+
+        old_count = len(tokens)
+        first_changed, first_reused, relexed = self.relex(tokens, new_src, offset, offset + removed_length, delta)
+        if self.program is None:
+            # The previous version did not parse, so there are no subtrees to reuse
+            tokens.Replace(first_changed, first_reused, relexed, new_src)
+            self.parse_all()
+            return self.program
+
+        # Statements are reused up to the first one that ends within one token (the parser's lookahead)
+        # of the first changed token, and again from the first that starts after the resynchronisation point
+        keep = find(self.ends, self.range_split, first_changed, old_count)
+        reuse = find(self.firsts, self.range_split, first_reused, old_count)
+        # Statements before reuse are before the edit's tail, so they are kept as they are, and those after it
+        # in its tail, so they are kept relative to the end
+        if reuse < self.range_split:
+            shift(self.firsts, reuse, self.range_split, -old_count)
+            shift(self.ends, reuse, self.range_split, -old_count)
+        else:
+            shift(self.firsts, self.range_split, reuse, old_count)
+            shift(self.ends, self.range_split, reuse, old_count)
+        self.range_split = reuse
+        tokens.Replace(first_changed, first_reused, relexed, new_src)
+        self.parse_statements(keep, reuse)
+        return self.program
+
+    def relex(self, old_tokens, new_src, edit_start, edit_end, delta):
+        # Token boundaries are DFA restart points: lexing always resumes in state 0 at the end of a token.
+        # Restart at the end of the last token that the lexer could not have looked past into the edit.
+        # The last token may have been cut short by the end of the input rather than by the DFA, so an edit
+        # at the end restarts before it too
+        edit_start = min(edit_start, len(old_tokens.src_program_str) - 1)
+        start = old_tokens.Start
+        old_lengths = old_tokens.lengths
+        first_changed = old_tokens.Find(edit_start)
+        while first_changed > 0 and start(first_changed - 1) + old_lengths[first_changed - 1] >= edit_start:
+            first_changed -= 1
+        if first_changed > 0:
+            src_program_idx = start(first_changed - 1) + old_lengths[first_changed - 1]
+        else:
+            src_program_idx = 0
+
+        relexed = TokenStream(new_src)
+        next_token_span = self.lexer.NextTokenSpan
+        new_edit_end = edit_end + delta
+        src_len = len(new_src)
+        old_count = len(old_tokens)
+        while src_program_idx < src_len:
+            if src_program_idx >= new_edit_end:
+                # Resynchronised once we are past the edit on a boundary where the old lexing restarted too
+                old_idx = src_program_idx - delta
+                first_reused = old_tokens.Find(old_idx)
+                if first_reused < old_count and start(first_reused) == old_idx:
+                    return first_changed, first_reused, relexed
+                if first_reused > 0 and start(first_reused - 1) + old_lengths[first_reused - 1] == old_idx:
+                    return first_changed, first_reused, relexed
+
+            if src_program_idx and src_program_idx >= src_len - 1:
+                break  # Same end of input cut off as GenerateTokens, which never lexes a last character alone
+
+            kind, start_idx, end_idx = next_token_span(new_src, src_program_idx)
+            if kind != self.whitespace_kind:
+                relexed.Append(kind, start_idx, end_idx - start_idx)
+            src_program_idx += end_idx - start_idx
+
+        return first_changed, old_count, relexed
+
+    def parse_all(self):
+        self.firsts = array("l")
+        self.ends = array("l")
+        self.range_split = 0
+        self.program = ProgramNode([])
+        self.parse_statements(0, 0)
+
+    def parse_statements(self, keep, reuse):
+        # Parses the statements after the first keep again, up to the first statement from reuse onwards that
+        # the parser arrives at the first token of, and splices them in place of the statements in between
+        tokens = self.tokens
+        token_count = len(tokens)
+        statements = self.program.statements
+        firsts = self.firsts
+        start_index = self.statement_range(keep - 1)[1] if keep else 0
+        parser = Parser((tokens[idx] for idx in range(start_index, token_count)), first_token_index=start_index)
+        self.program = None
+        new_statements = []
+        new_firsts = array("l")
+        new_ends = array("l")
+        resume = len(statements)
+
+        while parser.current_token[0] != 'EOF':
+            token_index = parser.current_token_index
+            # The remaining statements start on unchanged tokens, so their subtrees are reused as they are
+            reused = bisect_left(firsts, token_index - token_count, reuse)
+            if reused < len(firsts) and firsts[reused] + token_count == token_index:
+                resume = reused
+                break
+            new_statements.append(parser.parse_statement())
+            new_firsts.append(token_index)
+            new_ends.append(parser.current_token_index)
+
+        statements[keep:resume] = new_statements
+        firsts[keep:resume] = new_firsts
+        self.ends[keep:resume] = new_ends
+        self.range_split = keep + len(new_statements)
+        self.program = ProgramNode(statements)
+        return self.program
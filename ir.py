@@ -0,0 +1,1077 @@
+import argparse
+import operator
+import sys
+
+from bytecode import *
+from lexer import Lexer
+from LLK_Parser import Parser
+from optimizer import count_nodes
+from parser_nodes import AssignmentNode, BinaryOpNode, FunctionDeclNode, IdentifierNode, LiteralNode, VariableDeclNode
+from runtime import Runtime, VirtualClock, BINARY_OPERATORS, default_value
+from Semantic_Analyzer import SemanticAnalyzer
+from visitor import NodeVisitor, iter_child_nodes
+from vm import VM
+
+# Operators of the IR beyond PArL's binary ones: int division, negation, not and the casts
+IR_BINARY_OPCODES = dict(BINARY_OPCODES, **{'//': DIV_INT})
+UNARY_OPS = {'neg': NEG, 'not': NOT}
+CAST_OPS = {'to_int': TO_INT, 'to_float': TO_FLOAT, 'to_bool': TO_BOOL}
+CAST_FUNCTIONS = {'to_int': int, 'to_float': float, 'to_bool': bool}
+CAST_NAMES = {'int': 'to_int', 'colour': 'to_int', 'float': 'to_float', 'bool': 'to_bool'}
+COMMUTATIVE_OPS = frozenset({'+', '*', '==', '!=', 'and', 'or'})
+# Instructions without effects, which can be removed when unused, shared when repeated and moved out of loops.
+# load_global and read depend on what calls and writes do, so they are only removed.
+PURE_OPS = frozenset(IR_BINARY_OPCODES) | frozenset(UNARY_OPS) | frozenset(CAST_OPS) | {'copy', 'width', 'height'}
+REMOVABLE_OPS = PURE_OPS | {'load_global', 'read'}
+EFFECT_OPCODES = {'print': PRINT, 'delay': DELAY, 'write': WRITE, 'write_box': WRITE_BOX, 'read': READ,
+                  'random_int': RANDOM_INT, 'width': WIDTH, 'height': HEIGHT}
+BUILTIN_OPS = {'__random_int': 'random_int', '__randi': 'random_int', '__read': 'read', '__width': 'width',
+               '__height': 'height'}
+# for loops that count up to a literal by a literal are unrolled when they run at most UNROLL_TRIPS times over
+# a body of at most UNROLL_NODES nodes
+UNROLL_TRIPS = 8
+UNROLL_NODES = 60
+MAX_ROUNDS = 4
+
+class Const:
+    # A constant operand. Equal only to constants of the same type, since True, 1 and 1.0 are equal in Python.
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return type(other) is Const and type(other.value) is type(self.value) and other.value == self.value
+
+    def __hash__(self):
+        return hash((type(self.value), self.value))
+
+    def __repr__(self):
+        return repr(self.value)
+
+    __str__ = __repr__
+
+class Instr:
+    # One three-address instruction, dest = op args, or a block's terminator: jump (extra is the target),
+    # branch (extra is the (true, false) targets), ret or halt. extra also holds the function a call calls, the
+    # slot of a global and the type a print prints. Operands are Consts or the names of values.
+    __slots__ = ('op', 'dest', 'args', 'extra')
+
+    def __init__(self, op, dest=None, args=(), extra=None):
+        self.op = op
+        self.dest = dest
+        self.args = list(args)
+        self.extra = extra
+
+    def __str__(self):
+        if self.op == 'jump':
+            return f"jump {self.extra.label}"
+        if self.op == 'branch':
+            return f"branch {self.args[0]}, {self.extra[0].label}, {self.extra[1].label}"
+        text = " ".join([self.op] + [str(arg) for arg in self.args])
+        if self.extra is not None:
+            text += f" [{self.extra}]"
+        return f"{self.dest} = {text}" if self.dest is not None else text
+
+class Phi:
+    # dest = the value of var coming from each predecessor block, once the function is in SSA form
+    __slots__ = ('var', 'dest', 'incoming')
+
+    def __init__(self, var, dest=None, incoming=None):
+        self.var = var
+        self.dest = dest
+        self.incoming = incoming if incoming is not None else {}
+
+    def __str__(self):
+        incoming = ", ".join(f"{block.label}: {value}" for block, value in self.incoming.items())
+        return f"{self.dest} = phi [{incoming}]"
+
+class Block:
+    __slots__ = ('label', 'phis', 'instrs', 'term', 'preds')
+
+    def __init__(self, label):
+        self.label = label
+        self.phis = []
+        self.instrs = []
+        self.term = None
+        self.preds = []
+
+def successors(block):
+    term = block.term
+    if term.op == 'jump':
+        return [term.extra]
+    if term.op == 'branch':
+        return list(term.extra)
+    return []
+
+class IRFunction:
+    # The control flow graph of one function, or of the main program, its entry first. Temporaries, named %n,
+    # are assigned once from the start. Each declaration is a variable of its own, assigned by copy
+    # instructions, and construct_ssa renames every assignment to a version of it, named variable.n, that is
+    # assigned once as well. Versions of one variable never overlap, so they can all share its frame slot, and
+    # phis need no copies; the passes keep it that way by only ever putting constants and temporaries in
+    # place of a value, never another version of a variable.
+    def __init__(self, name, return_type=None):
+        self.name = name
+        self.return_type = return_type
+        self.params = []
+        self.blocks = []
+        self.variables = {}
+        self.types = {}
+        self.base_of = {}
+        self.counter = 0
+        self.new_block()
+
+    def new_block(self):
+        block = Block(f"b{len(self.blocks)}")
+        self.blocks.append(block)
+        return block
+
+    def new_temp(self, value_type):
+        self.counter += 1
+        name = f"%{self.counter}"
+        self.types[name] = value_type
+        return name
+
+    def new_variable(self, identifier, value_type):
+        self.counter += 1
+        name = f"{identifier}:{self.counter}"
+        self.variables[name] = value_type
+        return name
+
+    def is_temp(self, value):
+        return isinstance(value, str) and value.startswith('%')
+
+    def __str__(self):
+        lines = [f"function {self.name}({', '.join(self.params)})"]
+        for block in self.blocks:
+            lines.append(f"  {block.label}:  preds {' '.join(pred.label for pred in block.preds) or '-'}")
+            lines.extend(f"    {line}" for line in block.phis + block.instrs + [block.term])
+        return "\n".join(str(line) for line in lines)
+
+class IRProgram:
+    def __init__(self, main, functions, global_names):
+        self.main = main
+        self.functions = functions
+        self.global_names = global_names
+
+    def __str__(self):
+        return "\n\n".join(str(function) for function in [self.main] + list(self.functions.values()))
+
+def constant_trip_count(node):
+    # How often a for loop runs if it counts a fresh int from a literal up to a literal by a literal, its body
+    # never assigns the counter and it is small enough to unroll; None otherwise
+    init, condition, post = node.init, node.condition, node.post
+    if not (isinstance(init, VariableDeclNode) and init.var_type == 'int' and isinstance(init.expr, LiteralNode)
+            and isinstance(condition, BinaryOpNode) and condition.operator in ('<', '<=', '>', '>=', '!=')
+            and isinstance(condition.left, IdentifierNode) and condition.left.binding == init.binding
+            and isinstance(condition.right, LiteralNode) and condition.right.expr_type == 'int'
+            and isinstance(post, AssignmentNode) and post.binding == init.binding
+            and isinstance(post.expr, BinaryOpNode) and post.expr.operator == '+'
+            and isinstance(post.expr.left, IdentifierNode) and post.expr.left.binding == init.binding
+            and isinstance(post.expr.right, LiteralNode) and post.expr.right.expr_type == 'int'):
+        return None
+    if count_nodes(node.block) > UNROLL_NODES:
+        return None
+    stack = [node.block]
+    while stack:
+        child = stack.pop()
+        if isinstance(child, FunctionDeclNode) or (isinstance(child, AssignmentNode) and child.binding == init.binding):
+            return None
+        stack.extend(iter_child_nodes(child))
+    counter, bound, step = init.expr.value, condition.right.value, post.expr.right.value
+    compare = BINARY_OPERATORS[condition.operator]
+    trips = 0
+    while compare(counter, bound):
+        trips += 1
+        if trips > UNROLL_TRIPS:
+            return None
+        counter += step
+    return trips
+
+class IRBuilder(NodeVisitor):
+    # Lowers an analysed AST to an IRProgram. Expressions give back their operand, statements append to the
+    # current block. Small for loops with a constant trip count are unrolled as they are lowered, which leaves
+    # their counter to the constant folding.
+    def __init__(self, stats):
+        self.stats = stats
+        self.function = None
+        self.block = None
+        self.visible = {}
+        self.functions = {}
+        self.global_names = {}
+
+    def build(self, program):
+        self.function = main = IRFunction('<main>')
+        self.block = main.blocks[0]
+        self.visit(program)
+        self.terminate('halt')
+        return IRProgram(main, self.functions, self.global_names)
+
+    def emit(self, op, args=(), value_type=None, extra=None):
+        dest = self.function.new_temp(value_type) if value_type is not None else None
+        self.block.instrs.append(Instr(op, dest, args, extra))
+        return dest
+
+    def terminate(self, op, args=(), extra=None):
+        self.block.term = Instr(op, None, args, extra)
+
+    def jump(self, target):
+        self.terminate('jump', extra=target)
+        self.block = target
+
+    def assign(self, name, binding, value, value_type, declaring=False):
+        if binding[0] == 0:
+            self.global_names.setdefault(binding[1], name)
+            self.emit('store_global', [value], extra=binding[1])
+            return
+        if declaring:
+            self.visible[binding] = self.function.new_variable(name, value_type)
+        self.block.instrs.append(Instr('copy', self.variable(name, binding), [value]))
+
+    def variable(self, name, binding):
+        # The IR variable of a local, which has to be one of the function being built, as no backend has closures
+        if binding not in self.visible:
+            raise CompileError(f"Variable '{name}' belongs to an enclosing function")
+        return self.visible[binding]
+
+    def generic_visit(self, node):
+        raise CompileError(f"Cannot compile {type(node).__name__}")
+
+    def visit_ErrorNode(self, node):
+        raise CompileError(f"Cannot compile a program with errors: {node.message}")
+
+    def visit_ProgramNode(self, node):
+        for stmt in node.statements:
+            yield stmt
+
+    def visit_FunctionDeclNode(self, node):
+        saved = self.function, self.block, self.visible
+        self.function = function = self.functions[node.identifier] = IRFunction(node.identifier, node.return_type)
+        self.block, self.visible = function.blocks[0], {}
+        for param in node.params:
+            self.visible[param.binding] = variable = function.new_variable(param.identifier, param.param_type)
+            function.params.append(variable)
+        yield node.block
+        self.terminate('ret', [Const(default_value(node.return_type))])
+        self.function, self.block, self.visible = saved
+
+    def visit_BlockNode(self, node):
+        for stmt in node.statements:
+            yield stmt
+
+    def visit_VariableDeclNode(self, node):
+        value = (yield node.expr) if node.expr is not None else Const(default_value(node.var_type))
+        self.assign(node.identifier, node.binding, value, node.var_type, declaring=True)
+
+    def visit_AssignmentNode(self, node):
+        value = yield node.expr
+        self.assign(node.identifier, node.binding, value, node.expr.expr_type)
+
+    def visit_ReturnStatementNode(self, node):
+        value = yield node.expr
+        self.terminate('ret', [value])
+        # Whatever follows is unreachable, and dropped with its block
+        self.block = self.function.new_block()
+
+    def visit_IfStatementNode(self, node):
+        condition = yield node.condition
+        then_block, merge = self.function.new_block(), self.function.new_block()
+        else_block = self.function.new_block() if node.else_block else merge
+        self.terminate('branch', [condition], (then_block, else_block))
+        self.block = then_block
+        yield node.if_block
+        self.jump(merge)
+        if node.else_block:
+            self.block = else_block
+            yield node.else_block
+            self.jump(merge)
+
+    def loop(self, condition, body, post=None):
+        header = self.function.new_block()
+        self.jump(header)
+        condition = yield condition
+        body_block, exit_block = self.function.new_block(), self.function.new_block()
+        self.terminate('branch', [condition], (body_block, exit_block))
+        self.block = body_block
+        yield body
+        if post is not None:
+            yield post
+        self.jump(header)
+        self.block = exit_block
+
+    def visit_WhileStatementNode(self, node):
+        yield from self.loop(node.condition, node.block)
+
+    def visit_ForStatementNode(self, node):
+        trips = constant_trip_count(node)
+        if node.init:
+            yield node.init
+        if trips is None:
+            yield from self.loop(node.condition, node.block, node.post)
+            return
+        self.stats["unrolled loops"] += 1
+        for _ in range(trips):
+            yield node.block
+            yield node.post
+
+    def visit_PrintStatementNode(self, node):
+        value = yield node.expr
+        self.emit('print', [value], extra=node.expr.expr_type)
+
+    def visit_DelayStatementNode(self, node):
+        value = yield node.expr
+        self.emit('delay', [value])
+
+    def visit_WriteStatementNode(self, node):
+        args = []
+        for arg in node.args:
+            args.append((yield arg))
+        if len(args) not in (3, 5):
+            raise CompileError(f"__write takes 3 arguments and __write_box 5, not {len(args)}")
+        self.emit('write' if len(args) == 3 else 'write_box', args)
+
+    def visit_BinaryOpNode(self, node):
+        left = yield node.left
+        right = yield node.right
+        op = '//' if node.operator == '/' and node.expr_type in ('int', 'colour') else node.operator
+        return self.emit(op, [left, right], node.expr_type)
+
+    def visit_UnaryOpNode(self, node):
+        operand = yield node.operand
+        return self.emit('not' if node.operator == 'not' else 'neg', [operand], node.expr_type)
+
+    def visit_LiteralNode(self, node):
+        return Const(node.value)
+
+    def visit_IdentifierNode(self, node):
+        if node.binding[0] == 0:
+            self.global_names.setdefault(node.binding[1], node.name)
+            return self.emit('load_global', value_type=node.expr_type, extra=node.binding[1])
+        return self.variable(node.name, node.binding)
+
+    def visit_FunctionCallNode(self, node):
+        args = []
+        for arg in node.args:
+            args.append((yield arg))
+        if node.name in BUILTIN_OPS:
+            return self.emit(BUILTIN_OPS[node.name], args, node.expr_type)
+        return self.emit('call', args, node.expr_type, extra=node.name)
+
+    def visit_CastNode(self, node):
+        value = yield node.expr
+        source_type, target_type = node.expr.expr_type, node.target_type
+        # Colours are ints at run time
+        if source_type == target_type or {source_type, target_type} == {'int', 'colour'}:
+            return value
+        return self.emit(CAST_NAMES[target_type], [value], target_type)
+
+def compute_cfg(function):
+    # Puts the blocks in reverse postorder, drops the unreachable ones and fills in the predecessors. Successors
+    # are searched last first, so that a branch's true target follows it and the code generator can fall into it.
+    entry = function.blocks[0]
+    order, seen = [], {entry}
+    stack = [(entry, reversed(successors(entry)))]
+    while stack:
+        block, pending = stack[-1]
+        for succ in pending:
+            if succ not in seen:
+                seen.add(succ)
+                stack.append((succ, reversed(successors(succ))))
+                break
+        else:
+            stack.pop()
+            order.append(block)
+    order.reverse()
+    for block in order:
+        block.preds = []
+    for block in order:
+        for succ in successors(block):
+            succ.preds.append(block)
+    for block in order:
+        for phi in block.phis:
+            for pred in [pred for pred in phi.incoming if pred not in seen]:
+                del phi.incoming[pred]
+    function.blocks = order
+
+def compute_dominators(function):
+    # The immediate dominator of every block, the entry's being itself, by the Cooper-Harvey-Kennedy iteration
+    blocks = function.blocks
+    index = {block: position for position, block in enumerate(blocks)}
+    idom = {blocks[0]: blocks[0]}
+    changed = True
+    while changed:
+        changed = False
+        for block in blocks[1:]:
+            new_idom = None
+            for pred in block.preds:
+                if pred not in idom:
+                    continue
+                if new_idom is None:
+                    new_idom = pred
+                    continue
+                finger = pred
+                while finger is not new_idom:
+                    while index[finger] > index[new_idom]:
+                        finger = idom[finger]
+                    while index[new_idom] > index[finger]:
+                        new_idom = idom[new_idom]
+            if idom.get(block) is not new_idom:
+                idom[block] = new_idom
+                changed = True
+    return idom
+
+def dominates(idom, a, b):
+    while b is not a:
+        parent = idom[b]
+        if parent is b:
+            return False
+        b = parent
+    return True
+
+def dominator_children(function, idom):
+    children = {block: [] for block in function.blocks}
+    for block in function.blocks[1:]:
+        children[idom[block]].append(block)
+    return children
+
+def construct_ssa(function):
+    # Places phis at the iterated dominance frontiers of each variable's assignments and renames every
+    # assignment and use to a version, walking the dominator tree
+    compute_cfg(function)
+    idom = compute_dominators(function)
+    frontier = {block: set() for block in function.blocks}
+    for block in function.blocks:
+        if len(block.preds) > 1:
+            for pred in block.preds:
+                runner = pred
+                while runner is not idom[block]:
+                    frontier[runner].add(block)
+                    runner = idom[runner]
+    variables = function.variables
+    assigned_in = {var: {function.blocks[0]} if var in function.params else set() for var in variables}
+    for block in function.blocks:
+        for instr in block.instrs:
+            if instr.dest in variables:
+                assigned_in[instr.dest].add(block)
+    for var, blocks in assigned_in.items():
+        pending, placed = list(blocks), set()
+        while pending:
+            for block in frontier[pending.pop()]:
+                if block not in placed:
+                    placed.add(block)
+                    block.phis.append(Phi(var))
+                    pending.append(block)
+
+    stacks = {var: [] for var in variables}
+    versions = {}
+
+    def new_version(var):
+        versions[var] = versions.get(var, 0) + 1
+        name = f"{var}.{versions[var]}"
+        function.base_of[name] = var
+        function.types[name] = variables[var]
+        stacks[var].append(name)
+        return name
+
+    def current(value):
+        return stacks[value][-1] if isinstance(value, str) and value in variables else value
+
+    function.params = [new_version(var) for var in function.params]
+    children = dominator_children(function, idom)
+    work = [(function.blocks[0], None)]
+    while work:
+        block, pushed = work.pop()
+        if pushed is not None:
+            for var in pushed:
+                stacks[var].pop()
+            continue
+        pushed = []
+        for phi in block.phis:
+            phi.dest = new_version(phi.var)
+            pushed.append(phi.var)
+        for instr in block.instrs + [block.term]:
+            instr.args = [current(arg) for arg in instr.args]
+            if instr.dest in variables:
+                pushed.append(instr.dest)
+                instr.dest = new_version(instr.dest)
+        for succ in successors(block):
+            for phi in succ.phis:
+                phi.incoming[block] = stacks[phi.var][-1] if stacks[phi.var] else None
+        work.append((block, pushed))
+        work.extend((child, None) for child in children[block])
+
+def count_uses(function):
+    uses = {}
+    for block in function.blocks:
+        for phi in block.phis:
+            for value in phi.incoming.values():
+                if value is not None:
+                    uses[value] = uses.get(value, 0) + 1
+        for instr in block.instrs + [block.term]:
+            for arg in instr.args:
+                if isinstance(arg, str):
+                    uses[arg] = uses.get(arg, 0) + 1
+    return uses
+
+def replace_uses(function, replacements):
+    # Replaces values by others, following chains, and returns whether anything changed. A phi operand is only
+    # ever replaced by another version of the phi's variable, so the versions that phis merge keep being
+    # assigned to the variable's slot.
+    changed = False
+    if not replacements:
+        return changed
+    for block in function.blocks:
+        for phi in block.phis:
+            for pred, value in phi.incoming.items():
+                replacement = value
+                while isinstance(replacement, str) and replacement in replacements:
+                    replacement = replacements[replacement]
+                if replacement != value and function.base_of.get(replacement) == phi.var:
+                    phi.incoming[pred] = replacement
+                    changed = True
+        for instr in block.instrs + [block.term]:
+            changed = replace_uses_in(instr, replacements) or changed
+    return changed
+
+def fold(op, values):
+    if op in CAST_FUNCTIONS:
+        return CAST_FUNCTIONS[op](values[0])
+    if op == 'neg':
+        return -values[0]
+    if op == 'not':
+        return not values[0]
+    if op == '//':
+        return operator.floordiv(*values)
+    return BINARY_OPERATORS[op](*values)
+
+def simplify_instruction(function, instr):
+    # A cheaper instruction computing the same as instr, or None. Only ints are simplified, as float
+    # arithmetic with 0 and 1 can still change a value's sign or raise.
+    if function.types.get(instr.dest) != 'int' or len(instr.args) != 2:
+        return None
+    left, right = instr.args
+    if instr.op in ('+', '*') and isinstance(left, Const):
+        left, right = right, left
+    if not isinstance(right, Const):
+        return None
+    if (instr.op == '+' and right.value == 0) or (instr.op in ('*', '//') and right.value == 1):
+        return Instr('copy', instr.dest, [left])
+    if instr.op == '*' and right.value == 0:
+        return Instr('copy', instr.dest, [Const(0)])
+    return None
+
+def fold_constants(function, stats):
+    # Folds instructions on constants, propagates constants and temporaries copied around, simplifies
+    # arithmetic with 0 and 1, resolves branches on constants and removes phis whose operands are all the same.
+    # Repeats until nothing changes, as loops feed values back to their headers.
+    changed = True
+    while changed:
+        changed = False
+        replacements = {}
+        for block in function.blocks:
+            for phi in list(block.phis):
+                values = {value for value in phi.incoming.values() if value is not None and value != phi.dest}
+                if len(values) == 1:
+                    replacements[phi.dest] = values.pop()
+                    block.phis.remove(phi)
+                    stats["phis removed"] += 1
+                    changed = True
+            kept = []
+            for instr in block.instrs:
+                changed = replace_uses_in(instr, replacements) or changed
+                simpler = simplify_instruction(function, instr) if instr.op in IR_BINARY_OPCODES else None
+                if simpler is not None:
+                    instr = simpler
+                    stats["identities"] += 1
+                    changed = True
+                if instr.op in PURE_OPS and instr.op not in ('copy', 'width', 'height') \
+                        and all(isinstance(arg, Const) for arg in instr.args):
+                    try:
+                        value = fold(instr.op, [arg.value for arg in instr.args])
+                    except ZeroDivisionError:
+                        value = None
+                    if value is not None:
+                        instr = Instr('copy', instr.dest, [Const(value)])
+                        stats["folded"] += 1
+                        changed = True
+                if instr.op == 'copy' and (isinstance(instr.args[0], Const) or function.is_temp(instr.args[0])):
+                    replacements[instr.dest] = instr.args[0]
+                    # A variable's copy stays, as phis may merge its version
+                    if function.is_temp(instr.dest):
+                        changed = True
+                        continue
+                kept.append(instr)
+            block.instrs = kept
+            term = block.term
+            changed = replace_uses_in(term, replacements) or changed
+            if term.op == 'branch' and (isinstance(term.args[0], Const) or term.extra[0] is term.extra[1]):
+                target = term.extra[0] if term.extra[0] is term.extra[1] or term.args[0].value else term.extra[1]
+                block.term = Instr('jump', extra=target)
+                stats["branches"] += 1
+                changed = True
+        changed = replace_uses(function, replacements) or changed
+        if changed:
+            compute_cfg(function)
+            merge_blocks(function)
+
+def replace_uses_in(instr, replacements):
+    changed = False
+    if replacements:
+        args = []
+        for arg in instr.args:
+            while isinstance(arg, str) and arg in replacements:
+                arg = replacements[arg]
+                changed = True
+            args.append(arg)
+        instr.args = args
+    return changed
+
+def merge_blocks(function):
+    # Appends every block to its only predecessor when that predecessor jumps nowhere else
+    merged = set()
+    replacements = {}
+    for block in function.blocks:
+        if block in merged:
+            continue
+        while block.term.op == 'jump':
+            target = block.term.extra
+            if target is block or target is function.blocks[0] or len(target.preds) != 1:
+                break
+            for phi in target.phis:
+                if phi.incoming.get(block) is not None:
+                    replacements[phi.dest] = phi.incoming[block]
+            block.instrs.extend(target.instrs)
+            block.term = target.term
+            for succ in successors(target):
+                for phi in succ.phis:
+                    if target in phi.incoming:
+                        phi.incoming[block] = phi.incoming.pop(target)
+            merged.add(target)
+    function.blocks = [block for block in function.blocks if block not in merged]
+    replace_uses(function, replacements)
+    compute_cfg(function)
+
+def eliminate_common_subexpressions(function, stats):
+    # Reuses the result of a pure instruction for every later one with the same operator and operands that it
+    # dominates, walking the dominator tree with a scoped table of what has been computed
+    idom = compute_dominators(function)
+    children = dominator_children(function, idom)
+    available = {}
+    replacements = {}
+    work = [(function.blocks[0], None)]
+    while work:
+        block, added = work.pop()
+        if added is not None:
+            for key in added:
+                del available[key]
+            continue
+        added = []
+        kept = []
+        for instr in block.instrs:
+            replace_uses_in(instr, replacements)
+            if instr.op in PURE_OPS and instr.op != 'copy' and function.is_temp(instr.dest):
+                args = instr.args
+                if instr.op in COMMUTATIVE_OPS:
+                    args = sorted(args, key=repr)
+                key = (instr.op, *args)
+                if key in available:
+                    replacements[instr.dest] = available[key]
+                    stats["eliminated"] += 1
+                    continue
+                available[key] = instr.dest
+                added.append(key)
+            kept.append(instr)
+        block.instrs = kept
+        work.append((block, added))
+        work.extend((child, None) for child in children[block])
+    replace_uses(function, replacements)
+
+def find_loops(function, idom):
+    # (header, body, latches) of every natural loop, innermost first
+    loops = {}
+    for block in function.blocks:
+        for succ in successors(block):
+            if dominates(idom, succ, block):
+                body, latches = loops.setdefault(succ, (set([succ]), []))
+                latches.append(block)
+                pending = [block]
+                while pending:
+                    member = pending.pop()
+                    if member not in body:
+                        body.add(member)
+                        pending.extend(member.preds)
+    return sorted(((header, body, latches) for header, (body, latches) in loops.items()), key=lambda loop: len(loop[1]))
+
+def preheader(header, body):
+    # The block that enters a loop, when it is the only one and goes nowhere else
+    outside = [pred for pred in header.preds if pred not in body]
+    if len(outside) == 1 and successors(outside[0]) == [header]:
+        return outside[0]
+    return None
+
+def can_fault(function, instr):
+    if instr.op in ('/', '//'):
+        divisor = instr.args[1]
+        return not (isinstance(divisor, Const) and divisor.value != 0)
+    # Floats can overflow to inf, which int() refuses
+    if instr.op == 'to_int':
+        return function.types.get(instr.args[0]) == 'float' or isinstance(instr.args[0], Const)
+    return False
+
+def hoist_loop_invariants(function, stats):
+    # Moves pure instructions whose operands do not change in a loop to its preheader. Instructions that can
+    # raise stay, as the loop might not have run them.
+    idom = compute_dominators(function)
+    for header, body, _ in find_loops(function, idom):
+        entry = preheader(header, body)
+        if entry is None:
+            continue
+        defined = {phi.dest for block in body for phi in block.phis}
+        defined.update(instr.dest for block in body for instr in block.instrs if instr.dest is not None)
+        for block in function.blocks:
+            if block not in body:
+                continue
+            kept = []
+            for instr in block.instrs:
+                if (instr.op in PURE_OPS and function.is_temp(instr.dest) and not can_fault(function, instr)
+                        and not any(arg in defined for arg in instr.args if isinstance(arg, str))):
+                    entry.instrs.append(instr)
+                    defined.discard(instr.dest)
+                    stats["hoisted"] += 1
+                else:
+                    kept.append(instr)
+            block.instrs = kept
+
+def reduce_induction_variables(function, stats):
+    # For an int i that a loop steps by a constant, replaces each i * c in the loop with a variable of its own
+    # that starts at the initial i * c and is stepped by step * c at the end of every iteration
+    idom = compute_dominators(function)
+    definitions = {instr.dest: instr for block in function.blocks for instr in block.instrs if instr.dest is not None}
+    replacements = {}
+    for header, body, latches in find_loops(function, idom):
+        entry = preheader(header, body)
+        if entry is None or len(latches) != 1:
+            continue
+        latch = latches[0]
+        for phi in list(header.phis):
+            if function.types.get(phi.dest) != 'int' or phi.incoming.get(entry) is None:
+                continue
+            back = definitions.get(phi.incoming.get(latch))
+            step = definitions.get(back.args[0]) if back is not None and back.op == 'copy' else None
+            if step is None or step.op != '+' or phi.dest not in step.args:
+                continue
+            increment = step.args[1] if step.args[0] == phi.dest else step.args[0]
+            if not (isinstance(increment, Const) and type(increment.value) is int):
+                continue
+            products = {}
+            for block in body:
+                for instr in block.instrs:
+                    if instr.op == '*' and phi.dest in instr.args and function.is_temp(instr.dest):
+                        factor = instr.args[1] if instr.args[0] == phi.dest else instr.args[0]
+                        if isinstance(factor, Const) and type(factor.value) is int:
+                            products.setdefault(factor.value, []).append((block, instr))
+            for factor, uses in products.items():
+                var = function.new_variable(f"{phi.var}*{factor}", 'int')
+                start = function.new_temp('int')
+                entry.instrs.append(Instr('*', start, [phi.incoming[entry], Const(factor)]))
+                initial, current, following = (f"{var}.{n}" for n in (1, 2, 3))
+                for version in (initial, current, following):
+                    function.base_of[version] = var
+                    function.types[version] = 'int'
+                entry.instrs.append(Instr('copy', initial, [start]))
+                header.phis.append(Phi(var, current, {entry: initial, latch: following}))
+                stepped = function.new_temp('int')
+                latch.instrs.append(Instr('+', stepped, [current, Const(increment.value * factor)]))
+                latch.instrs.append(Instr('copy', following, [stepped]))
+                for block, instr in uses:
+                    block.instrs.remove(instr)
+                    replacements[instr.dest] = current
+                stats["induction variables"] += 1
+    replace_uses(function, replacements)
+
+def eliminate_dead_code(function, stats):
+    # Removes instructions without effects and phis whose results are never used. An instruction that could
+    # fault stays, as the program has to stop there even if nothing reads its result.
+    while True:
+        uses = count_uses(function)
+        removed = 0
+        for block in function.blocks:
+            phis = [phi for phi in block.phis if uses.get(phi.dest)]
+            instrs = [instr for instr in block.instrs if instr.op not in REMOVABLE_OPS or uses.get(instr.dest)
+                      or can_fault(function, instr)]
+            removed += len(block.phis) - len(phis) + len(block.instrs) - len(instrs)
+            block.phis, block.instrs = phis, instrs
+        if not removed:
+            return
+        stats["removed"] += removed
+
+class IROptimizer:
+    # Puts every function of an IRProgram in SSA form and runs the passes over it, again while a round still
+    # changes something. stats counts what each pass did, lowering included.
+    def __init__(self, max_rounds=MAX_ROUNDS):
+        self.max_rounds = max_rounds
+        self.stats = {"lowering": {"unrolled loops": 0},
+                      "fold": {"folded": 0, "identities": 0, "branches": 0, "phis removed": 0},
+                      "cse": {"eliminated": 0},
+                      "licm": {"hoisted": 0},
+                      "strength": {"induction variables": 0},
+                      "dce": {"removed": 0}}
+
+    def build(self, program):
+        return IRBuilder(self.stats["lowering"]).build(program)
+
+    def optimize(self, ir_program):
+        for function in [ir_program.main] + list(ir_program.functions.values()):
+            self.optimize_function(function)
+        return ir_program
+
+    def optimize_function(self, function):
+        construct_ssa(function)
+        stats = self.stats
+        for _ in range(self.max_rounds):
+            before = self.total()
+            fold_constants(function, stats["fold"])
+            eliminate_common_subexpressions(function, stats["cse"])
+            hoist_loop_invariants(function, stats["licm"])
+            reduce_induction_variables(function, stats["strength"])
+            eliminate_dead_code(function, stats["dce"])
+            if self.total() == before:
+                break
+
+    def total(self):
+        return sum(count for counts in self.stats.values() for count in counts.values())
+
+    def format_stats(self):
+        return "\n".join(f"{name}: " + ", ".join(f"{count} {what}" for what, count in counts.items())
+                         for name, counts in self.stats.items())
+
+class CodeGenerator:
+    # Turns optimised IR into bytecode for the VM. Every version of a variable shares the variable's frame
+    # slot, so phis compile to nothing, and each temporary that is stored has a slot of its own. A temporary
+    # used once, later in its own block, stays on the operand stack instead when the instructions in between
+    # leave it there, which rebuilds the expression trees the AST compiler emits.
+    def __init__(self, ir_program):
+        self.ir_program = ir_program
+        self.constants = []
+        self.constant_index = {}
+        self.function_indices = {name: index for index, name in enumerate(ir_program.functions)}
+
+    def generate(self):
+        main = self.generate_function(self.ir_program.main)
+        functions = [self.generate_function(function) for function in self.ir_program.functions.values()]
+        global_names = [None] * (max(self.ir_program.global_names, default=-1) + 1)
+        for slot, name in self.ir_program.global_names.items():
+            global_names[slot] = name
+        return CompiledProgram(main, functions, self.constants, global_names)
+
+    def constant(self, value):
+        key = (type(value), value)
+        if key not in self.constant_index:
+            self.constant_index[key] = len(self.constants)
+            self.constants.append(value)
+        return self.constant_index[key]
+
+    def slot(self, name):
+        name = self.function.base_of.get(name, name)
+        if name not in self.slots:
+            self.slots[name] = len(self.slots)
+            self.code_object.local_names[self.slots[name]] = name
+        return self.slots[name]
+
+    def emit(self, opcode, arg=0):
+        self.code.append(opcode)
+        self.code.append(arg)
+
+    def generate_function(self, function):
+        self.function = function
+        self.code_object = code_object = CodeObject(function.name, len(function.params))
+        self.code = code_object.code
+        self.slots = {}
+        for param in function.params:
+            self.slot(param)
+        uses = count_uses(function)
+        # Where each temporary used exactly once is used
+        self.single_use = {}
+        for block in function.blocks:
+            for instr in block.instrs + [block.term]:
+                for arg in instr.args:
+                    if function.is_temp(arg) and uses.get(arg) == 1:
+                        self.single_use[arg] = block
+        self.uses = uses
+        positions, patches = {}, []
+        for index, block in enumerate(function.blocks):
+            following = function.blocks[index + 1] if index + 1 < len(function.blocks) else None
+            positions[block] = len(self.code)
+            self.generate_block(block, following, patches)
+        for position, block in patches:
+            self.code[position] = positions[block]
+        code_object.frame_size = max(len(self.slots), code_object.param_count)
+        return code_object
+
+    def push(self, args, stack, whole=False):
+        # Gets args onto the operand stack, taking those already on top of it off the list of what is there.
+        # What is below them stays, unless whole asks for nothing else to be left or it is needed above them.
+        count = 0
+        for size in range(min(len(stack), len(args)), 0, -1):
+            if stack[-size:] == args[:size]:
+                count = size
+                break
+        if (whole and count < len(stack)) or any(arg in stack for arg in args[count:]):
+            self.flush(stack)
+            count = 0
+        del stack[len(stack) - count:]
+        rest = args[count:]
+        position = 0
+        while position < len(rest):
+            arg = rest[position]
+            if isinstance(arg, Const):
+                self.emit(CONST, self.constant(arg.value))
+            elif position + 1 < len(rest) and isinstance(rest[position + 1], str) \
+                    and max(self.slot(arg), self.slot(rest[position + 1])) <= PACKED_LIMIT:
+                self.emit(LOAD_LOCAL_PAIR, self.slot(arg) | self.slot(rest[position + 1]) << 16)
+                position += 1
+            else:
+                self.emit(LOAD_LOCAL, self.slot(arg))
+            position += 1
+
+    def flush(self, stack):
+        while stack:
+            self.emit(STORE_LOCAL, self.slot(stack.pop()))
+
+    def result(self, dest, block, stack):
+        # Leaves a result on the stack for its only use in this block, or stores it
+        if dest is None:
+            return
+        if self.single_use.get(dest) is block:
+            stack.append(dest)
+        elif self.uses.get(dest):
+            self.emit(STORE_LOCAL, self.slot(dest))
+        else:
+            self.emit(POP)
+
+    def generate_block(self, block, following, patches):
+        stack = []
+        instrs = block.instrs
+        term = block.term
+        base_of = self.function.base_of
+        skip = False
+        for index, instr in enumerate(instrs):
+            if skip:
+                skip = False
+                continue
+            after = instrs[index + 1] if index + 1 < len(instrs) else None
+            op = instr.op
+            if (op == '+' and after is not None and after.op == 'copy' and after.args == [instr.dest]
+                    and self.uses.get(instr.dest) == 1 and isinstance(instr.args[1], Const)
+                    and type(instr.args[1].value) is int and instr.args[0] in base_of
+                    and base_of[instr.args[0]] == base_of.get(after.dest)
+                    and max(self.constant(instr.args[1].value), self.slot(after.dest)) <= PACKED_LIMIT):
+                # x = x + c, as one instruction that skips the copy
+                self.emit(INCREMENT_LOCAL, self.slot(after.dest) | self.constant(instr.args[1].value) << 16)
+                skip = True
+                continue
+            if (index == len(instrs) - 1 and term.op == 'branch' and term.args == [instr.dest]
+                    and op in COMPARE_JUMP_OPCODES and self.uses.get(instr.dest) == 1):
+                self.push(instr.args, stack, whole=True)
+                self.emit(COMPARE_JUMP_OPCODES[op])
+                patches.append((len(self.code) - 1, term.extra[1]))
+                self.jump_to(term.extra[0], following, patches)
+                return
+            if op == 'copy' and isinstance(instr.args[0], str) and self.slot(instr.args[0]) == self.slot(instr.dest):
+                continue
+            if op == 'store_global':
+                self.push(instr.args, stack)
+                self.emit(STORE_GLOBAL, instr.extra)
+                continue
+            if op == 'load_global':
+                self.emit(LOAD_GLOBAL, instr.extra)
+                self.result(instr.dest, block, stack)
+                continue
+            self.push(instr.args, stack)
+            if op in IR_BINARY_OPCODES:
+                self.emit(IR_BINARY_OPCODES[op])
+            elif op in UNARY_OPS:
+                self.emit(UNARY_OPS[op])
+            elif op in CAST_OPS:
+                self.emit(CAST_OPS[op])
+            elif op == 'call':
+                self.emit(CALL, self.function_index(instr.extra))
+            elif op == 'print':
+                self.emit(PRINT, VALUE_TYPES.index(instr.extra))
+            elif op in EFFECT_OPCODES:
+                self.emit(EFFECT_OPCODES[op])
+            elif op != 'copy':
+                raise CompileError(f"Cannot generate code for {op}")
+            if self.function.is_temp(instr.dest):
+                self.result(instr.dest, block, stack)
+            elif instr.dest is not None:
+                self.emit(STORE_LOCAL, self.slot(instr.dest))
+        if term.op == 'branch':
+            self.push(term.args, stack, whole=True)
+            self.emit(JUMP_IF_FALSE)
+            patches.append((len(self.code) - 1, term.extra[1]))
+            self.jump_to(term.extra[0], following, patches)
+        elif term.op == 'ret':
+            self.push(term.args, stack, whole=True)
+            self.emit(RETURN)
+        elif term.op == 'halt':
+            self.flush(stack)
+            self.emit(HALT)
+        else:
+            self.flush(stack)
+            self.jump_to(term.extra, following, patches)
+
+    def jump_to(self, target, following, patches):
+        if target is not following:
+            self.emit(JUMP)
+            patches.append((len(self.code) - 1, target))
+
+    def function_index(self, name):
+        if name not in self.function_indices:
+            raise CompileError(f"Function '{name}' is called but never declared")
+        return self.function_indices[name]
+
+def compile_program(program, optimizer=None):
+    # Analyses the AST, which raises on the first error, lowers it to IR, optimises that and generates bytecode
+    SemanticAnalyzer().visit(program)
+    optimizer = optimizer or IROptimizer()
+    return CodeGenerator(optimizer.optimize(optimizer.build(program))).generate()
+
+def compile_source(src_program_str, lexer=None, optimizer=None):
+    lexer = lexer or Lexer(engine="compiled")
+    return compile_program(Parser(lexer.GenerateTokenStream(src_program_str)).parse(), optimizer)
+
+def run_source(src_program_str, runtime=None):
+    # Compiles and runs a program through the IR, and returns the VM it ran on
+    vm = VM(runtime)
+    vm.run(compile_source(src_program_str))
+    return vm
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Compile a PArL program through the optimising IR and run it")
+    arg_parser.add_argument("path", help="source file")
+    arg_parser.add_argument("--dump", action="store_true", help="print the optimised IR and pass statistics")
+    arg_parser.add_argument("--disassemble", action="store_true", help="print the bytecode instead of running it")
+    arg_parser.add_argument("--seed", type=int, default=None, help="seed of __random_int and __randi")
+    arg_parser.add_argument("--no-delay", action="store_true", help="make __delay advance a virtual clock, not sleep")
+    args = arg_parser.parse_args(argv)
+
+    with open(args.path) as src_file:
+        program = Parser(Lexer(engine="compiled").GenerateTokenStream(src_file.read())).parse()
+    SemanticAnalyzer().visit(program)
+    optimizer = IROptimizer()
+    ir_program = optimizer.optimize(optimizer.build(program))
+    if args.dump:
+        print(ir_program)
+        print(optimizer.format_stats())
+        return 0
+    compiled = CodeGenerator(ir_program).generate()
+    if args.disassemble:
+        print(disassemble(compiled))
+        return 0
+    VM(Runtime(seed=args.seed, clock=VirtualClock() if args.no_delay else None)).run(compiled)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
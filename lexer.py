@@ -1,3 +1,7 @@
+import codecs
+import re
+import sys
+from array import array
 from enum import Enum
 
 class TokenType(Enum):
@@ -13,8 +17,173 @@ class TokenType(Enum):
     ARROW = "ARROW"
     LEXICAL_ERROR = "LEXICAL_ERROR"
 
+# Small integer token kinds, used by TokenStream in place of the TokenType value strings
+TOKEN_KINDS = [token_type.value for token_type in TokenType]
+TOKEN_KIND_INDEX = {value: kind for kind, value in enumerate(TOKEN_KINDS)}
+
+class SymbolKind:
+    # Finer integer token kinds for the parser: one per keyword, special function, operator and delimiter,
+    # and one per token type for everything else. Plain int class attributes rather than an IntEnum, since
+    # the parser compares against them on every token and enum member lookups are several times slower.
+    EOF = 0
+    IDENTIFIER = 1
+    LITERAL = 2
+    OPERATOR = 3
+    DELIMITER = 4
+    SPECIAL_FUNCTION = 5
+    KEYWORD = 6
+    ARROW = 7
+    LEXICAL_ERROR = 8
+    WHITESPACE = 9
+    FUN = 10
+    LET = 11
+    RETURN = 12
+    IF = 13
+    ELSE = 14
+    FOR = 15
+    WHILE = 16
+    AS = 17
+    INT = 18
+    FLOAT = 19
+    BOOL = 20
+    COLOUR = 21
+    PRINT = 22
+    DELAY = 23
+    WRITE = 24
+    WRITE_BOX = 25
+    RANDOM_INT = 26
+    WIDTH = 27
+    HEIGHT = 28
+    READ = 29
+    RANDI = 30
+    AND = 31
+    OR = 32
+    NOT = 33
+    ASSIGN = 34
+    PLUS = 35
+    MINUS = 36
+    MULTIPLY = 37
+    DIVIDE = 38
+    LESS = 39
+    GREATER = 40
+    LESS_EQUAL = 41
+    GREATER_EQUAL = 42
+    EQUAL = 43
+    NOT_EQUAL = 44
+    LEFT_PAREN = 45
+    RIGHT_PAREN = 46
+    LEFT_BRACE = 47
+    RIGHT_BRACE = 48
+    LEFT_BRACKET = 49
+    RIGHT_BRACKET = 50
+    COMMA = 51
+    SEMICOLON = 52
+    COLON = 53
+
+SYMBOL_KIND_COUNT = SymbolKind.COLON + 1
+
+# SymbolKind of every token with a fixed lexeme, keyed by the (type, lexeme) token tuple
+SYMBOL_KINDS = {
+    (TokenType.ARROW.value, "->"): SymbolKind.ARROW,
+}
+for kind, lexeme in ((SymbolKind.FUN, "fun"), (SymbolKind.LET, "let"), (SymbolKind.RETURN, "return"), (SymbolKind.IF, "if"),
+                     (SymbolKind.ELSE, "else"), (SymbolKind.FOR, "for"), (SymbolKind.WHILE, "while"), (SymbolKind.AS, "as"),
+                     (SymbolKind.INT, "int"), (SymbolKind.FLOAT, "float"), (SymbolKind.BOOL, "bool"),
+                     (SymbolKind.COLOUR, "colour")):
+    SYMBOL_KINDS[(TokenType.KEYWORD.value, lexeme)] = kind
+for kind, lexeme in ((SymbolKind.PRINT, "__print"), (SymbolKind.DELAY, "__delay"), (SymbolKind.WRITE, "__write"),
+                     (SymbolKind.WRITE_BOX, "__write_box"), (SymbolKind.RANDOM_INT, "__random_int"),
+                     (SymbolKind.WIDTH, "__width"), (SymbolKind.HEIGHT, "__height"), (SymbolKind.READ, "__read"),
+                     (SymbolKind.RANDI, "__randi")):
+    SYMBOL_KINDS[(TokenType.SPECIAL_FUNCTION.value, lexeme)] = kind
+for kind, lexeme in ((SymbolKind.AND, "and"), (SymbolKind.OR, "or"), (SymbolKind.NOT, "not"), (SymbolKind.ASSIGN, "="),
+                     (SymbolKind.PLUS, "+"), (SymbolKind.MINUS, "-"), (SymbolKind.MULTIPLY, "*"), (SymbolKind.DIVIDE, "/"),
+                     (SymbolKind.LESS, "<"), (SymbolKind.GREATER, ">"), (SymbolKind.LESS_EQUAL, "<="),
+                     (SymbolKind.GREATER_EQUAL, ">="), (SymbolKind.EQUAL, "=="), (SymbolKind.NOT_EQUAL, "!=")):
+    SYMBOL_KINDS[(TokenType.OPERATOR.value, lexeme)] = kind
+for kind, lexeme in ((SymbolKind.LEFT_PAREN, "("), (SymbolKind.RIGHT_PAREN, ")"), (SymbolKind.LEFT_BRACE, "{"),
+                     (SymbolKind.RIGHT_BRACE, "}"), (SymbolKind.LEFT_BRACKET, "["), (SymbolKind.RIGHT_BRACKET, "]"),
+                     (SymbolKind.COMMA, ","), (SymbolKind.SEMICOLON, ";"), (SymbolKind.COLON, ":")):
+    SYMBOL_KINDS[(TokenType.DELIMITER.value, lexeme)] = kind
+# Fallback kinds for tokens whose lexeme is not fixed, keyed by token type
+SYMBOL_TYPE_KINDS = {"EOF": SymbolKind.EOF}
+for token_type in TokenType:
+    if hasattr(SymbolKind, token_type.value):
+        SYMBOL_TYPE_KINDS[token_type.value] = getattr(SymbolKind, token_type.value)
+# The (type, lexeme) token each fixed-lexeme kind stands for, for error messages
+SYMBOL_TOKENS = {kind: token for token, kind in SYMBOL_KINDS.items()}
+
+def GetSymbolKind(token):
+    kind = SYMBOL_KINDS.get(token)
+    if kind is None:
+        return SYMBOL_TYPE_KINDS[token[0]]
+    return kind
+
+def SliceLexeme(src_program_str, start, end):
+    # NextToken can back up one character before the start of the input on an error at the very end,
+    # in which case its lexeme wraps around to the last character of the program
+    if start < 0:
+        return src_program_str[start] + src_program_str[:end]
+    return src_program_str[start:end]
+
+class TokenStream:
+    # Compact token list: the kind, start offset and length of every token are kept in parallel arrays and
+    # lexemes are sliced out of the source only when asked for. Indexing and iteration give the usual
+    # (type, lexeme) tuples, so a TokenStream can be handed straight to the Parser.
+    INTERNED_KINDS = frozenset({TOKEN_KIND_INDEX[TokenType.IDENTIFIER.value], TOKEN_KIND_INDEX[TokenType.KEYWORD.value],
+                                TOKEN_KIND_INDEX[TokenType.SPECIAL_FUNCTION.value]})
+
+    def __init__(self, src_program_str):
+        self.src_program_str = src_program_str
+        self.kinds = array("B")
+        self.starts = array("l")
+        self.lengths = array("L")
+
+    def Append(self, kind, start, length):
+        self.kinds.append(kind)
+        self.starts.append(start)
+        self.lengths.append(length)
+
+    def Kind(self, idx):
+        return self.kinds[idx]
+
+    def Type(self, idx):
+        return TOKEN_KINDS[self.kinds[idx]]
+
+    def Lexeme(self, idx):
+        start = self.starts[idx]
+        lexeme = SliceLexeme(self.src_program_str, start, start + self.lengths[idx])
+        if self.kinds[idx] in self.INTERNED_KINDS:
+            return sys.intern(lexeme)
+        return lexeme
+
+    def Position(self, idx):
+        # 1-based (line, column) of the start of a token, or of the end of the input for an index past the end
+        start = self.starts[idx] if idx < len(self.starts) else len(self.src_program_str)
+        start = max(start, 0)
+        line = self.src_program_str.count("\n", 0, start) + 1
+        return line, start - (self.src_program_str.rfind("\n", 0, start) + 1) + 1
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def __getitem__(self, idx):
+        return (TOKEN_KINDS[self.kinds[idx]], self.Lexeme(idx))
+
+    def __iter__(self):
+        for idx in range(len(self.kinds)):
+            yield self[idx]
+
 class Lexer:
-    def __init__(self):
+    KEYWORDS = frozenset({"fun", "let", "return", "if", "else", "for", "while", "as", "int", "float", "bool", "colour"})
+    SPECIAL_FUNCTIONS = frozenset({"__print", "__delay", "__write", "__write_box", "__random_int", "__width", "__height", "__read", "__randi"})
+    WORD_OPERATORS = frozenset({"and", "or", "not"})
+    BOOLEAN_LITERALS = frozenset({"true", "false"})
+
+    def __init__(self, engine="dfa"):
+        if engine not in ("dfa", "compiled", "regex"):
+            raise ValueError(f"Unknown lexer engine '{engine}'")
+        self.engine = engine
         self.lexeme_list = ["_", "letter", "digit", "ws", "eq", "sc", "other", "op", "delim", "dot", "hash", "gt", "minus"]
         self.states_list = [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12]
         self.states_accp = [1, 2, 3, 4, 5, 6, 7, 8, 10, 12]
@@ -70,23 +239,80 @@ class Lexer:
         self.Tx[0][self.lexeme_list.index("minus")] = 11
         self.Tx[11][self.lexeme_list.index("gt")] = 12
 
+        self.CompileTxTable()
+        self.CompileMasterRegex()
+
+    def CompileTxTable(self):
+        # Flat integer form of Tx used by the compiled engine. Entries hold the row offset
+        # (state * cols) of the next state, so a transition is Tx_flat[row + class]
+        self.Tx_flat = [self.Tx[state][cat] * self.cols if self.Tx[state][cat] >= 0 else -1
+                        for state in range(self.rows) for cat in range(self.cols)]
+        # Character classes of the first 256 code points, so the hot loop never calls CatChar
+        self.char_class = [self.lexeme_list.index(self.CatChar(chr(code))) for code in range(256)]
+        self.wide_char_class = {}
+        self.accepting = [state in self.states_accp for state in self.states_list]
+        # Accepting flags and token kinds (indices into TOKEN_KINDS) indexed by row offset
+        self.row_accepting = [False] * (self.rows * self.cols)
+        self.row_token_kind = [-1] * (self.rows * self.cols)
+        for state in self.states_accp:
+            self.row_accepting[state * self.cols] = True
+            self.row_token_kind[state * self.cols] = TOKEN_KIND_INDEX[self.GetTokenTypeByFinalState(state, "")[0]]
+        # Word lexemes (state 1) that are not plain identifiers
+        self.identifier_kind = TOKEN_KIND_INDEX[TokenType.IDENTIFIER.value]
+        self.error_kind = TOKEN_KIND_INDEX[TokenType.LEXICAL_ERROR.value]
+        self.word_token_kind = {}
+        for words, token_type in ((self.BOOLEAN_LITERALS, TokenType.LITERAL), (self.WORD_OPERATORS, TokenType.OPERATOR),
+                                  (self.SPECIAL_FUNCTIONS, TokenType.SPECIAL_FUNCTION), (self.KEYWORDS, TokenType.KEYWORD)):
+            for word in words:
+                self.word_token_kind[word] = TOKEN_KIND_INDEX[token_type.value]
+
+    def CompileMasterRegex(self):
+        # One alternative per DFA token, with character classes taken from the first 256 entries of char_class.
+        # The alternatives start on disjoint classes (apart from int/float, where float comes first), so the
+        # first one that matches is also the longest, as in the DFA. Anything else is an error lexeme that runs
+        # up to the next whitespace or semicolon, the same recovery as NextToken.
+        classes = {cat: "" for cat in self.lexeme_list}
+        for code, cat in enumerate(self.char_class):
+            classes[self.lexeme_list[cat]] += re.escape(chr(code))
+        ws, letter, digit = f"[{classes['ws']}]", f"[{classes['letter']}]", f"[{classes['digit']}]"
+        word_start, word_char = f"[{classes['letter']}{classes['_']}]", f"[{classes['letter']}{classes['digit']}{classes['_']}]"
+        alternatives = [
+            ("WHITESPACE", f"{ws}+"),
+            ("WORD", f"{word_start}{word_char}*"),
+            ("FLOAT", f"{digit}+\\.{digit}*"),
+            ("INT", f"{digit}+"),
+            ("COLOUR", f"#[{classes['letter']}{classes['digit']}]+"),
+            ("ARROW", "->"),
+            ("OPERATOR", f"[{classes['op']}{classes['gt']}]=*|="),
+            ("DELIMITER", f"[{classes['delim']}{classes['sc']}]"),
+            ("ERROR", f"[^{classes['ws']};]+"),
+        ]
+        self.master_regex = re.compile("|".join(f"(?P<{name}>{pattern})" for name, pattern in alternatives), re.DOTALL)
+        self.regex_group_type = {"FLOAT": TokenType.LITERAL.value, "INT": TokenType.LITERAL.value,
+                                 "COLOUR": TokenType.LITERAL.value, "ARROW": TokenType.ARROW.value,
+                                 "OPERATOR": TokenType.OPERATOR.value, "DELIMITER": TokenType.DELIMITER.value,
+                                 "ERROR": TokenType.LEXICAL_ERROR.value}
+        self.regex_group_kind = {group: SYMBOL_TYPE_KINDS[token_type] for group, token_type in self.regex_group_type.items()}
+        # Shared token tuple, SymbolKind and the regex group that produces it, for every fixed lexeme
+        self.fixed_tokens = {}
+        for token, kind in SYMBOL_KINDS.items():
+            group = "WORD" if token[1][0].isalpha() or token[1][0] == "_" else token[0]
+            self.fixed_tokens[token[1]] = (token, kind, group)
+        for word in self.BOOLEAN_LITERALS:
+            self.fixed_tokens[word] = ((TokenType.LITERAL.value, word), SymbolKind.LITERAL, "WORD")
+
     def AcceptingStates(self, state):
         return state in self.states_accp
 
     def GetTokenTypeByFinalState(self, state, lexeme):
-        keywords = {"fun", "let", "return", "if", "else", "for", "while", "as", "int", "float", "bool", "colour"}
-        special_functions = {"__print", "__delay", "__write", "__write_box", "__random_int", "__width", "__height", "__read", "__randi"}
-        operators = {"and", "or", "not"}
-        boolean_literals = {"true", "false"}
-
         if state == 1:
-            if lexeme in keywords:
+            if lexeme in self.KEYWORDS:
                 return (TokenType.KEYWORD.value, lexeme)
-            elif lexeme in special_functions:
+            elif lexeme in self.SPECIAL_FUNCTIONS:
                 return (TokenType.SPECIAL_FUNCTION.value, lexeme)
-            elif lexeme in operators:
+            elif lexeme in self.WORD_OPERATORS:
                 return (TokenType.OPERATOR.value, lexeme)
-            elif lexeme in boolean_literals:
+            elif lexeme in self.BOOLEAN_LITERALS:
                 return (TokenType.LITERAL.value, lexeme)
             return (TokenType.IDENTIFIER.value, lexeme)
         elif state == 2:
@@ -198,24 +424,205 @@ class Lexer:
         else:
             return (TokenType.LEXICAL_ERROR.value, lexeme), lexeme
 
-    def GenerateTokens(self, src_program_str):
+    def WideCharClass(self, character):
+        cat = self.wide_char_class.get(character)
+        if cat is None:
+            cat = self.wide_char_class[character] = self.lexeme_list.index(self.CatChar(character))
+        return cat
+
+    def ErrorLexemeEnd(self, src_program_str, src_program_idx):
+        # Same recovery as NextToken: read up to the next whitespace or semicolon
+        end = len(src_program_str)
+        while src_program_idx < end:
+            character = src_program_str[src_program_idx]
+            if character.isspace() or character == ";":
+                break
+            src_program_idx += 1
+        return src_program_idx
+
+    def NextTokenSpan(self, src_program_str, src_program_idx):
+        # Integer-table equivalent of NextToken, including its rollback and end of input behaviour.
+        # Returns the token kind and the start and end offsets of its lexeme.
+        Tx_flat = self.Tx_flat
+        char_class = self.char_class
+        row_accepting = self.row_accepting
+        end = len(src_program_str)
+        start_idx = src_program_idx
+        row = 0
+        accept_row = -1
+        accept_idx = start_idx
+
+        while True:
+            if row_accepting[row]:
+                accept_row = row
+                accept_idx = src_program_idx
+            if src_program_idx >= end:
+                at_end = True
+                break
+            code = ord(src_program_str[src_program_idx])
+            cat = char_class[code] if code < 256 else self.WideCharClass(src_program_str[src_program_idx])
+            src_program_idx += 1
+            row = Tx_flat[row + cat]
+            if row < 0:
+                at_end = False
+                break
+
+        if accept_row < 0:
+            # NextToken pops every state, moving back one character past the start when the input ran out
+            if at_end:
+                start_idx -= 1
+            return self.error_kind, start_idx, self.ErrorLexemeEnd(src_program_str, start_idx)
+
+        # NextToken drops the final character when the input runs out, even when it was accepted
+        if at_end:
+            accept_idx -= 1
+        if accept_row == self.cols:  # state 1, identifiers and words
+            return self.word_token_kind.get(src_program_str[start_idx:accept_idx], self.identifier_kind), start_idx, accept_idx
+        return self.row_token_kind[accept_row], start_idx, accept_idx
+
+    def NextTokenCompiled(self, src_program_str, src_program_idx):
+        kind, start, end = self.NextTokenSpan(src_program_str, src_program_idx)
+        lexeme = SliceLexeme(src_program_str, start, end)
+        return (TOKEN_KINDS[kind], lexeme), lexeme
+
+    def GenerateTokensRegex(self, src_program_str, kinds=None):
+        # GenerateTokens with the scanning loop run by the re engine over master_regex. Tokens with a fixed
+        # lexeme are shared tuples looked up together with their SymbolKind, which goes into kinds if given.
+        src_len = len(src_program_str)
+        if src_len and not src_program_str.isascii() and max(src_program_str) > "\xff":
+            # Character classes beyond the first 256 code points are only known to CatChar
+            return self.GenerateTokens(src_program_str, engine="compiled", kinds=kinds)
+        tokens_list = []
+        append = tokens_list.append
+        kinds_list = [] if kinds is None else kinds
+        append_kind = kinds_list.append
+        group_type = self.regex_group_type
+        group_kind = self.regex_group_kind
+        fixed_tokens = self.fixed_tokens
+        identifier_type = TokenType.IDENTIFIER.value
+        identifier_kind = SymbolKind.IDENTIFIER
+
+        for match in self.master_regex.finditer(src_program_str):
+            group = match.lastgroup
+            start, end = match.span()
+            if end >= src_len:
+                # NextToken drops the last character of a token that runs into the end of the input. A lone
+                # '-' or '#' is the one error that does so too, and it backs up onto the last character instead.
+                if group != "ERROR":
+                    end -= 1
+                elif src_len == 1 and src_program_str in "-#":
+                    start = -1
+            if group != "WHITESPACE":
+                lexeme = SliceLexeme(src_program_str, start, end)
+                fixed = fixed_tokens.get(lexeme)
+                if fixed is not None and group == fixed[2]:
+                    append(fixed[0])
+                    append_kind(fixed[1])
+                elif group == "WORD":
+                    append((identifier_type, lexeme))
+                    append_kind(identifier_kind)
+                else:
+                    append((group_type[group], lexeme))
+                    append_kind(group_kind[group])
+            if match.end() >= (src_len - 1):
+                break  # Same end of input cut off as GenerateTokens
+        return tokens_list
+
+    def GenerateTokens(self, src_program_str, engine=None, kinds=None):
+        # If a kinds list is given, the SymbolKind of every token is appended to it
+        engine = engine or self.engine
+        if engine == "regex":
+            return self.GenerateTokensRegex(src_program_str, kinds)
         tokens_list = []
         src_program_idx = 0
+        src_len = len(src_program_str)
+        whitespace = TokenType.WHITESPACE.value
+        next_token = self.NextTokenCompiled if engine == "compiled" else self.NextToken
 
-        while src_program_idx < len(src_program_str):
-            token, lexeme = self.NextToken(src_program_str, src_program_idx)
-            if token[0] != TokenType.WHITESPACE.value:
+        while src_program_idx < src_len:
+            token, lexeme = next_token(src_program_str, src_program_idx)
+            if token[0] != whitespace:
                 tokens_list.append(token)
-            if token[0] == TokenType.LEXICAL_ERROR.value:
-                src_program_idx += len(lexeme)  # Skip the erroneous lexeme
-            else:
-                src_program_idx += len(lexeme)
+            # Lexical errors are skipped over by the length of the erroneous lexeme as well
+            src_program_idx += len(lexeme)
 
-            if src_program_idx >= (len(src_program_str) - 1):
+            if src_program_idx >= (src_len - 1):
                 break  # Explicitly break the loop if we've reached the end of the input string
 
+        if kinds is not None:
+            kinds.extend(map(GetSymbolKind, tokens_list))
         return tokens_list
 
+    def GenerateTokenStream(self, src_program_str):
+        # GenerateTokens into a compact TokenStream, always using the compiled tables
+        tokens = TokenStream(src_program_str)
+        append = tokens.Append
+        next_token_span = self.NextTokenSpan
+        whitespace_kind = TOKEN_KIND_INDEX[TokenType.WHITESPACE.value]
+        src_program_idx = 0
+        src_len = len(src_program_str)
+
+        while src_program_idx < src_len:
+            kind, start, end = next_token_span(src_program_str, src_program_idx)
+            if kind != whitespace_kind:
+                append(kind, start, end - start)
+            src_program_idx += end - start
+
+            if src_program_idx >= (src_len - 1):
+                break  # Explicitly break the loop if we've reached the end of the input string
+
+        return tokens
+
+    def IterTokens(self, src_stream, chunk_size=1 << 16):
+        # Streaming form of GenerateTokens. src_stream may be a string, a text or binary file or an mmap.
+        # Only the unconsumed tail of the input is buffered, so memory is bounded by the chunk size
+        # and the longest lexeme rather than by the program size.
+        if isinstance(src_stream, str):
+            chunks = iter((src_stream,))
+        elif hasattr(src_stream, "read"):
+            chunks = iter(lambda: src_stream.read(chunk_size), src_stream.read(0))
+        else:
+            chunks = iter(src_stream)
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        whitespace = TokenType.WHITESPACE.value
+        # The regex engine needs the whole input, so streaming uses the compiled tables instead
+        next_token = self.NextToken if self.engine == "dfa" else self.NextTokenCompiled
+
+        buffer = ""
+        src_program_idx = 0
+        end_of_stream = False
+        while True:
+            buf_len = len(buffer)
+            if src_program_idx >= buf_len or not end_of_stream and src_program_idx >= buf_len - 1:
+                token = None
+            else:
+                token, lexeme = next_token(buffer, src_program_idx)
+                # A token is only final once the character after it has been read, since the DFA looks one
+                # character past the lexeme and error recovery stops at the next whitespace or semicolon
+                if not end_of_stream and src_program_idx + len(lexeme) >= buf_len - 1:
+                    token = None
+
+            if token is None:
+                if end_of_stream:
+                    return
+                chunk = next(chunks, None)
+                if chunk is None:
+                    end_of_stream = True
+                    chunk = decoder.decode(b"", final=True)
+                elif isinstance(chunk, (bytes, bytearray, memoryview)):
+                    chunk = decoder.decode(chunk)
+                # Drop the consumed part of the buffer before appending the next chunk
+                buffer = buffer[src_program_idx:] + chunk
+                src_program_idx = 0
+                continue
+
+            if token[0] != whitespace:
+                yield token
+            src_program_idx += len(lexeme)
+
+            if end_of_stream and src_program_idx >= (buf_len - 1):
+                return  # Same end of input cut off as GenerateTokens
+
 if __name__ == "__main__":
     lex = Lexer()
     input_code = '''
@@ -227,7 +634,7 @@ if __name__ == "__main__":
     return true;
 }
     '''
-    toks = lex.GenerateTokens(input_code)
+    toks = lex.GenerateTokenStream(input_code)
     with open("tokens.txt", "w") as f:
         for t in toks:
             f.write(f"{t}\n")
@@ -0,0 +1,296 @@
+import argparse
+import operator
+import sys
+
+from lexer import Lexer
+from LLK_Parser import Parser
+from parser_nodes import VariableDeclNode, BinaryOpNode, LiteralNode, FunctionCallNode, FunctionDeclNode, traverse
+from Semantic_Analyzer import SemanticAnalyzer
+from runtime import BINARY_OPERATORS, cast_value
+from visitor import NodeVisitor, NodeTransformer, iter_child_nodes
+
+# Special functions that neither change nor depend on anything but their arguments and the display
+PURE_BUILTINS = frozenset({'__width', '__height', '__read'})
+# Rounds of folding and elimination run at most, each of which can expose more work for the next
+MAX_ROUNDS = 4
+
+def make_literal(value, value_type, like):
+    # A literal of a PArL type in place of the node like, or None for a colour that no literal can spell
+    if value_type == 'colour':
+        value = int(value)
+        if not 0 <= value <= 0xFFFFFF:
+            return None
+    else:
+        value = cast_value(value, value_type)
+    return LiteralNode(value, value_type, start=like.start, end=like.end)
+
+def is_pure(expr):
+    # Whether evaluating an expression can neither have an effect nor fail, so that it can be dropped
+    stack = [expr]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, FunctionCallNode) and node.name not in PURE_BUILTINS:
+            return False
+        if isinstance(node, BinaryOpNode) and node.operator == '/' and not (
+                isinstance(node.right, LiteralNode) and node.right.value):
+            return False
+        stack.extend(iter_child_nodes(node))
+    return True
+
+def count_nodes(node):
+    count = 0
+    stack = [node]
+    while stack:
+        count += 1
+        stack.extend(iter_child_nodes(stack.pop()))
+    return count
+
+class UsageCounter(NodeVisitor):
+    # Finds the declaration every variable reference and assignment is to, by following the (depth, slot)
+    # bindings in source order, and counts the reads and assignments of each declaration and the functions
+    # each function, or the main program under None, calls.
+    def __init__(self):
+        self.visible = {}
+        self.declaration_of = {}
+        self.reads = {}
+        self.assignments = {}
+        self.calls = {None: set()}
+        self.function = None
+
+    def visit_FunctionDeclNode(self, node):
+        saved = self.visible, self.function
+        self.visible, self.function = dict(self.visible), node.identifier
+        self.calls.setdefault(node.identifier, set())
+        for param in node.params:
+            self.visible[param.binding] = param
+        yield node.block
+        self.visible, self.function = saved
+
+    def visit_VariableDeclNode(self, node):
+        if node.expr is not None:
+            yield node.expr
+        self.visible[node.binding] = node
+
+    def visit_AssignmentNode(self, node):
+        declaration = self.declaration_of[node] = self.visible.get(node.binding)
+        self.assignments[declaration] = self.assignments.get(declaration, 0) + 1
+        yield node.expr
+
+    def visit_IdentifierNode(self, node):
+        declaration = self.declaration_of[node] = self.visible.get(node.binding)
+        self.reads[declaration] = self.reads.get(declaration, 0) + 1
+
+    def visit_FunctionCallNode(self, node):
+        if not node.name.startswith('__'):
+            self.calls[self.function].add(node.name)
+        for arg in node.args:
+            yield arg
+
+class ConstantFolder(NodeTransformer):
+    # Replaces operators, unary operators and casts on literals with the literal they evaluate to, following
+    # PArL semantics: int division floors, casts to int truncate and colours are ints. Variables declared with
+    # a literal, once folded, and never assigned again are replaced by it. Divisions by zero are left for
+    # run time.
+    def __init__(self, usage, stats):
+        self.usage = usage
+        self.stats = stats
+
+    def fold(self, node, value):
+        literal = make_literal(value, node.expr_type, node)
+        if literal is None:
+            return node
+        self.stats["folded"] += 1
+        return literal
+
+    def visit_BinaryOpNode(self, node):
+        node.left = left = yield node.left
+        node.right = right = yield node.right
+        if not (isinstance(left, LiteralNode) and isinstance(right, LiteralNode)):
+            return node
+        op = BINARY_OPERATORS[node.operator]
+        if node.operator == '/' and node.expr_type != 'float':
+            op = operator.floordiv
+        try:
+            value = op(left.value, right.value)
+        except ZeroDivisionError:
+            return node
+        return self.fold(node, value)
+
+    def visit_UnaryOpNode(self, node):
+        node.operand = operand = yield node.operand
+        # not of an int or colour is typed as its operand but evaluates to a bool, which no literal of that
+        # type could stand for
+        if not isinstance(operand, LiteralNode) or (node.operator == 'not' and node.expr_type != 'bool'):
+            return node
+        value = operand.value
+        return self.fold(node, not value if node.operator == 'not' else -value)
+
+    def visit_CastNode(self, node):
+        node.expr = expr = yield node.expr
+        if not isinstance(expr, LiteralNode):
+            return node
+        return self.fold(node, expr.value)
+
+    def visit_IdentifierNode(self, node):
+        declaration = self.usage.declaration_of.get(node)
+        if (isinstance(declaration, VariableDeclNode) and isinstance(declaration.expr, LiteralNode)
+                and not self.usage.assignments.get(declaration)):
+            self.stats["propagated"] += 1
+            return LiteralNode(declaration.expr.value, declaration.expr.expr_type, start=node.start, end=node.end)
+        return node
+
+class DeadCodeEliminator(NodeTransformer):
+    # Removes code that can never run or whose result is never used: the branch an if with a literal condition
+    # does not take, loops whose condition is the literal false, statements after one that always returns,
+    # variables that are never read or assigned and whose initialiser is pure, and functions that the main
+    # program can never reach through calls. A branch taken for good is kept as a block of its own, so the
+    # bindings inside it stay valid. Code that never runs but declares a function that is called is kept.
+    def __init__(self, usage, stats):
+        self.usage = usage
+        self.stats = stats
+        # Statements that return on every path through them
+        self.returning = set()
+        self.reachable = set()
+        pending = [None]
+        while pending:
+            for callee in usage.calls.get(pending.pop(), ()):
+                if callee not in self.reachable:
+                    self.reachable.add(callee)
+                    pending.append(callee)
+
+    def declares_function(self, node):
+        # Whether a statement declares a function that can be called. Declarations are hoisted, so one in code
+        # that never runs can still be called and has to stay.
+        stack = [node] if node is not None else []
+        while stack:
+            node = stack.pop()
+            if isinstance(node, FunctionDeclNode) and node.identifier in self.reachable:
+                return True
+            stack.extend(iter_child_nodes(node))
+        return False
+
+    def statements(self, node):
+        node = yield from self.generic_visit(node)
+        for index, stmt in enumerate(node.statements):
+            if stmt in self.returning:
+                unreachable = node.statements[index + 1:]
+                kept = [stmt for stmt in unreachable if self.declares_function(stmt)]
+                if len(kept) < len(unreachable):
+                    self.stats["unreachable statements"] += len(unreachable) - len(kept)
+                    node.statements[index + 1:] = kept
+                self.returning.add(node)
+                break
+        return node
+
+    def visit_ProgramNode(self, node):
+        return (yield from self.statements(node))
+
+    def visit_BlockNode(self, node):
+        return (yield from self.statements(node))
+
+    def visit_FunctionDeclNode(self, node):
+        if node.identifier not in self.reachable:
+            self.stats["unused functions"] += 1
+            return None
+        return (yield from self.generic_visit(node))
+
+    def visit_ReturnStatementNode(self, node):
+        self.returning.add(node)
+        return node
+
+    def visit_VariableDeclNode(self, node):
+        if (not self.usage.reads.get(node) and not self.usage.assignments.get(node)
+                and (node.expr is None or is_pure(node.expr))):
+            self.stats["unused variables"] += 1
+            return None
+        return node
+
+    def visit_IfStatementNode(self, node):
+        if isinstance(node.condition, LiteralNode) and not self.declares_function(
+                node.else_block if node.condition.value else node.if_block):
+            self.stats["branches"] += 1
+            taken = node.if_block if node.condition.value else node.else_block
+            return (yield taken) if taken is not None else None
+        node = yield from self.generic_visit(node)
+        if node.if_block in self.returning and node.else_block in self.returning:
+            self.returning.add(node)
+        return node
+
+    def visit_WhileStatementNode(self, node):
+        if isinstance(node.condition, LiteralNode) and not node.condition.value \
+                and not self.declares_function(node.block):
+            self.stats["loops"] += 1
+            return None
+        return (yield from self.generic_visit(node))
+
+    def visit_ForStatementNode(self, node):
+        if (isinstance(node.condition, LiteralNode) and not node.condition.value
+                and (node.init is None or node.init.expr is None or is_pure(node.init.expr))
+                and not self.declares_function(node.block)):
+            self.stats["loops"] += 1
+            return None
+        return (yield from self.generic_visit(node))
+
+    def visit_Node(self, node):
+        # Expressions are left to the ConstantFolder
+        return node
+
+class Optimizer:
+    # Runs constant folding and propagation, then dead code elimination, over an analysed AST in place, again
+    # while a round still changes something. stats counts what each pass did over all rounds.
+    def __init__(self, max_rounds=MAX_ROUNDS):
+        self.max_rounds = max_rounds
+        self.stats = {"fold": {"folded": 0, "propagated": 0},
+                      "dce": {"branches": 0, "loops": 0, "unreachable statements": 0, "unused variables": 0,
+                              "unused functions": 0},
+                      "rounds": 0, "nodes before": 0, "nodes after": 0}
+
+    def optimize(self, program):
+        self.stats["nodes before"] = count_nodes(program)
+        for _ in range(self.max_rounds):
+            before = self.total()
+            usage = UsageCounter()
+            usage.visit(program)
+            ConstantFolder(usage, self.stats["fold"]).visit(program)
+            usage = UsageCounter()
+            usage.visit(program)
+            DeadCodeEliminator(usage, self.stats["dce"]).visit(program)
+            self.stats["rounds"] += 1
+            if self.total() == before:
+                break
+        self.stats["nodes after"] = count_nodes(program)
+        return program
+
+    def total(self):
+        return sum(self.stats["fold"].values()) + sum(self.stats["dce"].values())
+
+    def format_stats(self):
+        stats = self.stats
+        lines = [f"{stats['nodes before']} nodes before, {stats['nodes after']} after, in {stats['rounds']} rounds"]
+        for name in ("fold", "dce"):
+            lines.append(f"{name}: " + ", ".join(f"{count} {what}" for what, count in stats[name].items()))
+        return "\n".join(lines)
+
+def optimize(program):
+    # Analyses the AST, which raises on the first error, and optimises it. Returns the Optimizer for its stats.
+    SemanticAnalyzer().visit(program)
+    optimizer = Optimizer()
+    optimizer.optimize(program)
+    return optimizer
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Optimise a PArL program and report what each pass removed")
+    arg_parser.add_argument("path", help="source file")
+    arg_parser.add_argument("--print-tree", action="store_true", help="print the optimised tree")
+    args = arg_parser.parse_args(argv)
+
+    with open(args.path) as src_file:
+        program = Parser(Lexer(engine="compiled").GenerateTokenStream(src_file.read())).parse()
+    optimizer = optimize(program)
+    if args.print_tree:
+        traverse(program)
+    print(optimizer.format_stats())
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,244 +1,457 @@
-class ProgramNode:
-    def __init__(self, statements):
+from visitor import NodeVisitor
+
+class Node:
+    # Base of every AST node. Nodes have fixed slots rather than an instance __dict__, which makes a large
+    # tree several times smaller. start and end are the node's span in the token stream: the index of its
+    # first token and one past its last, or None for nodes that were not built from tokens. child_fields names
+    # the fields that hold child nodes or lists of them, in source order, for the walkers in visitor.py.
+    __slots__ = ('start', 'end')
+    child_fields = ()
+
+class ProgramNode(Node):
+    __slots__ = ('statements',)
+    child_fields = ('statements',)
+
+    def __init__(self, statements, start=None, end=None):
         self.statements = statements
+        self.start = start
+        self.end = end
 
     def __str__(self):
         return f"ProgramNode(statements={self.statements})"
 
-class FunctionDeclNode:
-    def __init__(self, identifier, params, return_type, block):
+class FunctionDeclNode(Node):
+    __slots__ = ('identifier', 'params', 'return_type', 'block')
+    child_fields = ('params', 'block')
+
+    def __init__(self, identifier, params, return_type, block, start=None, end=None):
         self.identifier = identifier
         self.params = params
         self.return_type = return_type
         self.block = block
+        self.start = start
+        self.end = end
 
     def __str__(self):
         return (f"FunctionDeclNode(identifier={self.identifier}, params={self.params}, "
                 f"return_type={self.return_type}, block={self.block})")
 
-class ParamNode:
-    def __init__(self, identifier, param_type):
+class ParamNode(Node):
+    # binding, like that of the other nodes that name a variable, is its (depth, slot) in the SymbolTable,
+    # filled in by the SemanticAnalyzer
+    __slots__ = ('identifier', 'param_type', 'binding')
+    child_fields = ()
+
+    def __init__(self, identifier, param_type, binding=None, start=None, end=None):
         self.identifier = identifier
         self.param_type = param_type
+        self.binding = binding
+        self.start = start
+        self.end = end
 
     def __str__(self):
         return f"ParamNode(identifier={self.identifier}, param_type={self.param_type})"
 
-class BlockNode:
-    def __init__(self, statements):
+class BlockNode(Node):
+    __slots__ = ('statements',)
+    child_fields = ('statements',)
+
+    def __init__(self, statements, start=None, end=None):
         self.statements = statements
+        self.start = start
+        self.end = end
 
     def __str__(self):
         return f"BlockNode(statements={self.statements})"
 
-class VariableDeclNode:
-    def __init__(self, identifier, var_type, expr=None):
+class VariableDeclNode(Node):
+    __slots__ = ('identifier', 'var_type', 'expr', 'binding')
+    child_fields = ('expr',)
+
+    def __init__(self, identifier, var_type, expr=None, binding=None, start=None, end=None):
         self.identifier = identifier
         self.var_type = var_type
         self.expr = expr
+        self.binding = binding
+        self.start = start
+        self.end = end
 
     def __str__(self):
         return (f"VariableDeclNode(identifier={self.identifier}, var_type={self.var_type}, "
                 f"expr={self.expr})")
 
-class AssignmentNode:
-    def __init__(self, identifier, expr):
+class AssignmentNode(Node):
+    __slots__ = ('identifier', 'expr', 'binding')
+    child_fields = ('expr',)
+
+    def __init__(self, identifier, expr, binding=None, start=None, end=None):
         self.identifier = identifier
         self.expr = expr
+        self.binding = binding
+        self.start = start
+        self.end = end
 
     def __str__(self):
         return f"AssignmentNode(identifier={self.identifier}, expr={self.expr})"
 
-class ReturnStatementNode:
-    def __init__(self, expr):
+class ReturnStatementNode(Node):
+    __slots__ = ('expr',)
+    child_fields = ('expr',)
+
+    def __init__(self, expr, start=None, end=None):
         self.expr = expr
+        self.start = start
+        self.end = end
 
     def __str__(self):
         return f"ReturnStatementNode(expr={self.expr})"
 
-class IfStatementNode:
-    def __init__(self, condition, if_block, else_block=None):
+class IfStatementNode(Node):
+    __slots__ = ('condition', 'if_block', 'else_block')
+    child_fields = ('condition', 'if_block', 'else_block')
+
+    def __init__(self, condition, if_block, else_block=None, start=None, end=None):
         self.condition = condition
         self.if_block = if_block
         self.else_block = else_block
+        self.start = start
+        self.end = end
 
     def __str__(self):
         return (f"IfStatementNode(condition={self.condition}, if_block={self.if_block}, "
                 f"else_block={self.else_block})")
 
-class ForStatementNode:
-    def __init__(self, init, condition, post, block):
+class ForStatementNode(Node):
+    __slots__ = ('init', 'condition', 'post', 'block')
+    child_fields = ('init', 'condition', 'post', 'block')
+
+    def __init__(self, init, condition, post, block, start=None, end=None):
         self.init = init
         self.condition = condition
         self.post = post
         self.block = block
+        self.start = start
+        self.end = end
 
     def __str__(self):
         return (f"ForStatementNode(init={self.init}, condition={self.condition}, "
                 f"post={self.post}, block={self.block})")
 
-class WhileStatementNode:
-    def __init__(self, condition, block):
+class WhileStatementNode(Node):
+    __slots__ = ('condition', 'block')
+    child_fields = ('condition', 'block')
+
+    def __init__(self, condition, block, start=None, end=None):
         self.condition = condition
         self.block = block
+        self.start = start
+        self.end = end
 
     def __str__(self):
         return f"WhileStatementNode(condition={self.condition}, block={self.block})"
 
-class PrintStatementNode:
-    def __init__(self, expr):
+class PrintStatementNode(Node):
+    __slots__ = ('expr',)
+    child_fields = ('expr',)
+
+    def __init__(self, expr, start=None, end=None):
         self.expr = expr
+        self.start = start
+        self.end = end
 
     def __str__(self):
         return f"PrintStatementNode(expr={self.expr})"
 
-class DelayStatementNode:
-    def __init__(self, expr):
+class DelayStatementNode(Node):
+    __slots__ = ('expr',)
+    child_fields = ('expr',)
+
+    def __init__(self, expr, start=None, end=None):
         self.expr = expr
+        self.start = start
+        self.end = end
 
     def __str__(self):
         return f"DelayStatementNode(expr={self.expr})"
 
-class WriteStatementNode:
-    def __init__(self, args):
+class WriteStatementNode(Node):
+    __slots__ = ('args',)
+    child_fields = ('args',)
+
+    def __init__(self, args, start=None, end=None):
         self.args = args
+        self.start = start
+        self.end = end
 
     def __str__(self):
         return f"WriteStatementNode(args={self.args})"
 
-class BinaryOpNode:
-    def __init__(self, left, operator, right):
+class BinaryOpNode(Node):
+    # expr_type, like that of every other expression node, is the type the SemanticAnalyzer inferred for it
+    __slots__ = ('left', 'operator', 'right', 'expr_type')
+    child_fields = ('left', 'right')
+
+    def __init__(self, left, operator, right, expr_type=None, start=None, end=None):
         self.left = left
         self.operator = operator
         self.right = right
+        self.expr_type = expr_type
+        self.start = start
+        self.end = end
 
     def __str__(self):
         return f"BinaryOpNode(left={self.left}, operator={self.operator}, right={self.right})"
 
-class UnaryOpNode:
-    def __init__(self, operator, operand):
+class UnaryOpNode(Node):
+    __slots__ = ('operator', 'operand', 'expr_type')
+    child_fields = ('operand',)
+
+    def __init__(self, operator, operand, expr_type=None, start=None, end=None):
         self.operator = operator
         self.operand = operand
+        self.expr_type = expr_type
+        self.start = start
+        self.end = end
 
     def __str__(self):
         return f"UnaryOpNode(operator={self.operator}, operand={self.operand})"
 
-class LiteralNode:
-    def __init__(self, value):
+class LiteralNode(Node):
+    __slots__ = ('value', 'expr_type')
+    child_fields = ()
+
+    def __init__(self, value, expr_type=None, start=None, end=None):
         self.value = value
+        self.expr_type = expr_type
+        self.start = start
+        self.end = end
+
+    def source(self):
+        # The literal as it is spelt in PArL; colours are held as 0xRRGGBB ints
+        return f"#{self.value:06x}" if self.expr_type == 'colour' else self.value
 
     def __str__(self):
-        return f"LiteralNode(value={self.value})"
+        return f"LiteralNode(value={self.source()})"
+
+class IdentifierNode(Node):
+    __slots__ = ('name', 'binding', 'expr_type')
+    child_fields = ()
 
-class IdentifierNode:
-    def __init__(self, name):
+    def __init__(self, name, binding=None, expr_type=None, start=None, end=None):
         self.name = name
+        self.binding = binding
+        self.expr_type = expr_type
+        self.start = start
+        self.end = end
 
     def __str__(self):
         return f"IdentifierNode(name={self.name})"
 
-class FunctionCallNode:
-    def __init__(self, name, args):
+class FunctionCallNode(Node):
+    __slots__ = ('name', 'args', 'expr_type')
+    child_fields = ('args',)
+
+    def __init__(self, name, args, expr_type=None, start=None, end=None):
         self.name = name
         self.args = args
+        self.expr_type = expr_type
+        self.start = start
+        self.end = end
 
     def __str__(self):
         return f"FunctionCallNode(name={self.name}, args={self.args})"
-    
-class CastNode:
-    def __init__(self, expr, target_type):
+
+class CastNode(Node):
+    __slots__ = ('expr', 'target_type', 'expr_type')
+    child_fields = ('expr',)
+
+    def __init__(self, expr, target_type, expr_type=None, start=None, end=None):
         self.expr = expr
         self.target_type = target_type
+        self.expr_type = expr_type
+        self.start = start
+        self.end = end
 
     def __str__(self):
         return f"CastNode(expr={self.expr}, target_type={self.target_type})"
-    
-def traverse(node, indent=0):
-    ind = '  ' * indent
-    if isinstance(node, ProgramNode):
-        print(f"{ind}ProgramNode:")
-        for stmt in node.statements:
-            traverse(stmt, indent + 1)
-    elif isinstance(node, FunctionDeclNode):
-        print(f"{ind}FunctionDeclNode: {node.identifier}")
-        print(f"{ind}  Params:")
-        for param in node.params:
-            traverse(param, indent + 2)
-        print(f"{ind}  ReturnType: {node.return_type}")
-        traverse(node.block, indent + 1)
-    elif isinstance(node, ParamNode):
-        print(f"{ind}ParamNode: {node.identifier}: {node.param_type}")
-    elif isinstance(node, BlockNode):
-        print(f"{ind}BlockNode:")
-        for stmt in node.statements:
-            traverse(stmt, indent + 1)
-    elif isinstance(node, VariableDeclNode):
-        print(f"{ind}VariableDeclNode: {node.identifier}: {node.var_type}")
+
+class ErrorNode(Node):
+    # Stands in for a statement that failed to parse when the parser is recovering from errors
+    __slots__ = ('message', 'identifier')
+    child_fields = ()
+
+    def __init__(self, message, identifier=None, start=None, end=None):
+        self.message = message
+        self.identifier = identifier
+        self.start = start
+        self.end = end
+
+    def __str__(self):
+        return f"ErrorNode(message={self.message}, identifier={self.identifier})"
+
+class TreePrinter(NodeVisitor):
+    # Prints a tree one node per line, with each node indented by two spaces per level below the root
+    def __init__(self, indent=0):
+        self.indent = indent
+
+    def line(self, text):
+        print('  ' * self.indent + text)
+
+    def generic_visit(self, node):
+        self.line(f"Unknown node: {node}")
+
+    def visit_ProgramNode(self, node):
+        self.line("ProgramNode:")
+        self.indent += 1
+        for child in node.statements:
+            yield child
+        self.indent -= 1
+
+    def visit_FunctionDeclNode(self, node):
+        self.line(f"FunctionDeclNode: {node.identifier}")
+        self.line("  Params:")
+        self.indent += 2
+        for child in node.params:
+            yield child
+        self.indent -= 2
+        self.line(f"  ReturnType: {node.return_type}")
+        self.indent += 1
+        yield node.block
+        self.indent -= 1
+
+    def visit_ParamNode(self, node):
+        self.line(f"ParamNode: {node.identifier}: {node.param_type}")
+
+    def visit_BlockNode(self, node):
+        self.line("BlockNode:")
+        self.indent += 1
+        for child in node.statements:
+            yield child
+        self.indent -= 1
+
+    def visit_VariableDeclNode(self, node):
+        self.line(f"VariableDeclNode: {node.identifier}: {node.var_type}")
         if node.expr:
-            traverse(node.expr, indent + 1)
-    elif isinstance(node, AssignmentNode):
-        print(f"{ind}AssignmentNode: {node.identifier}")
-        traverse(node.expr, indent + 1)
-    elif isinstance(node, ReturnStatementNode):
-        print(f"{ind}ReturnStatementNode:")
-        traverse(node.expr, indent + 1)
-    elif isinstance(node, IfStatementNode):
-        print(f"{ind}IfStatementNode:")
-        print(f"{ind}  Condition:")
-        traverse(node.condition, indent + 2)
-        print(f"{ind}  IfBlock:")
-        traverse(node.if_block, indent + 2)
+            self.indent += 1
+            yield node.expr
+            self.indent -= 1
+
+    def visit_AssignmentNode(self, node):
+        self.line(f"AssignmentNode: {node.identifier}")
+        self.indent += 1
+        yield node.expr
+        self.indent -= 1
+
+    def visit_ReturnStatementNode(self, node):
+        self.line("ReturnStatementNode:")
+        self.indent += 1
+        yield node.expr
+        self.indent -= 1
+
+    def visit_IfStatementNode(self, node):
+        self.line("IfStatementNode:")
+        self.line("  Condition:")
+        self.indent += 2
+        yield node.condition
+        self.indent -= 2
+        self.line("  IfBlock:")
+        self.indent += 2
+        yield node.if_block
+        self.indent -= 2
         if node.else_block:
-            print(f"{ind}  ElseBlock:")
-            traverse(node.else_block, indent + 2)
-    elif isinstance(node, ForStatementNode):
-        print(f"{ind}ForStatementNode:")
+            self.line("  ElseBlock:")
+            self.indent += 2
+            yield node.else_block
+            self.indent -= 2
+
+    def visit_ForStatementNode(self, node):
+        self.line("ForStatementNode:")
         if node.init:
-            print(f"{ind}  Init:")
-            traverse(node.init, indent + 2)
-        print(f"{ind}  Condition:")
-        traverse(node.condition, indent + 2)
+            self.line("  Init:")
+            self.indent += 2
+            yield node.init
+            self.indent -= 2
+        self.line("  Condition:")
+        self.indent += 2
+        yield node.condition
+        self.indent -= 2
         if node.post:
-            print(f"{ind}  Post:")
-            traverse(node.post, indent + 2)
-        print(f"{ind}  Block:")
-        traverse(node.block, indent + 2)
-    elif isinstance(node, WhileStatementNode):
-        print(f"{ind}WhileStatementNode:")
-        print(f"{ind}  Condition:")
-        traverse(node.condition, indent + 2)
-        print(f"{ind}  Block:")
-        traverse(node.block, indent + 2)
-    elif isinstance(node, PrintStatementNode):
-        print(f"{ind}PrintStatementNode:")
-        traverse(node.expr, indent + 1)
-    elif isinstance(node, DelayStatementNode):
-        print(f"{ind}DelayStatementNode:")
-        traverse(node.expr, indent + 1)
-    elif isinstance(node, WriteStatementNode):
-        print(f"{ind}WriteStatementNode:")
-        for arg in node.args:
-            traverse(arg, indent + 1)
-    elif isinstance(node, BinaryOpNode):
-        print(f"{ind}BinaryOpNode: {node.operator}")
-        traverse(node.left, indent + 1)
-        traverse(node.right, indent + 1)
-    elif isinstance(node, UnaryOpNode):
-        print(f"{ind}UnaryOpNode: {node.operator}")
-        traverse(node.operand, indent + 1)
-    elif isinstance(node, LiteralNode):
-        print(f"{ind}LiteralNode: {node.value}")
-    elif isinstance(node, IdentifierNode):
-        print(f"{ind}IdentifierNode: {node.name}")
-    elif isinstance(node, FunctionCallNode):
-        print(f"{ind}FunctionCallNode: {node.name}")
-        for arg in node.args:
-            traverse(arg, indent + 1)
-    elif isinstance(node, CastNode):
-        print(f"{ind}CastNode:")
-        print(f"{ind}  Expr:")
-        traverse(node.expr, indent + 2)
-        print(f"{ind}  TargetType: {node.target_type}")
-    else:
-        print(f"{ind}Unknown node: {node}")
+            self.line("  Post:")
+            self.indent += 2
+            yield node.post
+            self.indent -= 2
+        self.line("  Block:")
+        self.indent += 2
+        yield node.block
+        self.indent -= 2
+
+    def visit_WhileStatementNode(self, node):
+        self.line("WhileStatementNode:")
+        self.line("  Condition:")
+        self.indent += 2
+        yield node.condition
+        self.indent -= 2
+        self.line("  Block:")
+        self.indent += 2
+        yield node.block
+        self.indent -= 2
+
+    def visit_PrintStatementNode(self, node):
+        self.line("PrintStatementNode:")
+        self.indent += 1
+        yield node.expr
+        self.indent -= 1
+
+    def visit_DelayStatementNode(self, node):
+        self.line("DelayStatementNode:")
+        self.indent += 1
+        yield node.expr
+        self.indent -= 1
+
+    def visit_WriteStatementNode(self, node):
+        self.line("WriteStatementNode:")
+        self.indent += 1
+        for child in node.args:
+            yield child
+        self.indent -= 1
+
+    def visit_BinaryOpNode(self, node):
+        self.line(f"BinaryOpNode: {node.operator}")
+        self.indent += 1
+        yield node.left
+        yield node.right
+        self.indent -= 1
+
+    def visit_UnaryOpNode(self, node):
+        self.line(f"UnaryOpNode: {node.operator}")
+        self.indent += 1
+        yield node.operand
+        self.indent -= 1
+
+    def visit_LiteralNode(self, node):
+        self.line(f"LiteralNode: {node.source()}")
+
+    def visit_IdentifierNode(self, node):
+        self.line(f"IdentifierNode: {node.name}")
+
+    def visit_FunctionCallNode(self, node):
+        self.line(f"FunctionCallNode: {node.name}")
+        self.indent += 1
+        for child in node.args:
+            yield child
+        self.indent -= 1
+
+    def visit_CastNode(self, node):
+        self.line("CastNode:")
+        self.line("  Expr:")
+        self.indent += 2
+        yield node.expr
+        self.indent -= 2
+        self.line(f"  TargetType: {node.target_type}")
+
+    def visit_ErrorNode(self, node):
+        self.line(f"ErrorNode: {node.message}")
 
+def traverse(node, indent=0):
+    # Prints the tree, walked from an explicit stack so that trees of any depth can be printed
+    TreePrinter(indent).visit(node)
@@ -0,0 +1,126 @@
+import asyncio
+import operator
+import random
+import sys
+import time
+
+DEFAULT_WIDTH = 36
+DEFAULT_HEIGHT = 36
+# Colours are kept as 0xRRGGBB ints while a program runs
+BLACK = 0x000000
+# A pixel only holds the low 24 bits of a colour written to it
+COLOUR_MASK = 0xFFFFFF
+# What each binary operator does to the values of its operands; '/' on two ints floors instead
+BINARY_OPERATORS = {'+': operator.add, '-': operator.sub, '*': operator.mul, '/': operator.truediv,
+                    '<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge,
+                    '==': operator.eq, '!=': operator.ne,
+                    'and': lambda left, right: left and right, 'or': lambda left, right: left or right}
+
+def parse_colour(literal):
+    # A '#rrggbb' colour literal as an int
+    return int(literal[1:], 16)
+
+def format_value(value, value_type):
+    # How __print shows a value of a PArL type
+    if value_type == 'bool':
+        return 'true' if value else 'false'
+    if value_type == 'colour':
+        return f"#{value:06x}"
+    return str(value)
+
+def default_value(value_type):
+    # The value of a variable declared without an initialiser
+    return {'int': 0, 'float': 0.0, 'bool': False, 'colour': BLACK}.get(value_type, 0)
+
+def cast_value(value, target_type):
+    # Colours are ints already, so casts to and from them only truncate floats towards zero, like the VM's TO_INT,
+    # and widen bools
+    if target_type == 'float':
+        return float(value)
+    if target_type == 'bool':
+        return bool(value)
+    return int(value)
+
+class RealClock:
+    # Wall-clock time in milliseconds since the clock was made; sleeping really waits
+    def __init__(self, sleep=time.sleep, monotonic=time.monotonic):
+        self._sleep = sleep
+        self.monotonic = monotonic
+        self.start = monotonic()
+
+    def now(self):
+        return (self.monotonic() - self.start) * 1000
+
+    def sleep(self, milliseconds):
+        self._sleep(milliseconds / 1000)
+
+    async def wait(self, milliseconds):
+        # Sleeps without holding up the event loop
+        await asyncio.sleep(milliseconds / 1000)
+
+class VirtualClock:
+    # Simulated time in milliseconds that only moves when slept on, for running programs headless: a delay
+    # costs nothing, and the time it stamps frames with is the time the program asked for
+    def __init__(self, start=0):
+        self.time = start
+
+    def now(self):
+        return self.time
+
+    def sleep(self, milliseconds):
+        self.time += milliseconds
+
+    async def wait(self, milliseconds):
+        # Still gives the event loop a turn, so programs on virtual clocks take turns like real ones
+        self.time += milliseconds
+        await asyncio.sleep(0)
+
+class Runtime:
+    # Everything a running program can reach outside itself: a width x height display of colours, addressed
+    # pixels[y][x], the output that __print writes to, the random numbers of __random_int and __randi, and the
+    # clock that __delay waits on. Shared by every execution engine. Writes outside the display are clipped, and
+    # colours are cut to 24 bits as they are written. Every __delay ends a frame, the display as it stands then,
+    # whose time on the clock is added to frame_times.
+    def __init__(self, width=DEFAULT_WIDTH, height=DEFAULT_HEIGHT, out=None, seed=None, clock=None):
+        self.width = width
+        self.height = height
+        self.pixels = [[BLACK] * width for _ in range(height)]
+        self.out = out if out is not None else sys.stdout
+        self.random = random.Random(seed)
+        self.clock = clock if clock is not None else RealClock()
+        self.frame_times = []
+
+    def print_value(self, value, value_type):
+        self.out.write(format_value(value, value_type) + "\n")
+
+    def delay(self, milliseconds):
+        self.end_frame()
+        if milliseconds > 0:
+            self.clock.sleep(milliseconds)
+
+    def end_frame(self):
+        self.frame_times.append(self.clock.now())
+
+    def close(self):
+        # Called once the program has finished; a Runtime holds nothing back
+        pass
+
+    def write(self, x, y, colour):
+        if 0 <= x < self.width and 0 <= y < self.height:
+            self.pixels[y][x] = colour & COLOUR_MASK
+
+    def write_box(self, x, y, width, height, colour):
+        x0, x1 = max(x, 0), min(x + width, self.width)
+        colour &= COLOUR_MASK
+        for row in self.pixels[max(y, 0):max(y + height, 0)]:
+            if x0 < x1:
+                row[x0:x1] = [colour] * (x1 - x0)
+
+    def read(self, x, y):
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return self.pixels[y][x]
+        return BLACK
+
+    def random_int(self, upper):
+        # A random int in [0, upper), or 0 when the range is empty
+        return self.random.randrange(upper) if upper > 0 else 0
@@ -0,0 +1,50 @@
+import asyncio
+import io
+
+import pytest
+
+from async_runtime import BudgetExceeded, run_program
+from bytecode import compile_source
+from runtime import Runtime, VirtualClock
+
+RECURSIVE = """
+fun F(n:int) -> int {
+    if (n > 0) {
+        return F(n + 1);
+    }
+    return 0;
+}
+__print F(1);
+"""
+
+LOOPING = """
+let i:int = 0;
+while (i >= 0) {
+    i = i + 1;
+}
+"""
+
+def make_runtime():
+    return Runtime(out=io.StringIO(), clock=VirtualClock())
+
+@pytest.mark.parametrize("src", [RECURSIVE, LOOPING])
+def test_cpu_budget_stops_program_that_never_delays(src):
+    with pytest.raises(BudgetExceeded):
+        asyncio.run(run_program(compile_source(src), make_runtime(), cpu_budget=0.05, slice_jumps=100))
+
+@pytest.mark.parametrize("src", [RECURSIVE, LOOPING])
+def test_cancel_stops_program_that_never_delays(src):
+    async def cancel_soon():
+        task = asyncio.ensure_future(run_program(compile_source(src), make_runtime(), slice_jumps=100))
+        for _ in range(10):
+            await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+    asyncio.run(asyncio.wait_for(cancel_soon(), 5))
+
+def test_delays_advance_virtual_clock():
+    runtime = asyncio.run(run_program(compile_source("__delay 40;\n__delay 2;\n__print 1;\n"), make_runtime()))
+    assert runtime.out.getvalue() == "1\n"
+    assert runtime.frame_times == [0, 40]
+    assert runtime.clock.now() == 42
@@ -0,0 +1,28 @@
+import io
+
+import pytest
+
+from closure_engine import run_source
+from runtime import Runtime
+from vm import VMError
+
+def run(src):
+    runtime = Runtime(out=io.StringIO(), seed=0)
+    run_source(src, runtime)
+    return runtime.out.getvalue()
+
+def test_colour_division_is_integer_division():
+    assert run("let a:colour = #00ff00;\nlet b:colour = #000010;\n__print a / b;\n") == "#000ff0\n"
+
+def test_int_division_floors():
+    assert run("let a:int = 7;\n__print a / 2;\n") == "3\n"
+
+def test_division_by_zero_raises_vm_error():
+    with pytest.raises(VMError, match="Division by zero"):
+        run("let a:int = 0;\n__print 1 / a;\n")
+
+DEEP = "fun D(n:int) -> int {\n    if (n < 20000) {\n        return D(n + 1);\n    }\n    return n;\n}\n__print D(0);\n"
+
+def test_deep_recursion_raises_vm_error():
+    with pytest.raises(VMError, match="Recursion too deep"):
+        run(DEEP)
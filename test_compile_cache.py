@@ -0,0 +1,41 @@
+import os
+
+import pytest
+
+from compile_cache import CompileCache
+from differential import ast_signature
+from lexer import Lexer
+from LLK_Parser import Parser
+
+SRC = "fun F(n:int) -> int {\n    return n * 2;\n}\nlet x:int = F(21);\n__print x;\n"
+
+def entry_path(directory):
+    [name] = os.listdir(directory)
+    return os.path.join(directory, name)
+
+@pytest.mark.parametrize("damage", [
+    lambda data: data[:20],
+    lambda data: data[:len(data) // 2],
+    lambda data: b"",
+    lambda data: data[:80] + bytes(len(data) - 80),
+    lambda data: data[:80] + b"\xff" * (len(data) - 80),
+])
+def test_damaged_entry_is_a_miss_and_is_replaced(tmp_path, damage):
+    CompileCache(str(tmp_path)).compile(SRC)
+    path = entry_path(tmp_path)
+    with open(path, "rb") as entry_file:
+        data = entry_file.read()
+    with open(path, "wb") as entry_file:
+        entry_file.write(damage(data))
+
+    cache = CompileCache(str(tmp_path))
+    tokens, program = cache.compile(SRC)
+    expected_tokens = Lexer(engine="compiled").GenerateTokenStream(SRC)
+    assert list(tokens) == list(expected_tokens)
+    assert ast_signature(program) == ast_signature(Parser(expected_tokens).parse())
+    assert (cache.stats["hits"], cache.stats["misses"], cache.stats["stores"]) == (0, 1, 1)
+
+    # The damaged entry was replaced by a good one
+    cache = CompileCache(str(tmp_path))
+    cache.compile(SRC)
+    assert cache.stats["hits"] == 1
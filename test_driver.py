@@ -0,0 +1,36 @@
+import driver
+
+SRC = "let x:int = 1;\n__print x;\n"
+
+def write_source(tmp_path, src=SRC):
+    path = tmp_path / "program.parl"
+    path.write_text(src)
+    return str(path)
+
+def test_cache_uses_the_driver_lexer(tmp_path):
+    result = driver.compile_file(write_source(tmp_path), engine="dfa", cache_dir=str(tmp_path / "cache"))
+    assert result["success"]
+    assert driver._cache.lexer is driver._lexer
+
+def test_unusable_cache_directory_compiles_uncached(tmp_path):
+    not_a_directory = tmp_path / "cache"
+    not_a_directory.write_text("")
+    result = driver.compile_file(write_source(tmp_path), cache_dir=str(not_a_directory))
+    assert result["success"], result["error"]
+    assert "lex" in result["timings"]
+
+def test_cache_write_failure_compiles_uncached(tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / "cache")
+    driver.compile_file(write_source(tmp_path, "__print 1;\n"), cache_dir=cache_dir)
+
+    def fail(*args):
+        raise PermissionError("read-only")
+    monkeypatch.setattr(driver._cache, "store", fail)
+    result = driver.compile_file(write_source(tmp_path), cache_dir=cache_dir)
+    assert result["success"], result["error"]
+    assert "lex" in result["timings"]
+
+def test_syntax_errors_are_still_parse_errors_with_a_cache(tmp_path):
+    result = driver.compile_file(write_source(tmp_path, "let x:int = ;\n"), cache_dir=str(tmp_path / "cache"))
+    assert not result["success"]
+    assert result["phase"] == "parse"
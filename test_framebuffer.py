@@ -0,0 +1,40 @@
+import io
+
+import numpy as np
+import pytest
+
+from framebuffer import FramebufferRuntime
+from runtime import Runtime
+
+def both():
+    return Runtime(width=8, height=6, out=io.StringIO()), FramebufferRuntime(width=8, height=6, out=io.StringIO())
+
+@pytest.mark.parametrize("box", [(-3, -2, 5, 4), (6, 4, 10, 10), (2, 1, 0, 3), (2, 1, -4, 3), (-20, 2, 5, 1),
+                                 (0, 0, 8, 6)])
+def test_write_box_clips_like_the_list_display(box):
+    runtime, framebuffer = both()
+    for display in (runtime, framebuffer):
+        display.write_box(*box, 0x1ABCDEF)
+    assert framebuffer.rows() == runtime.pixels
+
+def test_write_and_read_mask_colours_and_clip():
+    runtime, framebuffer = both()
+    for display in (runtime, framebuffer):
+        display.write(3, 2, -1)
+        display.write(8, 0, 0x123456)
+        display.write(0, -1, 0x123456)
+    assert framebuffer.rows() == runtime.pixels
+    assert framebuffer.read(3, 2) == runtime.read(3, 2) == 0xFFFFFF
+    assert type(framebuffer.read(3, 2)) is int
+    assert framebuffer.read(-1, 0) == 0
+
+def test_write_many_keeps_the_last_write_to_each_pixel():
+    runtime, framebuffer = both()
+    xs = np.array([1, 2, 1, 9, 1, -1], dtype=np.int64)
+    ys = np.array([1, 1, 1, 0, 1, 0], dtype=np.int64)
+    colours = np.array([10, 20, 30, 40, 50, 60], dtype=np.int64)
+    for x, y, colour in zip(xs.tolist(), ys.tolist(), colours.tolist()):
+        runtime.write(x, y, colour)
+    framebuffer.write_many(xs, ys, colours)
+    assert framebuffer.rows() == runtime.pixels
+    assert framebuffer.read(1, 1) == 50
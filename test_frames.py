@@ -0,0 +1,48 @@
+import io
+
+import numpy as np
+
+from frames import FRAME, HEADER, MAGIC, RECT, read_frames, record
+from runtime import VirtualClock
+
+SRC = """
+__write_box 0, 0, 4, 4, #ff0000;
+__delay 10;
+__delay 10;
+__write 2, 3, #00ff00;
+__print 1;
+__delay 5;
+__write_box 1, 1, 2, 2, #0000ff;
+"""
+
+def replay(engine):
+    frame_file, out = io.BytesIO(), io.StringIO()
+    record(SRC, frame_file, engine, width=6, height=5, out=out, clock=VirtualClock())
+    frame_file.seek(0)
+    return list(read_frames(frame_file)), out.getvalue()
+
+def test_recording_replays_every_frame():
+    frames, out = replay("vm")
+    assert out == "1\n"
+    assert [time for time, _ in frames] == [0, 10, 20, 25]
+    first, second, third, last = (display for _, display in frames)
+    assert (first[:4, :4] == 0xFF0000).all() and first[4:, :].sum() == 0 and first[:, 4:].sum() == 0
+    assert np.array_equal(second, first)
+    assert third[3, 2] == 0x00FF00
+    assert (last[1:3, 1:3] == 0x0000FF).all()
+
+def test_unchanged_frames_are_small():
+    frame_file = io.BytesIO()
+    record("__write_box 0, 0, 30, 30, #ffffff;\n" + "__delay 1;\n" * 50, frame_file, width=30, height=30,
+           out=io.StringIO(), clock=VirtualClock())
+    # 50 delays and the end of the program make 51 frames; the box is recorded once, and every other frame only
+    # takes its header
+    assert len(frame_file.getvalue()) == len(MAGIC) + HEADER.size + 51 * FRAME.size + RECT.size + 30 * 30 * 3
+
+def test_engines_record_the_same_frames():
+    expected_frames, expected_out = replay("vm")
+    for engine in ("closures", "python", "vectorized"):
+        frames, out = replay(engine)
+        assert out == expected_out
+        assert [time for time, _ in frames] == [time for time, _ in expected_frames]
+        assert all(np.array_equal(display, expected) for (_, display), (_, expected) in zip(frames, expected_frames))
@@ -0,0 +1,62 @@
+import random
+
+import pytest
+
+from differential import ast_signature
+from incremental import IncrementalFrontEnd
+from lexer import Lexer
+
+SRC = "let x:int = 1;\n__print x;\n"
+
+def full_lex(src):
+    return list(Lexer(engine="compiled").GenerateTokenStream(src))
+
+def apply(front_end, offset, removed_length, inserted_text):
+    # Edits that leave the program unparsable still have to leave the tokens right
+    try:
+        front_end.apply_edit(offset, removed_length, inserted_text)
+    except SyntaxError:
+        pass
+    return list(front_end.tokens)
+
+@pytest.mark.parametrize("edit", [(len(SRC) - 1, 1, ""), (len(SRC) - 2, 2, ""), (len(SRC), 0, "x"),
+                                  (len(SRC) - 1, 0, ";"), (len(SRC), 0, "__print x;\n"), (0, len(SRC), "")])
+def test_edits_at_the_end_match_a_full_lex(edit):
+    front_end = IncrementalFrontEnd(SRC)
+    assert apply(front_end, *edit) == full_lex(front_end.src_program_str)
+
+@pytest.mark.parametrize("seed", range(5))
+def test_random_edits_match_a_full_lex(seed):
+    rng = random.Random(seed)
+    fragments = ["x", " ", "\n", ";", "1", "__print x;\n", "let y:int = 2;\n", "#"]
+    front_end = IncrementalFrontEnd(SRC)
+    for _ in range(300):
+        src = front_end.src_program_str
+        offset = rng.randint(max(0, len(src) - 4), len(src)) if rng.random() < 0.5 else rng.randint(0, len(src))
+        removed_length = rng.randint(0, min(3, len(src) - offset))
+        assert apply(front_end, offset, removed_length, rng.choice(fragments)) == full_lex(front_end.src_program_str)
+
+def test_random_statement_edits_match_a_full_parse():
+    rng = random.Random(0)
+    src = "".join(f"let v{n}:int = {n};\n__print v{n};\n" for n in range(40))
+    front_end = IncrementalFrontEnd(src)
+    for _ in range(200):
+        src = front_end.src_program_str
+        boundaries = [0] + [idx + 1 for idx, char in enumerate(src) if char == "\n"]
+        choice = rng.random()
+        if choice < 0.4:
+            digits = [idx for idx, char in enumerate(src) if char.isdigit()]
+            front_end.apply_edit(rng.choice(digits), 1, str(rng.randint(0, 99)))
+        elif choice < 0.7 or len(boundaries) < 3:
+            front_end.apply_edit(rng.choice(boundaries), 0, f"__print {rng.randint(0, 9)};\n")
+        else:
+            line = rng.randrange(len(boundaries) - 1)
+            text = src[boundaries[line]:boundaries[line + 1]]
+            if not text.startswith("__print"):
+                continue
+            front_end.apply_edit(boundaries[line], len(text), "")
+        reference = IncrementalFrontEnd(front_end.src_program_str)
+        assert list(front_end.tokens) == list(reference.tokens)
+        assert ast_signature(front_end.program) == ast_signature(reference.program)
+        assert [front_end.statement_range(idx) for idx in range(len(front_end.program.statements))] == \
+            [reference.statement_range(idx) for idx in range(len(reference.program.statements))]
@@ -0,0 +1,28 @@
+import io
+
+import pytest
+
+from bytecode import CompileError
+from ir import run_source
+from runtime import Runtime
+from vm import VMError
+
+def run(src):
+    runtime = Runtime(out=io.StringIO(), seed=0)
+    run_source(src, runtime)
+    return runtime.out.getvalue()
+
+def test_colour_division_is_integer_division():
+    assert run("let a:colour = #00ff00;\nlet b:colour = #000010;\n__print a / b;\n") == "#000ff0\n"
+
+def test_folded_colour_division_is_integer_division():
+    assert run("__print #00ff00 / #000010;\n") == "#000ff0\n"
+
+def test_unused_division_by_zero_still_faults():
+    with pytest.raises(VMError, match="Division by zero"):
+        run("let a:int = 3 / (0) * 0;\n__print a;\n")
+
+@pytest.mark.parametrize("body", ["return x;", "x = 1; return 2;"])
+def test_enclosing_function_locals_are_a_compile_error(body):
+    with pytest.raises(CompileError, match="Variable 'x' belongs to an enclosing function"):
+        run(f"fun F(x:int) -> int {{\n    fun G() -> int {{ {body} }}\n    return G();\n}}\n__print F(3);\n")
@@ -0,0 +1,22 @@
+import io
+
+from runtime import Runtime
+from vm import run_source
+
+def run(src, optimize):
+    runtime = Runtime(out=io.StringIO(), seed=0)
+    run_source(src, runtime, optimize=optimize)
+    return runtime.out.getvalue()
+
+def test_not_of_int_literal_is_not_folded_to_an_int():
+    src = "__print not 5;\n__print not 0;\n__print not true;\n"
+    assert run(src, optimize=True) == run(src, optimize=False)
+
+def test_colour_division_folds_to_a_colour():
+    assert run("__print #00ff00 / #000010;\n", optimize=True) == "#000ff0\n"
+
+def test_function_declared_in_dead_code_is_kept():
+    src = ("fun F() -> int { return G(); fun G() -> int { return 7; } }\n"
+           "fun H() -> int { if (false) { fun K() -> int { return 8; } } return K(); }\n"
+           "__print F();\n__print H();\n")
+    assert run(src, optimize=True) == run(src, optimize=False) == "7\n8\n"
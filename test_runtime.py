@@ -0,0 +1,25 @@
+import io
+
+from runtime import RealClock, Runtime, VirtualClock, cast_value
+
+def test_casts_to_int_and_colour_truncate_towards_zero():
+    assert cast_value(2.9, 'int') == 2
+    assert cast_value(-2.9, 'int') == -2
+    assert cast_value(255.9, 'colour') == 255
+    assert cast_value(True, 'colour') == 1
+
+def test_virtual_clock_stamps_frames_without_sleeping():
+    runtime = Runtime(out=io.StringIO(), clock=VirtualClock())
+    for milliseconds in (1000, 0, -5, 250):
+        runtime.delay(milliseconds)
+    assert runtime.frame_times == [0, 1000, 1000, 1000]
+    assert runtime.clock.now() == 1250
+
+def test_real_clock_sleeps_on_the_clock_it_is_given():
+    slept = []
+    clock = RealClock(sleep=slept.append, monotonic=lambda: 2.0)
+    runtime = Runtime(out=io.StringIO(), clock=clock)
+    runtime.delay(40)
+    runtime.delay(0)
+    assert slept == [0.04]
+    assert runtime.frame_times == [0.0, 0.0]
@@ -0,0 +1,21 @@
+import pytest
+
+from lexer import Lexer
+from LLK_Parser import Parser
+from Semantic_Analyzer import SemanticAnalyzer, check_source
+
+def analyse(src):
+    SemanticAnalyzer().visit(Parser(Lexer(engine="compiled").GenerateTokenStream(src)).parse())
+
+def test_return_after_a_function_declaration_is_outside_a_function():
+    with pytest.raises(Exception, match="Return outside a function"):
+        analyse("fun F() -> int { return 1; }\n__print 1;\nreturn 5;\n__print 2;\n")
+
+def test_return_at_top_level_is_reported_in_recovery_mode():
+    _, errors = check_source("return 5;\n__print 1;\n")
+    assert [message for _, _, _, message in errors] == ["Return outside a function"]
+
+def test_nested_function_restores_the_enclosing_return_type():
+    with pytest.raises(Exception, match="Return type mismatch in function with return type float: got int"):
+        analyse("fun F() -> float {\n    fun G() -> int { return 1; }\n    return G();\n}\n__print F();\n")
+    analyse("fun F() -> float {\n    fun G() -> int { return 1; }\n    return 2.5;\n}\n__print F();\n")
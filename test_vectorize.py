@@ -0,0 +1,63 @@
+import io
+
+import pytest
+
+from framebuffer import FramebufferRuntime
+from parser_nodes import BinaryOpNode, IdentifierNode
+from LLK_Parser import Parser
+from lexer import Lexer
+from runtime import Runtime
+from Semantic_Analyzer import SemanticAnalyzer
+from vectorize import VectorizingCompiler, run_source, shifted_counter
+from vm import VMError
+import vm
+
+def lowered(src):
+    program = Parser(Lexer(engine="compiled").GenerateTokenStream(src)).parse()
+    SemanticAnalyzer().visit(program)
+    compiler = VectorizingCompiler()
+    compiler.compile(program)
+    return compiler.lowered
+
+def display(src):
+    # The display the vectorised program leaves, checked against the one the VM leaves
+    runtime = FramebufferRuntime(out=io.StringIO(), seed=0)
+    run_source(src, runtime)
+    reference = Runtime(out=io.StringIO(), seed=0)
+    vm.run_source(src, reference)
+    assert runtime.rows() == reference.pixels
+    return runtime.rows()
+
+def pixel_loop(x, y, colour):
+    return ("for (let i:int = 0; i < 8; i = i + 1) {\n"
+            "    for (let j:int = 0; j < 6; j = j + 1) {\n"
+            f"        __write {x}, {y}, {colour};\n"
+            "    }\n"
+            "}\n")
+
+def test_colour_division_is_lowered():
+    src = pixel_loop("i", "j", "#ffffff / ((i + 1) as colour)")
+    assert lowered(src)
+    display(src)
+
+def test_division_by_zero_raises_vm_error():
+    src = pixel_loop("i", "j", "#ffffff / (i as colour)")
+    with pytest.raises(VMError, match="Division by zero"):
+        run_source(src, FramebufferRuntime(out=io.StringIO()))
+
+@pytest.mark.parametrize("x, y", [("i * 0", "j"), ("i / 2", "j"), ("i + k", "j + k"), ("j", "i"),
+                                  ("i + j", "j"), ("k", "j * k")])
+def test_coordinates_that_repeat_keep_the_last_write(x, y):
+    src = "let k:int = 3;\n" + pixel_loop(x, y, "((i * 8 + j) * 4001) as colour")
+    rows = display(src)
+    assert any(any(row) for row in rows)
+
+def test_counter_shifted_by_itself_is_not_distinct():
+    i, k = (0, 0), (1, 0)
+    uses = {"i": {i}, "k": set()}
+    counter = lambda: IdentifierNode("i", i)
+    uses_of = lambda node: uses[node.name] if isinstance(node, IdentifierNode) else {i}
+    assert shifted_counter(BinaryOpNode(counter(), '+', IdentifierNode("k", k)), [i], uses_of) == i
+    assert shifted_counter(BinaryOpNode(counter(), '-', counter()), [i], uses_of) is None
+    assert shifted_counter(BinaryOpNode(counter(), '+', BinaryOpNode(counter(), '*', IdentifierNode("k", k))),
+                           [i], uses_of) is None
@@ -0,0 +1,35 @@
+import io
+from array import array
+
+import pytest
+
+from bytecode import RETURN, compile_source
+from runtime import Runtime
+from vm import VM, VMError, run_source
+
+def run(src):
+    runtime = Runtime(out=io.StringIO(), seed=0)
+    run_source(src, runtime)
+    return runtime.out.getvalue()
+
+def test_colour_division_is_integer_division():
+    assert run("let a:colour = #00ff00;\nlet b:colour = #000010;\n__print a / b;\n") == "#000ff0\n"
+
+def test_int_division_floors():
+    assert run("let a:int = 7;\n__print a / 2;\n") == "3\n"
+
+def test_division_by_zero_raises_vm_error():
+    with pytest.raises(VMError, match="Division by zero"):
+        run("let a:int = 0;\n__print 1 / a;\n")
+
+def test_return_in_main_is_rejected_before_it_runs():
+    with pytest.raises(Exception, match="Return outside a function"):
+        run("fun F() -> int { return 1; }\n__print 1;\nreturn 5;\n__print 2;\n")
+
+def test_return_in_main_bytecode_ends_the_program():
+    # Bytecode that skips the analyser, with a RETURN in main, halts rather than popping a missing frame
+    compiled = compile_source("__print 1;\n__print 2;\n")
+    compiled.main.code[4:6] = array("i", [RETURN, 0])
+    runtime = Runtime(out=io.StringIO(), seed=0)
+    VM(runtime).run(compiled)
+    assert runtime.out.getvalue() == "1\n"
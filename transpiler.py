@@ -0,0 +1,331 @@
+import argparse
+import hashlib
+import importlib.util
+import marshal
+import os
+import sys
+
+import bytecode
+import optimizer
+import Semantic_Analyzer
+from bytecode import CompileError, FrameLayout
+from compile_cache import compiler_fingerprint
+from lexer import Lexer
+from LLK_Parser import Parser
+from Semantic_Analyzer import SemanticAnalyzer
+from optimizer import Optimizer
+from runtime import Runtime, VirtualClock, default_value
+from visitor import NodeVisitor
+from vm import VMError
+
+# PArL operators whose Python spelling differs. 'and' and 'or' become '&' and '|', which evaluate both of
+# their bool operands like the other engines do, where Python's own would skip the right one.
+PYTHON_OPERATORS = {'and': '&', 'or': '|'}
+PYTHON_CASTS = {'int': 'int', 'colour': 'int', 'float': 'float', 'bool': 'bool'}
+BUILTIN_NAMES = {'__random_int': '_random_int', '__randi': '_random_int', '__read': '_read'}
+INDENT = "    "
+
+PYC_SUFFIX = ".parlpyc"
+PYC_MAGIC = b"PARLPY\x00\x01"
+
+class PythonGenerator(NodeVisitor):
+    # Writes an analysed AST out as the source of a Python module. Every PArL function becomes a top-level def
+    # and the main program a def main(), so that locals are Python's fast locals; a global becomes a module
+    # global only if some function uses it, and is a local of main() otherwise. Names get a prefix by kind, g_
+    # for globals, l_ with the frame slot appended for locals and f_ for functions, so that they can neither
+    # shadow each other nor a Python keyword. The special functions and statements call the underscored names
+    # that PythonProgram.run binds to a Runtime. Statements append lines to the current def and expressions
+    # give back their source, fully parenthesised.
+    def __init__(self):
+        self.functions = []
+        self.lines = None
+        self.indent = 1
+        self.layout = FrameLayout()
+        # Globals each def assigns, and those any function refers to
+        self.assigned_globals = None
+        self.shared_globals = set()
+        self.in_function = False
+
+    def generate(self, program):
+        self.lines = main = []
+        self.assigned_globals = main_globals = set()
+        self.visit(program)
+        header = ["def main():"]
+        if main_globals & self.shared_globals:
+            header.append(INDENT + "global " + ", ".join(sorted(main_globals & self.shared_globals)))
+        body = main or [INDENT + "pass"]
+        return "\n".join(["# Generated from a PArL program"] + self.functions + header + body) + "\n"
+
+    def emit(self, line):
+        self.lines.append(INDENT * self.indent + line)
+
+    def emit_block(self, node):
+        # The statements of a block, one level in, or pass when it produced none
+        self.indent += 1
+        count = len(self.lines)
+        yield node
+        if len(self.lines) == count:
+            self.emit("pass")
+        self.indent -= 1
+
+    def name(self, name, binding, declaring=False):
+        index = self.layout.slot(name, binding, declaring)
+        if index is not None:
+            return f"l_{name}_{index}"
+        if self.in_function:
+            self.shared_globals.add(f"g_{name}")
+        return f"g_{name}"
+
+    def store(self, name, binding, value, declaring=False):
+        target = self.name(name, binding, declaring)
+        if target.startswith("g_"):
+            self.assigned_globals.add(target)
+        self.emit(f"{target} = {value}")
+
+    def generic_visit(self, node):
+        raise CompileError(f"Cannot compile {type(node).__name__}")
+
+    def visit_ErrorNode(self, node):
+        raise CompileError(f"Cannot compile a program with errors: {node.message}")
+
+    def visit_ProgramNode(self, node):
+        for stmt in node.statements:
+            yield stmt
+
+    def visit_FunctionDeclNode(self, node):
+        saved = (self.lines, self.indent, self.layout, self.assigned_globals, self.in_function)
+        self.lines, self.indent, self.in_function = [], 1, True
+        self.assigned_globals = assigned = set()
+        self.layout = saved[2].nested()
+        self.layout.enter_scope()
+        params = [self.name(param.identifier, param.binding, declaring=True) for param in node.params]
+        yield node.block
+        if not (self.lines and self.lines[-1].startswith(INDENT + "return ")):
+            self.emit(f"return {default_value(node.return_type)!r}")
+        if assigned:
+            self.lines.insert(0, INDENT + "global " + ", ".join(sorted(assigned)))
+        self.functions.append(f"def f_{node.identifier}({', '.join(params)}):")
+        self.functions.extend(self.lines)
+        self.lines, self.indent, self.layout, self.assigned_globals, self.in_function = saved
+
+    def visit_BlockNode(self, node):
+        self.layout.enter_scope()
+        for stmt in node.statements:
+            yield stmt
+        self.layout.exit_scope()
+
+    def visit_VariableDeclNode(self, node):
+        value = (yield node.expr) if node.expr is not None else repr(default_value(node.var_type))
+        self.store(node.identifier, node.binding, value, declaring=True)
+
+    def visit_AssignmentNode(self, node):
+        value = yield node.expr
+        self.store(node.identifier, node.binding, value)
+
+    def visit_ReturnStatementNode(self, node):
+        self.emit(f"return {(yield node.expr)}")
+
+    def visit_IfStatementNode(self, node):
+        self.emit(f"if {(yield node.condition)}:")
+        yield from self.emit_block(node.if_block)
+        if node.else_block:
+            self.emit("else:")
+            yield from self.emit_block(node.else_block)
+
+    def visit_WhileStatementNode(self, node):
+        self.emit(f"while {(yield node.condition)}:")
+        yield from self.emit_block(node.block)
+
+    def visit_ForStatementNode(self, node):
+        # A while loop with the update at the end of its body; PArL has no continue to skip it
+        self.layout.enter_scope()
+        if node.init:
+            yield node.init
+        self.emit(f"while {(yield node.condition)}:")
+        self.indent += 1
+        yield node.block
+        if node.post:
+            yield node.post
+        elif not node.block.statements:
+            self.emit("pass")
+        self.indent -= 1
+        self.layout.exit_scope()
+
+    def visit_PrintStatementNode(self, node):
+        self.emit(f"_print({(yield node.expr)}, {node.expr.expr_type!r})")
+
+    def visit_DelayStatementNode(self, node):
+        self.emit(f"_delay({(yield node.expr)})")
+
+    def visit_WriteStatementNode(self, node):
+        args = []
+        for arg in node.args:
+            args.append((yield arg))
+        if len(args) == 3:
+            self.emit(f"_write({', '.join(args)})")
+        elif len(args) == 5:
+            self.emit(f"_write_box({', '.join(args)})")
+        else:
+            raise CompileError(f"__write takes 3 arguments and __write_box 5, not {len(args)}")
+
+    def visit_BinaryOpNode(self, node):
+        left = yield node.left
+        right = yield node.right
+        op = PYTHON_OPERATORS.get(node.operator, node.operator)
+        if op == '/' and node.expr_type in ('int', 'colour'):
+            op = '//'
+        return f"({left} {op} {right})"
+
+    def visit_UnaryOpNode(self, node):
+        operand = yield node.operand
+        return f"({node.operator} {operand})"
+
+    def visit_LiteralNode(self, node):
+        if node.expr_type == 'colour':
+            return f"0x{node.value:06x}"
+        return repr(node.value)
+
+    def visit_IdentifierNode(self, node):
+        return self.name(node.name, node.binding)
+
+    def visit_FunctionCallNode(self, node):
+        args = []
+        for arg in node.args:
+            args.append((yield arg))
+        if node.name in ('__width', '__height'):
+            return f"_{node.name[2:]}"
+        name = BUILTIN_NAMES.get(node.name, f"f_{node.name}")
+        return f"{name}({', '.join(args)})"
+
+    def visit_CastNode(self, node):
+        expr = yield node.expr
+        source_type, target_type = node.expr.expr_type, node.target_type
+        # Colours are ints at run time
+        if source_type == target_type or {source_type, target_type} == {'int', 'colour'}:
+            return expr
+        return f"{PYTHON_CASTS[target_type]}({expr})"
+
+class PythonProgram:
+    # A PArL program compiled to a Python code object. Each run executes the module in a fresh namespace bound
+    # to a Runtime and calls its main(), so CPython's own interpreter runs every PArL operation. Functions call
+    # each other as Python functions, so recursion deeper than the Python recursion limit raises VMError; it
+    # needs the VM.
+    def __init__(self, code, source=None):
+        self.code = code
+        self.source = source
+
+    def run(self, runtime=None):
+        # Runs the program and returns its namespace, which holds the globals that functions use
+        runtime = runtime or Runtime()
+        namespace = {"_print": runtime.print_value, "_delay": runtime.delay, "_write": runtime.write,
+                     "_write_box": runtime.write_box, "_read": runtime.read, "_random_int": runtime.random_int,
+                     "_width": runtime.width, "_height": runtime.height, "__builtins__": __builtins__}
+        exec(self.code, namespace)
+        try:
+            namespace["main"]()
+        except ZeroDivisionError:
+            raise VMError("Division by zero") from None
+        except RecursionError:
+            raise VMError("Recursion too deep") from None
+        return namespace
+
+def transpile(program, optimize=False):
+    # Analyses the AST, which raises on the first error, optionally optimises it in place, and gives back the
+    # Python source of the program
+    SemanticAnalyzer().visit(program)
+    if optimize:
+        Optimizer().optimize(program)
+    return PythonGenerator().generate(program)
+
+def compile_program(program, optimize=False):
+    source = transpile(program, optimize)
+    return PythonProgram(compile(source, "<parl>", "exec"), source)
+
+def transpiler_fingerprint(lexer_tables, optimize=False):
+    # Changes whenever the generated code could: with the front end, with the analyser or the transpiler, or
+    # with the Python version, whose marshal format and bytecode cached code objects are tied to
+    digest = hashlib.sha256(compiler_fingerprint(lexer_tables).encode())
+    digest.update(importlib.util.MAGIC_NUMBER + bytes([optimize]))
+    for module in (Semantic_Analyzer, bytecode, optimizer, sys.modules[__name__]):
+        with open(module.__file__, "rb") as src_file:
+            digest.update(src_file.read())
+    return digest.hexdigest()
+
+class PythonCodeCache:
+    # Code objects of transpiled programs, marshalled to disk like .pyc files and keyed by the hash of the
+    # PArL source and of the transpiler. Entries made by a different transpiler or Python are removed when the
+    # cache is opened.
+    def __init__(self, directory, lexer=None, optimize=False):
+        self.directory = directory
+        self.lexer = lexer or Lexer(engine="compiled")
+        self.optimize = optimize
+        self.fingerprint = transpiler_fingerprint(self.lexer, optimize)
+        self.stats = {"hits": 0, "misses": 0, "invalidated": 0}
+        os.makedirs(directory, exist_ok=True)
+        prefix = self.fingerprint[:16] + "-"
+        for name in os.listdir(directory):
+            if name.endswith(PYC_SUFFIX) and not name.startswith(prefix):
+                try:
+                    os.remove(os.path.join(directory, name))
+                except FileNotFoundError:
+                    continue
+                self.stats["invalidated"] += 1
+
+    def path(self, source_digest):
+        return os.path.join(self.directory, f"{self.fingerprint[:16]}-{source_digest.hex()}{PYC_SUFFIX}")
+
+    def compile(self, src_program_str):
+        # The PythonProgram of a program, from the cache when possible. Cached programs have no source.
+        source_digest = hashlib.sha256(src_program_str.encode()).digest()
+        path = self.path(source_digest)
+        try:
+            with open(path, "rb") as entry_file:
+                entry = entry_file.read()
+            if entry[:len(PYC_MAGIC)] == PYC_MAGIC and entry[len(PYC_MAGIC):len(PYC_MAGIC) + 32] == source_digest:
+                code = marshal.loads(entry[len(PYC_MAGIC) + 32:])
+                self.stats["hits"] += 1
+                return PythonProgram(code)
+        except (FileNotFoundError, ValueError, EOFError, TypeError):
+            pass
+
+        self.stats["misses"] += 1
+        compiled = compile_program(Parser(self.lexer.GenerateTokenStream(src_program_str)).parse(), self.optimize)
+        # Written to a private file first, so other processes never see a partial entry
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as entry_file:
+            entry_file.write(PYC_MAGIC + source_digest + marshal.dumps(compiled.code))
+        os.replace(temp_path, path)
+        return compiled
+
+def run_source(src_program_str, runtime=None, lexer=None):
+    # Compiles and runs a program, and returns the PythonProgram that ran
+    lexer = lexer or Lexer(engine="compiled")
+    compiled = compile_program(Parser(lexer.GenerateTokenStream(src_program_str)).parse())
+    compiled.run(runtime)
+    return compiled
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Compile a PArL program to Python and run it")
+    arg_parser.add_argument("path", help="source file")
+    arg_parser.add_argument("--emit", action="store_true", help="print the Python source instead of running it")
+    arg_parser.add_argument("--cache-dir", default=None, help="reuse the compiled code of unchanged programs from here")
+    arg_parser.add_argument("--optimize", action="store_true", help="fold constants and remove dead code first")
+    arg_parser.add_argument("--no-delay", action="store_true", help="make __delay advance a virtual clock, not sleep")
+    arg_parser.add_argument("--seed", type=int, default=None, help="seed of __random_int and __randi")
+    args = arg_parser.parse_args(argv)
+
+    with open(args.path) as src_file:
+        src = src_file.read()
+    if args.emit:
+        print(transpile(Parser(Lexer(engine="compiled").GenerateTokenStream(src)).parse(), args.optimize), end="")
+        return 0
+    if args.cache_dir is not None:
+        compiled = PythonCodeCache(args.cache_dir, optimize=args.optimize).compile(src)
+    else:
+        compiled = compile_program(Parser(Lexer(engine="compiled").GenerateTokenStream(src)).parse(), args.optimize)
+    runtime = Runtime(seed=args.seed, clock=VirtualClock() if args.no_delay else None)
+    compiled.run(runtime)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,328 @@
+import argparse
+import sys
+
+import numpy as np
+
+from closure_engine import ClosureCompiler
+from framebuffer import FramebufferRuntime
+from lexer import Lexer
+from LLK_Parser import Parser
+from parser_nodes import AssignmentNode, BinaryOpNode, ForStatementNode, IdentifierNode, LiteralNode, \
+    VariableDeclNode, WriteStatementNode
+from runtime import COLOUR_MASK
+from Semantic_Analyzer import SemanticAnalyzer
+from visitor import NodeVisitor
+
+INT_TYPES = ('int', 'colour')
+# Values at least this large in magnitude could overflow an int64 array, so a loop that could compute one runs
+# scalar, with Python's unbounded ints
+INT64_LIMIT = 1 << 63
+# Loops that would write more pixels than this at once run scalar rather than build arrays this large
+MAX_ELEMENTS = 1 << 24
+
+class NotVectorizable(Exception):
+    pass
+
+class ScalarFallback(Exception):
+    # Raised while a lowered loop computes its arrays, before it has written anything, when this run of it
+    # cannot be done with int64 arrays; the loop then runs scalar instead
+    pass
+
+class PixelLoop:
+    # A nest of for loops whose innermost body declares some int or colour variables and does one __write.
+    # levels are the loops from the outermost, as (induction variable declaration, bound expression, whether
+    # the bound is included, step); lets are the declarations of the body.
+    def __init__(self, levels, lets, write):
+        self.levels = levels
+        self.lets = lets
+        self.write = write
+
+def match_level(node):
+    # (declaration, bound, inclusive, step) of a for loop `for (let i:int = start; i < bound; i = i + step)`
+    # with a step that is a positive literal, or None
+    init, condition, post = node.init, node.condition, node.post
+    if not (isinstance(init, VariableDeclNode) and init.var_type == 'int' and init.expr is not None):
+        return None
+    if not (isinstance(condition, BinaryOpNode) and condition.operator in ('<', '<=')
+            and isinstance(condition.left, IdentifierNode) and condition.left.binding == init.binding):
+        return None
+    if not (isinstance(post, AssignmentNode) and post.binding == init.binding
+            and isinstance(post.expr, BinaryOpNode) and post.expr.operator == '+'):
+        return None
+    operands = (post.expr.left, post.expr.right)
+    for counter, step in (operands, operands[::-1]):
+        if (isinstance(counter, IdentifierNode) and counter.binding == init.binding
+                and isinstance(step, LiteralNode) and step.expr_type == 'int' and step.value > 0):
+            return init, condition.right, condition.operator == '<=', step.value
+    return None
+
+def match_pixel_loop(node):
+    # The PixelLoop a ForStatementNode is the outermost loop of, or None
+    levels = []
+    while True:
+        level = match_level(node)
+        if level is None:
+            return None
+        levels.append(level)
+        statements = node.block.statements
+        if len(statements) == 1 and isinstance(statements[0], ForStatementNode):
+            node = statements[0]
+            continue
+        if not statements or not isinstance(statements[-1], WriteStatementNode) or len(statements[-1].args) != 3:
+            return None
+        lets = statements[:-1]
+        for let in lets:
+            if not (isinstance(let, VariableDeclNode) and let.var_type in INT_TYPES and let.expr is not None):
+                return None
+        return PixelLoop(levels, lets, statements[-1])
+
+# The operators on (value, bound) pairs. Python ints are exact however large, so only an operation on an array
+# whose operands or result could be out of the range of int64 falls back, before it is done.
+def check_bound(left, right, bound):
+    if max(bound, left[1], right[1]) >= INT64_LIMIT \
+            and (isinstance(left[0], np.ndarray) or isinstance(right[0], np.ndarray)):
+        raise ScalarFallback()
+    return bound
+
+def add(left, right):
+    bound = check_bound(left, right, left[1] + right[1])
+    return left[0] + right[0], bound
+
+def subtract(left, right):
+    bound = check_bound(left, right, left[1] + right[1])
+    return left[0] - right[0], bound
+
+def multiply(left, right):
+    bound = check_bound(left, right, left[1] * right[1])
+    return left[0] * right[0], bound
+
+def floor_divide(left, right):
+    # |a // b| <= |a| for every int b other than 0
+    check_bound(left, right, left[1])
+    divisor = right[0]
+    if not (divisor.all() if isinstance(divisor, np.ndarray) else divisor):
+        raise ScalarFallback()
+    return left[0] // divisor, left[1]
+
+VECTOR_OPERATORS = {'+': add, '-': subtract, '*': multiply, '/': floor_divide}
+
+class VectorExpressionCompiler(NodeVisitor):
+    # Compiles an int or colour expression of a PixelLoop into a closure taking the frame and an environment,
+    # which maps the binding of each variable declared in the loop nest to its value, and giving back
+    # (value, bound): the value is an int64 array over the iterations of the loops it depends on, or a Python
+    # int if it depends on none of them, and bound is at least its magnitude. Other variables are read from the
+    # frame through the ClosureCompiler; the loops cannot assign them. uses collects the loop variables read,
+    # and may_fail is set by a division that could be by zero. Anything that could have an effect or read the
+    # display raises NotVectorizable.
+    def __init__(self, compiler, loop_bindings):
+        self.compiler = compiler
+        self.loop_bindings = loop_bindings
+        self.uses = set()
+        self.may_fail = False
+
+    def generic_visit(self, node):
+        raise NotVectorizable(type(node).__name__)
+
+    def visit_LiteralNode(self, node):
+        if node.expr_type not in INT_TYPES:
+            raise NotVectorizable(node.expr_type)
+        result = (node.value, abs(node.value))
+        return lambda frame, env: result
+
+    def visit_IdentifierNode(self, node):
+        if node.expr_type not in INT_TYPES:
+            raise NotVectorizable(node.expr_type)
+        binding = node.binding
+        if binding in self.loop_bindings:
+            self.uses.add(binding)
+            return lambda frame, env: env[binding]
+        load = self.compiler.load(node)
+
+        def load_invariant(frame, env):
+            value = load(frame)
+            return value, abs(value)
+        return load_invariant
+
+    def visit_FunctionCallNode(self, node):
+        if node.name not in ('__width', '__height'):
+            raise NotVectorizable(node.name)
+        value = getattr(self.compiler.runtime, node.name[2:])
+        result = (value, abs(value))
+        return lambda frame, env: result
+
+    def visit_CastNode(self, node):
+        if node.expr.expr_type not in INT_TYPES or node.target_type not in INT_TYPES:
+            raise NotVectorizable(node.target_type)
+        return (yield node.expr)
+
+    def visit_UnaryOpNode(self, node):
+        if node.operator != '-':
+            raise NotVectorizable(node.operator)
+        operand = yield node.operand
+
+        def negate(frame, env):
+            value, bound = operand(frame, env)
+            return -value, bound
+        return negate
+
+    def visit_BinaryOpNode(self, node):
+        if node.operator not in VECTOR_OPERATORS or node.expr_type not in INT_TYPES:
+            raise NotVectorizable(node.operator)
+        op = VECTOR_OPERATORS[node.operator]
+        if node.operator == '/' and not (isinstance(node.right, LiteralNode) and node.right.value):
+            self.may_fail = True
+        left = yield node.left
+        right = yield node.right
+        return lambda frame, env: op(left(frame, env), right(frame, env))
+
+def shifted_counter(node, counters, uses_of):
+    # The loop counter binding of an expression that is a counter, or a counter plus or minus an offset that
+    # no loop changes, or None: distinct values of the counter then give distinct values of the expression
+    if isinstance(node, IdentifierNode) and node.binding in counters:
+        return node.binding
+    if isinstance(node, BinaryOpNode) and node.operator in ('+', '-'):
+        sides = [(node.left, node.right)] + ([(node.right, node.left)] if node.operator == '+' else [])
+        for counter, offset in sides:
+            if isinstance(counter, IdentifierNode) and counter.binding in counters and not uses_of(offset):
+                return counter.binding
+    return None
+
+class VectorizingCompiler(ClosureCompiler):
+    # A ClosureCompiler that lowers pixel loops, for nests whose innermost body only declares int and colour
+    # variables and does one __write, to a few whole-array NumPy operations on a FramebufferRuntime: each
+    # counter becomes an arange along an axis of its own, the body's expressions are computed over all the
+    # iterations at once, and FramebufferRuntime.write_many does the writes. A loop whose counter neither
+    # coordinate depends on writes the same pixels on every iteration, so only its last one is computed. Every
+    # lowered loop keeps its scalar closure, which runs instead when a run of it could overflow int64, divide by
+    # zero or build arrays larger than MAX_ELEMENTS; loops that do not match only have that one. lowered counts
+    # the loops lowered.
+    def __init__(self, runtime=None):
+        super().__init__(runtime or FramebufferRuntime())
+        self.lowered = 0
+
+    def visit_ForStatementNode(self, node):
+        scalar = yield from super().visit_ForStatementNode(node)
+        if not isinstance(self.runtime, FramebufferRuntime):
+            return scalar
+        pixel_loop = match_pixel_loop(node)
+        if pixel_loop is None:
+            return scalar
+        try:
+            lowered = self.lower(pixel_loop, scalar)
+        except NotVectorizable:
+            return scalar
+        self.lowered += 1
+        return lowered
+
+    def lower(self, pixel_loop, scalar):
+        counters = [declaration.binding for declaration, _, _, _ in pixel_loop.levels]
+        loop_bindings = set(counters) | {let.binding for let in pixel_loop.lets}
+
+        body_may_fail = False
+
+        def compile_expression(node):
+            # The closure of an expression and the counters it depends on, through the body's variables
+            nonlocal body_may_fail
+            expression_compiler = VectorExpressionCompiler(self, loop_bindings)
+            expression = expression_compiler.visit(node)
+            body_may_fail = body_may_fail or expression_compiler.may_fail
+            uses = set()
+            for binding in expression_compiler.uses:
+                uses |= depends_on.get(binding, {binding})
+            return expression, uses
+
+        depends_on = {}
+        levels = []
+        for declaration, bound, inclusive, step in pixel_loop.levels:
+            start, start_uses = compile_expression(declaration.expr)
+            bound, bound_uses = compile_expression(bound)
+            if start_uses or bound_uses:
+                raise NotVectorizable("loop bounds depend on an enclosing loop")
+            levels.append((declaration.binding, start, bound, int(inclusive), step))
+        # Only failures in the body, which runs on every iteration, stop iterations being skipped
+        body_may_fail = False
+        lets = []
+        for let in pixel_loop.lets:
+            expression, uses = compile_expression(let.expr)
+            depends_on[let.binding] = uses
+            lets.append((let.binding, expression))
+        x_node, y_node, colour_node = pixel_loop.write.args
+        x, x_uses = compile_expression(x_node)
+        y, y_uses = compile_expression(y_node)
+        colour, _ = compile_expression(colour_node)
+        # Every iteration has to be computed when one could fail, or else those a coordinate depends on
+        coordinate_uses = set(counters) if body_may_fail else x_uses | y_uses
+        uses_of = lambda node: compile_expression(node)[1]
+        x_counter, y_counter = shifted_counter(x_node, counters, uses_of), shifted_counter(y_node, counters, uses_of)
+        # Each pixel is written once when each coordinate is fixed or is its own counter shifted, and every other
+        # loop is cut to its last iteration; otherwise write_many keeps the last write to each pixel
+        distinct = x_uses in (set(), {x_counter}) and y_uses in (set(), {y_counter}) \
+            and not (x_uses and x_counter == y_counter) and coordinate_uses == x_uses | y_uses
+        axes = len(levels)
+        width, height = self.runtime.width, self.runtime.height
+        write_many = self.runtime.write_many
+
+        def run_lowered(frame):
+            try:
+                env = {}
+                shape = []
+                elements = 1
+                for axis, (binding, start, bound, inclusive, step) in enumerate(levels):
+                    start, _ = start(frame, env)
+                    bound, _ = bound(frame, env)
+                    count = max(0, -((start - bound - inclusive) // step))
+                    if not count:
+                        return None
+                    last = start + (count - 1) * step
+                    if binding not in coordinate_uses:
+                        start, count = last, 1
+                    elements *= count
+                    if elements > MAX_ELEMENTS or max(abs(start), abs(last)) >= INT64_LIMIT:
+                        raise ScalarFallback()
+                    values = np.arange(start, last + 1, step, dtype=np.int64)
+                    shape.append(count)
+                    env[binding] = (values.reshape([-1 if other == axis else 1 for other in range(axes)]),
+                                    max(abs(start), abs(last)))
+                for binding, expression in lets:
+                    env[binding] = expression(frame, env)
+                xs, _ = x(frame, env)
+                ys, _ = y(frame, env)
+                colours, _ = colour(frame, env)
+            except ScalarFallback:
+                return scalar(frame)
+            # A fixed coordinate off the display leaves nothing to write, and one on it fits an int64
+            if not isinstance(xs, np.ndarray) and not 0 <= xs < width \
+                    or not isinstance(ys, np.ndarray) and not 0 <= ys < height:
+                return None
+            write_many(np.broadcast_to(xs, shape).ravel(), np.broadcast_to(ys, shape).ravel(),
+                       np.broadcast_to(colours & COLOUR_MASK, shape).ravel(), distinct)
+            return None
+        return run_lowered
+
+def compile_program(program, runtime=None):
+    # Analyses the AST, which raises on the first error, and compiles it with its pixel loops lowered
+    SemanticAnalyzer().visit(program)
+    return VectorizingCompiler(runtime).compile(program)
+
+def run_source(src_program_str, runtime=None, lexer=None):
+    # Compiles and runs a program, and returns the ClosureProgram that ran
+    lexer = lexer or Lexer(engine="compiled")
+    compiled = compile_program(Parser(lexer.GenerateTokenStream(src_program_str)).parse(), runtime)
+    compiled.run()
+    return compiled
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Report which loops of a PArL program are vectorised")
+    arg_parser.add_argument("path", help="source file")
+    args = arg_parser.parse_args(argv)
+
+    with open(args.path) as src_file:
+        program = Parser(Lexer(engine="compiled").GenerateTokenStream(src_file.read())).parse()
+    SemanticAnalyzer().visit(program)
+    compiler = VectorizingCompiler()
+    compiler.compile(program)
+    print(f"{compiler.lowered} pixel loops lowered to array operations")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
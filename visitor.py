@@ -0,0 +1,81 @@
+from types import GeneratorType
+
+class NodeVisitor:
+    # Base of the passes over the AST. visit_<ClassName> handles a node of that class, or of a subclass without a
+    # visitor of its own, and generic_visit every other node. The visitor of each node class is looked up once
+    # per visitor class and cached, rather than by building its name and calling getattr on every node.
+    # Visitors of nodes with children can be generators that yield each child they need the result of and are
+    # resumed with it. They are driven from an explicit stack rather than by recursion, so the depth of the AST
+    # is only limited by memory.
+    _visitors = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._visitors = {}
+
+    @classmethod
+    def resolve(cls, node_class):
+        for base in node_class.__mro__:
+            visitor = getattr(cls, 'visit_' + base.__name__, None)
+            if visitor is not None:
+                break
+        else:
+            visitor = cls.generic_visit
+        cls._visitors[node_class] = visitor
+        return visitor
+
+    def dispatch(self, node):
+        # Runs the visitor of one node, without driving it if it is a generator
+        visitor = self._visitors.get(type(node)) or self.resolve(type(node))
+        return visitor(self, node)
+
+    def visit(self, node):
+        visitors = self._visitors
+        resolve = self.resolve
+        stack = []
+        result = (visitors.get(type(node)) or resolve(type(node)))(self, node)
+        while True:
+            if type(result) is GeneratorType:
+                stack.append(result)
+                result = None
+            elif not stack:
+                return result
+            try:
+                child = stack[-1].send(result)
+            except StopIteration as stop:
+                stack.pop()
+                result = stop.value
+                continue
+            result = (visitors.get(type(child)) or resolve(type(child)))(self, child)
+
+    def generic_visit(self, node):
+        # Visits every child of the node and returns None
+        for child in iter_child_nodes(node):
+            yield child
+
+class NodeTransformer(NodeVisitor):
+    # A visitor that rebuilds the tree: the result of visiting a node replaces it in its parent. generic_visit
+    # visits the children, stores their replacements and returns the node itself. A list item replaced by None
+    # is removed from its list.
+    def generic_visit(self, node):
+        for name in node.child_fields:
+            value = getattr(node, name)
+            if isinstance(value, list):
+                items = []
+                for item in value:
+                    item = yield item
+                    if item is not None:
+                        items.append(item)
+                value[:] = items
+            elif value is not None:
+                setattr(node, name, (yield value))
+        return node
+
+def iter_child_nodes(node):
+    # The child nodes of a node in source order, with lists flattened and empty fields skipped
+    for name in node.child_fields:
+        value = getattr(node, name)
+        if isinstance(value, list):
+            yield from value
+        elif value is not None:
+            yield value
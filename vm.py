@@ -0,0 +1,261 @@
+import argparse
+import sys
+
+from bytecode import *
+from runtime import Runtime, VirtualClock
+
+class VMError(Exception):
+    pass
+
+class VM:
+    # Runs a CompiledProgram against a Runtime. The dispatch loop keeps all of its state in locals and tests the
+    # most frequent opcodes first. Calls save the caller's code, pc and frame on a list rather than recursing, so
+    # the depth of PArL recursion is only limited by memory. globals holds the values of the global variables
+    # once the program has run.
+    def __init__(self, runtime=None):
+        self.runtime = runtime or Runtime()
+        self.globals = []
+
+    def run(self, compiled):
+        delay = self.runtime.delay
+        for milliseconds in self.execute(compiled):
+            delay(milliseconds)
+
+    def execute(self, compiled, slice_jumps=0):
+        # The dispatch loop as a generator, which suspends the program at every __delay and yields its
+        # milliseconds for the caller to wait out. With slice_jumps it also yields None after every slice_jumps
+        # backward jumps and calls, one of which every loop iteration or recursion takes, so a program that
+        # never delays still gives way.
+        runtime = self.runtime
+        constants = compiled.constants
+        functions = compiled.functions
+        # Decoded once into lists, which index faster than arrays
+        function_codes = [function.code.tolist() for function in functions]
+        param_counts = [function.param_count for function in functions]
+        paddings = [[None] * (function.frame_size - function.param_count) for function in functions]
+        code_object = compiled.main
+        code = code_object.code.tolist()
+        global_values = self.globals = [None] * len(compiled.global_names)
+        local_values = [None] * code_object.frame_size
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        frames = []
+        pc = 0
+        # Counts down to 0 from slice_jumps, and from 0 never reaches it again
+        ticks = slice_jumps
+        try:
+            while True:
+                op = code[pc]
+                arg = code[pc + 1]
+                pc += 2
+                if op == LOAD_LOCAL:
+                    push(local_values[arg])
+                elif op == LOAD_LOCAL_PAIR:
+                    push(local_values[arg & 0xFFFF])
+                    push(local_values[arg >> 16])
+                elif op == INCREMENT_LOCAL:
+                    slot = arg & 0xFFFF
+                    local_values[slot] = local_values[slot] + constants[arg >> 16]
+                elif op == JUMP_IF_NOT_LT:
+                    right = pop()
+                    if not pop() < right:
+                        if arg < pc:
+                            # A taken back-edge, which loops laid out by the IR backend can take
+                            ticks -= 1
+                            if not ticks:
+                                ticks = slice_jumps
+                                yield None
+                        pc = arg
+                elif op == JUMP_IF_NOT_LE:
+                    right = pop()
+                    if not pop() <= right:
+                        if arg < pc:
+                            ticks -= 1
+                            if not ticks:
+                                ticks = slice_jumps
+                                yield None
+                        pc = arg
+                elif op == CONST:
+                    push(constants[arg])
+                elif op == STORE_LOCAL:
+                    local_values[arg] = pop()
+                elif op == JUMP_IF_FALSE:
+                    if not pop():
+                        if arg < pc:
+                            ticks -= 1
+                            if not ticks:
+                                ticks = slice_jumps
+                                yield None
+                        pc = arg
+                elif op == JUMP:
+                    pc = arg
+                    ticks -= 1
+                    if not ticks:
+                        ticks = slice_jumps
+                        yield None
+                elif op == JUMP_IF_NOT_GT:
+                    right = pop()
+                    if not pop() > right:
+                        if arg < pc:
+                            ticks -= 1
+                            if not ticks:
+                                ticks = slice_jumps
+                                yield None
+                        pc = arg
+                elif op == JUMP_IF_NOT_GE:
+                    right = pop()
+                    if not pop() >= right:
+                        if arg < pc:
+                            ticks -= 1
+                            if not ticks:
+                                ticks = slice_jumps
+                                yield None
+                        pc = arg
+                elif op == JUMP_IF_NOT_EQ:
+                    right = pop()
+                    if not pop() == right:
+                        if arg < pc:
+                            ticks -= 1
+                            if not ticks:
+                                ticks = slice_jumps
+                                yield None
+                        pc = arg
+                elif op == JUMP_IF_NOT_NE:
+                    right = pop()
+                    if not pop() != right:
+                        if arg < pc:
+                            ticks -= 1
+                            if not ticks:
+                                ticks = slice_jumps
+                                yield None
+                        pc = arg
+                elif op == ADD:
+                    right = pop()
+                    stack[-1] = stack[-1] + right
+                elif op == LT:
+                    right = pop()
+                    stack[-1] = stack[-1] < right
+                elif op == MUL:
+                    right = pop()
+                    stack[-1] = stack[-1] * right
+                elif op == LOAD_GLOBAL:
+                    push(global_values[arg])
+                elif op == STORE_GLOBAL:
+                    global_values[arg] = pop()
+                elif op == LE:
+                    right = pop()
+                    stack[-1] = stack[-1] <= right
+                elif op == GT:
+                    right = pop()
+                    stack[-1] = stack[-1] > right
+                elif op == GE:
+                    right = pop()
+                    stack[-1] = stack[-1] >= right
+                elif op == EQ:
+                    right = pop()
+                    stack[-1] = stack[-1] == right
+                elif op == NE:
+                    right = pop()
+                    stack[-1] = stack[-1] != right
+                elif op == SUB:
+                    right = pop()
+                    stack[-1] = stack[-1] - right
+                elif op == DIV_INT:
+                    right = pop()
+                    stack[-1] = stack[-1] // right
+                elif op == DIV:
+                    right = pop()
+                    stack[-1] = stack[-1] / right
+                elif op == CALL:
+                    frames.append((code_object, code, pc, local_values))
+                    code_object = functions[arg]
+                    split = len(stack) - param_counts[arg]
+                    local_values = stack[split:] + paddings[arg]
+                    del stack[split:]
+                    code = function_codes[arg]
+                    pc = 0
+                    # Calls count too, or a program that only recurses would never give way
+                    ticks -= 1
+                    if not ticks:
+                        ticks = slice_jumps
+                        yield None
+                elif op == RETURN:
+                    if not frames:
+                        # A return in the main program ends it, as it does on every other engine
+                        return
+                    code_object, code, pc, local_values = frames.pop()
+                elif op == AND:
+                    right = pop()
+                    stack[-1] = stack[-1] and right
+                elif op == OR:
+                    right = pop()
+                    stack[-1] = stack[-1] or right
+                elif op == NOT:
+                    stack[-1] = not stack[-1]
+                elif op == NEG:
+                    stack[-1] = -stack[-1]
+                elif op == TO_INT:
+                    stack[-1] = int(stack[-1])
+                elif op == TO_FLOAT:
+                    stack[-1] = float(stack[-1])
+                elif op == TO_BOOL:
+                    stack[-1] = bool(stack[-1])
+                elif op == POP:
+                    pop()
+                elif op == PRINT:
+                    runtime.print_value(pop(), VALUE_TYPES[arg])
+                elif op == DELAY:
+                    yield pop()
+                elif op == WRITE:
+                    colour = pop()
+                    y = pop()
+                    runtime.write(pop(), y, colour)
+                elif op == WRITE_BOX:
+                    colour = pop()
+                    height = pop()
+                    width = pop()
+                    y = pop()
+                    runtime.write_box(pop(), y, width, height, colour)
+                elif op == READ:
+                    y = pop()
+                    stack[-1] = runtime.read(stack[-1], y)
+                elif op == RANDOM_INT:
+                    stack[-1] = runtime.random_int(stack[-1])
+                elif op == WIDTH:
+                    push(runtime.width)
+                elif op == HEIGHT:
+                    push(runtime.height)
+                elif op == HALT:
+                    return
+                else:
+                    raise VMError(f"Unknown opcode {op} in {code_object.name} at {pc - 2}")
+        except ZeroDivisionError:
+            raise VMError(f"Division by zero in {code_object.name} at {pc - 2}") from None
+
+def run_source(src_program_str, runtime=None, optimize=False):
+    # Compiles and runs a program, and returns the VM it ran on
+    vm = VM(runtime)
+    vm.run(compile_source(src_program_str, optimize=optimize))
+    return vm
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Compile a PArL program to bytecode and run it")
+    arg_parser.add_argument("path", help="source file")
+    arg_parser.add_argument("--disassemble", action="store_true", help="print the bytecode instead of running it")
+    arg_parser.add_argument("--optimize", action="store_true", help="fold constants and remove dead code first")
+    arg_parser.add_argument("--no-delay", action="store_true", help="make __delay advance a virtual clock, not sleep")
+    arg_parser.add_argument("--seed", type=int, default=None, help="seed of __random_int and __randi")
+    args = arg_parser.parse_args(argv)
+
+    with open(args.path) as src_file:
+        compiled = compile_source(src_file.read(), optimize=args.optimize)
+    if args.disassemble:
+        print(disassemble(compiled))
+        return 0
+    runtime = Runtime(seed=args.seed, clock=VirtualClock() if args.no_delay else None)
+    VM(runtime).run(compiled)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())